@@ -3,4 +3,10 @@
 set -o errexit
 set -o nounset
 
+# Metrics files of previous runs would be added to the new ones
+if [ -n "${PROMETHEUS_MULTIPROC_DIR:-}" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 exec celery -A leaf.config.celery.celery worker --loglevel=info
@@ -1,4 +1,10 @@
 #!/bin/sh
 alembic upgrade head
 
+# Metrics files of previous runs would be added to the new ones
+if [ -n "${PROMETHEUS_MULTIPROC_DIR:-}" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 exec uvicorn leaf.main:app --reload --host 0.0.0.0
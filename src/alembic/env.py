@@ -3,11 +3,9 @@ from __future__ import annotations
 from logging.config import fileConfig
 
 import geoalchemy2
-from sqlalchemy import engine_from_config, pool
 
 from alembic import context
-from leaf.config.config import get_settings
-from leaf.config.database import Base
+from leaf.config.database import Base, create_database_engine, get_database_url
 from leaf.models import comments, like, post, threat, threat_category, user
 
 # this is the Alembic Config object, which provides
@@ -32,18 +30,6 @@ target_metadata = Base.metadata
 # ... etc.
 
 
-def get_connection_string() -> str:
-    settings = get_settings()
-
-    return (
-        f"postgresql://{settings.DB_CONFIG['USER']}:{settings.DB_CONFIG['PASSWORD']}@"
-        f"{settings.DB_CONFIG['HOST']}:{settings.DB_CONFIG['PORT']}/{settings.DB_CONFIG['DATABASE']}"
-    )
-
-
-config.set_main_option("sqlalchemy.url", get_connection_string())
-
-
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -56,7 +42,7 @@ def run_migrations_offline() -> None:
     script output.
 
     """
-    url = config.get_main_option("sqlalchemy.url")
+    url = get_database_url().render_as_string(hide_password=False)
     context.configure(
         url=url,
         target_metadata=target_metadata,
@@ -75,11 +61,7 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
+    connectable = create_database_engine("migrations")
 
     with connectable.connect() as connection:
         context.configure(
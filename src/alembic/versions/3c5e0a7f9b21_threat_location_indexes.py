@@ -0,0 +1,48 @@
+"""Threat location indexes
+
+Revision ID: 3c5e0a7f9b21
+Revises: 692d9f38f03c
+Create Date: 2026-10-18 18:52:11.204316
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3c5e0a7f9b21"
+down_revision = "692d9f38f03c"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Databases created from models already have the geometry index,
+    # the ones created by migrations never had it
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_threats_location "
+        "ON threats USING gist (location)",
+    )
+    op.create_index(
+        "idx_threats_location_geography",
+        "threats",
+        [sa.text("geography(location)")],
+        unique=False,
+        postgresql_using="gist",
+    )
+    op.create_index(
+        op.f("ix_threats_category_id"),
+        "threats",
+        ["category_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_threats_category_id"), table_name="threats")
+    op.drop_index(
+        "idx_threats_location_geography",
+        table_name="threats",
+        postgresql_using="gist",
+    )
+    op.drop_index("idx_threats_location", table_name="threats", postgresql_using="gist")
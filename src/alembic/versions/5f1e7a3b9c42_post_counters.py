@@ -0,0 +1,51 @@
+"""Like and comment counters on posts, unique likes
+
+Revision ID: 5f1e7a3b9c42
+Revises: 9d4b2c81e6f0
+Create Date: 2026-10-18 20:24:05.381264
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5f1e7a3b9c42"
+down_revision = "9d4b2c81e6f0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Duplicated likes would break the constraint, the oldest one is kept
+    op.execute(
+        "DELETE FROM likes AS duplicate USING likes "
+        "WHERE duplicate.user_id = likes.user_id "
+        "AND duplicate.post_id = likes.post_id "
+        "AND duplicate.id > likes.id",
+    )
+    op.create_unique_constraint(
+        "likes_user_id_post_id_key",
+        "likes",
+        ["user_id", "post_id"],
+    )
+    op.add_column(
+        "posts",
+        sa.Column("like_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "posts",
+        sa.Column("comment_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.execute(
+        "UPDATE posts SET "
+        "like_count = (SELECT count(*) FROM likes WHERE likes.post_id = posts.id), "
+        "comment_count = "
+        "(SELECT count(*) FROM comments WHERE comments.post_id = posts.id)",
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("posts", "comment_count")
+    op.drop_column("posts", "like_count")
+    op.drop_constraint("likes_user_id_post_id_key", "likes", type_="unique")
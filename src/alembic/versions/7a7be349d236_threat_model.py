@@ -42,6 +42,7 @@ def upgrade() -> None:
 def downgrade() -> None:
     # ### commands auto generated by Alembic - please adjust! ###
     op.drop_index(op.f("ix_threats_id"), table_name="threats")
-    op.drop_index("idx_threats_location", table_name="threats", postgresql_using="gist")
+    # Created only in databases built from models before 3c5e0a7f9b21
+    op.execute("DROP INDEX IF EXISTS idx_threats_location")
     op.drop_table("threats")
     # ### end Alembic commands ###
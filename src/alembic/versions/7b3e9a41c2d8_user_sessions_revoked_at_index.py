@@ -0,0 +1,30 @@
+"""User sessions revoked at index
+
+Revision ID: 7b3e9a41c2d8
+Revises: 1d8c5f0b7a64
+Create Date: 2026-10-19 10:12:05.381920
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7b3e9a41c2d8"
+down_revision = "1d8c5f0b7a64"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_user_sessions_revoked_at",
+        "user_sessions",
+        ["revoked_at"],
+        unique=False,
+        postgresql_where=sa.text("revoked_at IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_sessions_revoked_at", table_name="user_sessions")
@@ -0,0 +1,51 @@
+"""Post feed indexes, created_at columns restored
+
+Revision ID: 9d4b2c81e6f0
+Revises: 3c5e0a7f9b21
+Create Date: 2026-10-18 19:41:37.518092
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9d4b2c81e6f0"
+down_revision = "3c5e0a7f9b21"
+branch_labels = None
+depends_on = None
+
+# TimestampedMixin went back to created_at after 692d9f38f03c renamed it
+TIMESTAMPED_TABLES = [
+    "comments",
+    "groups",
+    "groups_users",
+    "likes",
+    "posts",
+    "threat_categories",
+    "users",
+]
+
+
+def upgrade() -> None:
+    for table in TIMESTAMPED_TABLES:
+        op.alter_column(table, "date_from", new_column_name="created_at")
+    op.create_index(
+        "ix_posts_created_at_id",
+        "posts",
+        ["created_at", "id"],
+        unique=False,
+    )
+    op.create_index(op.f("ix_likes_post_id"), "likes", ["post_id"], unique=False)
+    op.create_index(
+        op.f("ix_comments_post_id"),
+        "comments",
+        ["post_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_comments_post_id"), table_name="comments")
+    op.drop_index(op.f("ix_likes_post_id"), table_name="likes")
+    op.drop_index("ix_posts_created_at_id", table_name="posts")
+    for table in TIMESTAMPED_TABLES:
+        op.alter_column(table, "created_at", new_column_name="date_from")
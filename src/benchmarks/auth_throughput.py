@@ -0,0 +1,124 @@
+"""Throughput of authorized requests with and without database access
+
+Needs a database with the tables created. A user with the `read_threats`
+permission is created for the run and deleted at the end, requests go to
+an endpoint which only runs `require(PermissionsType.read_threats)`.
+
+`profile_db` uses a token with only `sub` and the user cache disabled, so
+the profile is queried by every request. `profile_cache` is the same token
+with the user cache warmed up. `claims` uses a token with claims and
+`TOKEN_CLAIMS_ENABLED`, only the token version is checked in the cache.
+The number of database queries per request is printed for each of them.
+
+    python -m benchmarks.auth_throughput --requests 5000
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from datetime import timedelta
+from time import perf_counter
+from unittest.mock import patch
+
+import httpx
+from fastapi import Depends
+from sqlalchemy import delete, event
+
+from benchmarks.common import print_summary, summarize
+from leaf.auth import create_access_token, create_user_claims, require
+from leaf.config.config import get_settings
+from leaf.config.database import SessionLocal, async_engine
+from leaf.main import app
+from leaf.models import User
+from leaf.models.user import PermissionsType
+from leaf.repositories.users import create_one, get_user_by_email
+
+settings = get_settings()
+
+EMAIL = "auth-benchmark@leaf.com"
+
+
+async def authorized():
+    return {"authorized": True}
+
+
+def create_token(claims: dict) -> str:
+    return create_access_token(
+        claims,
+        secret_key=settings.SECRET_KEY,
+        algorithm=settings.ALGORITHM,
+        expires_delta=timedelta(hours=1),
+    )
+
+
+async def run(name: str, token: str, requests: int) -> None:
+    queries = 0
+
+    def count_query(*args):
+        nonlocal queries
+        queries += 1
+
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        # Warm up caches and the app
+        for _ in range(50):
+            await client.get("/benchmark/authorized", headers=headers)
+        event.listen(async_engine.sync_engine, "before_cursor_execute", count_query)
+        try:
+            latencies = []
+            start = perf_counter()
+            for _ in range(requests):
+                call_start = perf_counter()
+                response = await client.get("/benchmark/authorized", headers=headers)
+                latencies.append(perf_counter() - call_start)
+                assert response.status_code == 200, response.text
+            elapsed = perf_counter() - start
+        finally:
+            event.remove(
+                async_engine.sync_engine,
+                "before_cursor_execute",
+                count_query,
+            )
+    print_summary(summarize(name, latencies, elapsed))
+    print(f"{name}: {queries / requests:.2f} queries per request")
+
+
+async def main(args: argparse.Namespace):
+    app.add_api_route(
+        "/benchmark/authorized",
+        authorized,
+        dependencies=[Depends(require(PermissionsType.read_threats))],
+    )
+    with SessionLocal() as db:
+        db_user = create_one(
+            db,
+            email=EMAIL,
+            hashed_password="",
+            first_name="Leaf",
+            last_name="User",
+            disabled=False,
+            permissions=PermissionsType.read_threats.value,
+        )
+        user = get_user_by_email(db, EMAIL)
+        token_version = db_user.token_version
+    try:
+        with patch.object(settings, "USER_CACHE_ENABLED", False):
+            await run("profile_db", create_token({"sub": EMAIL}), args.requests)
+        await run("profile_cache", create_token({"sub": EMAIL}), args.requests)
+        with patch.object(settings, "TOKEN_CLAIMS_ENABLED", True):
+            await run(
+                "claims",
+                create_token(create_user_claims(user, token_version)),
+                args.requests,
+            )
+    finally:
+        with SessionLocal() as db:
+            db.execute(delete(User).where(User.email == EMAIL))
+            db.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    asyncio.run(main(parser.parse_args()))
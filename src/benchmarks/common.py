@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from statistics import mean, quantiles
+from typing import Sequence
+
+
+def summarize(name: str, latencies: Sequence[float], elapsed: float) -> dict:
+    """Builds a summary of a benchmark run
+
+    Args:
+        name (str): Label printed next to the results
+        latencies (Sequence[float]): Latency of every single call in seconds
+        elapsed (float): Wall time of the whole run in seconds
+
+    Returns: dict with throughput and latency percentiles in milliseconds
+    """
+    percentiles = quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "name": name,
+        "calls": len(latencies),
+        "per_second": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(mean(latencies) * 1000, 3),
+        "p50_ms": round(percentiles[49] * 1000, 3),
+        "p95_ms": round(percentiles[94] * 1000, 3),
+        "p99_ms": round(percentiles[98] * 1000, 3),
+    }
+
+
+def print_summary(summary: dict) -> None:
+    print(
+        "{name}: {calls} calls, {per_second}/s, mean={mean_ms}ms, "
+        "p50={p50_ms}ms, p95={p95_ms}ms, p99={p99_ms}ms".format(**summary),
+    )
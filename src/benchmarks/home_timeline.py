@@ -0,0 +1,197 @@
+"""Latency of the `/posts/home` feed with fan out on read and on write
+
+Needs a database with the tables created and Redis at `TIMELINE_REDIS_URL`.
+Synthetic users, groups and posts are inserted in a transaction which is
+rolled back at the end, timelines are written under a separate prefix and
+deleted afterwards.
+
+`fan_out_write` adds the `--fanout` newest posts to timelines of their
+recipients, like the `fan_out_post` task does. `read` pages are built with
+a query over group memberships, `timeline` pages are read from the Redis
+timelines. Both are measured on the first page and on the following ones,
+the last lines compare their latencies page by page.
+
+    python -m benchmarks.home_timeline --posts 200000 --fanout 10000
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from time import perf_counter
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy import text
+
+from benchmarks.common import print_summary, summarize
+from leaf.config.config import get_settings
+from leaf.config.database import AsyncSessionLocal
+from leaf.repositories.posts import (
+    decode_feed_cursor,
+    get_home_feed_async,
+    get_timeline_recipients,
+)
+from leaf.timeline import TimelineStore, timeline_score
+
+settings = get_settings()
+
+SEED_STATEMENTS = [
+    """
+    INSERT INTO users (email, hashed_password, first_name, last_name,
+                       disabled, permissions, created_at, updated_at)
+    SELECT 'home-benchmark-' || i || '@leaf.com', '', 'Leaf', 'User',
+           false, 0, now(), now()
+    FROM generate_series(1, :users) AS i
+    """,
+    """
+    INSERT INTO groups (name, permissions, created_at, updated_at)
+    SELECT 'home-benchmark-' || i, 0, now(), now()
+    FROM generate_series(1, :groups) AS i
+    """,
+    """
+    INSERT INTO threat_categories (name, created_at, updated_at)
+    VALUES ('home-benchmark', now(), now())
+    """,
+    """
+    INSERT INTO threats (location, category_id)
+    VALUES (ST_MakePoint(21, 52), (SELECT max(id) FROM threat_categories))
+    """,
+    # Ids inserted by a single statement are consecutive
+    """
+    CREATE TEMPORARY TABLE benchmark_ids ON COMMIT DROP AS
+    SELECT (SELECT min(id) FROM users WHERE email LIKE 'home-benchmark-%') AS user_id,
+           (SELECT min(id) FROM groups WHERE name LIKE 'home-benchmark-%') AS group_id,
+           (SELECT max(id) FROM threats) AS threat_id,
+           (SELECT coalesce(max(id), 0) + 1 FROM posts) AS post_id
+    """,
+    """
+    INSERT INTO groups_users (user_id, group_id, created_at, updated_at)
+    SELECT DISTINCT user_id + i, group_id + (i + j * 7919) % :groups, now(), now()
+    FROM benchmark_ids, generate_series(0, :users - 1) AS i,
+         generate_series(1, :memberships) AS j
+    """,
+    # Every post is one second older than the previous one
+    """
+    INSERT INTO posts (user_id, threat_id, content, image, is_visible,
+                       created_at, updated_at)
+    SELECT user_id + (i * 31) % :users, threat_id, 'Post ' || i,
+           'images/post.jpg', 'true', now() - make_interval(secs => i), now()
+    FROM benchmark_ids, generate_series(1, :posts) AS i
+    """,
+    "ANALYZE users, groups, groups_users, posts",
+]
+
+
+async def measure_pages(name, db, user_id, timeline, args) -> list[dict]:
+    """Reads `--pages` consecutive pages `--queries` times
+
+    Returns: summaries of the pages which were read
+    """
+    latencies = {page: [] for page in range(args.pages)}
+    start = perf_counter()
+    for _ in range(args.queries):
+        cursor = None
+        for page_number in range(args.pages):
+            call_start = perf_counter()
+            page = await get_home_feed_async(
+                db,
+                user_id,
+                cursor=cursor,
+                limit=args.limit,
+                timeline=timeline,
+                max_group_size=args.max_group_size,
+            )
+            latencies[page_number].append(perf_counter() - call_start)
+            if page.next_cursor is None:
+                break
+            cursor = decode_feed_cursor(page.next_cursor)
+    elapsed = perf_counter() - start
+    summaries = [
+        summarize(f"{name} page {page_number + 1}", page_latencies, elapsed)
+        for page_number, page_latencies in latencies.items()
+        if page_latencies
+    ]
+    for summary in summaries:
+        print_summary(summary)
+    return summaries
+
+
+def print_comparison(read: list[dict], timeline: list[dict]) -> None:
+    """Read latency of fan out on read and on write side by side"""
+    for page_number, (read_page, timeline_page) in enumerate(zip(read, timeline)):
+        print(
+            f"page {page_number + 1}: "
+            f"p50 {read_page['p50_ms']}ms -> {timeline_page['p50_ms']}ms, "
+            f"p95 {read_page['p95_ms']}ms -> {timeline_page['p95_ms']}ms",
+        )
+
+
+async def main(args: argparse.Namespace):
+    parameters = {
+        "users": args.users,
+        "groups": args.groups,
+        "memberships": args.memberships,
+        "posts": args.posts,
+    }
+    timeline = TimelineStore(
+        Redis.from_url(settings.TIMELINE_REDIS_URL),
+        max_length=settings.TIMELINE_MAX_LENGTH,
+        prefix="leaf:timeline-benchmark",
+        async_client=AsyncRedis.from_url(settings.TIMELINE_REDIS_URL),
+    )
+    async with AsyncSessionLocal() as db:
+        try:
+            seed_start = perf_counter()
+            for statement in SEED_STATEMENTS:
+                await db.execute(text(statement), parameters)
+            print(f"seeded {args.posts} posts in {perf_counter() - seed_start:.1f}s")
+            user_id, first_post_id = (
+                await db.execute(text("SELECT user_id, post_id FROM benchmark_ids"))
+            ).one()
+
+            latencies = []
+            recipients = 0
+            start = perf_counter()
+            for post_id in range(first_post_id, first_post_id + args.fanout):
+                call_start = perf_counter()
+                created_at, user_ids = await db.run_sync(
+                    get_timeline_recipients,
+                    post_id,
+                    args.max_group_size,
+                )
+                recipients += timeline.add(
+                    post_id,
+                    timeline_score(created_at),
+                    user_ids,
+                )
+                latencies.append(perf_counter() - call_start)
+            elapsed = perf_counter() - start
+            print_summary(summarize("fan_out_write", latencies, elapsed))
+            print(f"{recipients / elapsed:.0f} timeline writes/s")
+
+            read = await measure_pages("read", db, user_id, None, args)
+            timeline_read = await measure_pages("timeline", db, user_id, timeline, args)
+            print_comparison(read, timeline_read)
+        finally:
+            await db.rollback()
+            for key in timeline.client.scan_iter(f"{timeline.prefix}:*"):
+                timeline.client.delete(key)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--groups", type=int, default=1000)
+    parser.add_argument("--memberships", type=int, default=3, help="per user")
+    parser.add_argument("--fanout", type=int, default=10_000, help="newest posts")
+    parser.add_argument(
+        "--max-group-size",
+        type=int,
+        default=settings.TIMELINE_FANOUT_MAX_GROUP_SIZE,
+    )
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,69 @@
+"""Login latency under concurrent clients, without the database
+
+Every simulated client verifies a bcrypt hash, the way `/users/token` does.
+`inline` mode verifies on the event loop like the handlers used to,
+`pool` mode goes through `password_hashing_executor`. A heartbeat task
+measures how long the event loop was blocked meanwhile.
+
+    python -m benchmarks.login_p99 --clients 50
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from time import perf_counter
+
+from benchmarks.common import print_summary, summarize
+from leaf.auth import (
+    get_password_hash,
+    password_hashing_executor,
+    verify_password,
+    verify_password_async,
+)
+
+PASSWORD = "Elektryk1@"
+
+
+async def heartbeat(lags: list, stop: asyncio.Event, interval: float = 0.01):
+    while not stop.is_set():
+        start = perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(perf_counter() - start - interval)
+
+
+async def login(mode: str, hashed_password: str, latencies: list, start: float):
+    if mode == "inline":
+        assert verify_password(PASSWORD, hashed_password)
+    else:
+        assert await verify_password_async(PASSWORD, hashed_password)
+    latencies.append(perf_counter() - start)
+
+
+async def run(mode: str, clients: int, hashed_password: str):
+    latencies: list = []
+    lags: list = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(0)
+    # All clients arrive at once, so latency includes the time spent waiting
+    start = perf_counter()
+    await asyncio.gather(
+        *(login(mode, hashed_password, latencies, start) for _ in range(clients)),
+    )
+    elapsed = perf_counter() - start
+    stop.set()
+    await beat
+    print_summary(summarize(f"login [{mode}] x{clients}", latencies, elapsed))
+    print(f"  max event loop lag: {max(lags, default=0) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    args = parser.parse_args()
+    hashed_password = get_password_hash(PASSWORD)
+    for mode in ("inline", "pool"):
+        asyncio.run(run(mode, args.clients, hashed_password))
+    print(password_hashing_executor.stats())
+    password_hashing_executor.shutdown()
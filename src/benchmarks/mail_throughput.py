@@ -0,0 +1,170 @@
+"""Mails per second sent by a Celery worker process
+
+Runs a local SMTP server (aiosmtpd) which requires STARTTLS and login,
+like a real provider. `per_message` is the previous `send_mail` task
+which connected, upgraded to TLS and logged in for every mail,
+`dispatcher` reuses one connection for all of them. `--latency` adds
+a delay to EHLO, RCPT and DATA replies to emulate a remote provider.
+
+    python -m benchmarks.mail_throughput --mails 500 --latency 0.02
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import smtplib
+import socket
+import ssl
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult, LoginPassword
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from benchmarks.common import print_summary, summarize
+from leaf.mail import SMTPDispatcher
+
+USERNAME = "leaf"
+PASSWORD = "secret"
+MESSAGE = (
+    "Subject: Leaf account - email confirmation\r\n\r\n" + "<p>Hello</p>\r\n" * 200
+)
+
+
+class Handler:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.received = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.latency)
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        await asyncio.sleep(self.latency)
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.latency)
+        self.received += 1
+        return "250 Message accepted"
+
+
+def authenticate(server, session, envelope, mechanism, auth_data):
+    valid = isinstance(auth_data, LoginPassword) and (
+        auth_data.login.decode(),
+        auth_data.password.decode(),
+    ) == (USERNAME, PASSWORD)
+    return AuthResult(success=valid)
+
+
+def create_tls_context(directory: Path) -> ssl.SSLContext:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    (directory / "cert.pem").write_bytes(
+        certificate.public_bytes(serialization.Encoding.PEM),
+    )
+    (directory / "key.pem").write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ),
+    )
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(directory / "cert.pem", directory / "key.pem")
+    return context
+
+
+def send_per_message(config: dict, client_context: ssl.SSLContext, mails: list):
+    latencies = []
+    for to, msg in mails:
+        start = perf_counter()
+        with smtplib.SMTP(config["HOST"], config["PORT"]) as server:
+            server.starttls(context=client_context)
+            server.login(config["USERNAME"], config["PASSWORD"])
+            server.sendmail(config["EMAIL"], to, msg)
+        latencies.append(perf_counter() - start)
+    return latencies
+
+
+def send_with_dispatcher(config: dict, client_context: ssl.SSLContext, mails: list):
+    dispatcher = SMTPDispatcher(config, ssl_context=client_context)
+    latencies = []
+    for mail in mails:
+        start = perf_counter()
+        dispatcher.send([mail])
+        latencies.append(perf_counter() - start)
+    dispatcher.close()
+    assert dispatcher.stats()["connections_opened"] == 1
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mails", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server_context = create_tls_context(Path(directory))
+    client_context = ssl.create_default_context()
+    client_context.check_hostname = False
+    client_context.verify_mode = ssl.CERT_NONE
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    handler = Handler(args.latency)
+    controller = Controller(
+        handler,
+        hostname="127.0.0.1",
+        port=port,
+        tls_context=server_context,
+        require_starttls=True,
+        authenticator=authenticate,
+    )
+    controller.start()
+    config = {
+        "EMAIL": "leaf-team@leaf.com",
+        "USERNAME": USERNAME,
+        "PASSWORD": PASSWORD,
+        "HOST": "127.0.0.1",
+        "PORT": port,
+        "SECURITY": "starttls",
+    }
+    mails = [(f"user{i}@leaf.com", MESSAGE) for i in range(args.mails)]
+    try:
+        for name, send in (
+            ("per_message", send_per_message),
+            ("dispatcher", send_with_dispatcher),
+        ):
+            start = perf_counter()
+            latencies = send(config, client_context, mails)
+            print_summary(summarize(name, latencies, perf_counter() - start))
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
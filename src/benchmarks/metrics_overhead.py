@@ -0,0 +1,127 @@
+"""Overhead of recording metrics, per request and per database query
+
+Requests are sent straight to the ASGI apps, without a server, so the
+difference between `plain` and `metrics` is the cost of `MetricsMiddleware`.
+Queries run against in-memory SQLite within a request, `instrumented` has
+the events of `instrument_engine` which time the query and add it to the
+request's stats. Nothing else has to run. Most of the query overhead is
+SQLAlchemy's event dispatch, which is paid as soon as the engine has any
+listener, `DB_QUERY_METRICS_ENABLED=false` turns it off.
+
+Metrics are kept in memory unless `PROMETHEUS_MULTIPROC_DIR` is set, then
+they are written to files like in production with several workers:
+
+    python -m benchmarks.metrics_overhead --requests 20000
+    PROMETHEUS_MULTIPROC_DIR=$(mktemp -d) python -m benchmarks.metrics_overhead
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from time import perf_counter
+
+from fastapi import APIRouter, FastAPI
+from sqlalchemy import Engine, create_engine, text
+
+from benchmarks.common import print_summary, summarize
+from leaf.config.metrics import (
+    MetricsMiddleware,
+    QueryStats,
+    instrument_engine,
+    is_multiprocess,
+    request_queries,
+)
+from leaf.responses import SchemaRoute
+
+router = APIRouter(route_class=SchemaRoute)
+
+
+@router.get("/items/{item_id}")
+async def get_item(item_id: int):
+    return {"id": item_id}
+
+
+def create_app(metrics: bool) -> FastAPI:
+    app = FastAPI()
+    if metrics:
+        app.add_middleware(MetricsMiddleware)
+    app.include_router(router)
+    return app
+
+
+async def request(app: FastAPI, path: str) -> None:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"benchmark")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("benchmark", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def measure_requests(name: str, app: FastAPI, requests: int) -> float:
+    for i in range(100):
+        await request(app, f"/items/{i}")
+    latencies = []
+    start = perf_counter()
+    for i in range(requests):
+        call_start = perf_counter()
+        await request(app, f"/items/{i}")
+        latencies.append(perf_counter() - call_start)
+    elapsed = perf_counter() - start
+    print_summary(summarize(name, latencies, elapsed))
+    return elapsed / requests
+
+
+def measure_queries(name: str, engine: Engine, queries: int) -> float:
+    token = request_queries.set(QueryStats())
+    try:
+        with engine.connect() as connection:
+            statement = text("SELECT 1")
+            for _ in range(100):
+                connection.execute(statement)
+            start = perf_counter()
+            for _ in range(queries):
+                connection.execute(statement)
+            elapsed = perf_counter() - start
+    finally:
+        request_queries.reset(token)
+    per_query = elapsed / queries
+    print(f"{name}: {queries} queries, {per_query * 1_000_000:.2f}us per query")
+    return per_query
+
+
+async def main(args: argparse.Namespace):
+    print(f"multiprocess={is_multiprocess()}")
+    plain = await measure_requests("plain", create_app(False), args.requests)
+    metered = await measure_requests("metrics", create_app(True), args.requests)
+    print(f"request overhead: {(metered - plain) * 1_000_000:.2f}us")
+
+    instrumented_engine = create_engine("sqlite://")
+    instrument_engine(instrumented_engine, "benchmark")
+    plain = measure_queries("plain", create_engine("sqlite://"), args.queries)
+    metered = measure_queries("instrumented", instrumented_engine, args.queries)
+    print(f"query overhead: {(metered - plain) * 1_000_000:.2f}us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=50000)
+    asyncio.run(main(parser.parse_args()))
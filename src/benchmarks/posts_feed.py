@@ -0,0 +1,181 @@
+"""Latency of the `/posts` feed query
+
+Needs a database with the tables created (e.g. `docker-compose up` and
+`alembic upgrade head`). Synthetic users, threats, posts, likes and comments
+are inserted in a transaction which is rolled back at the end, so the
+database is left unchanged.
+
+`feed` is `get_feed_async`, a single query which reads like and comment
+counters stored on posts and uses a keyset cursor. `orm_lazy` is what a naive implementation does: it loads the
+page of `Post` objects with OFFSET and reads `post.likes`, `post.comments`,
+`post.user` and `post.threat` of every post, which lazily loads them one by
+one. Both are measured on the first page and at `--depth` posts deep.
+
+    python -m benchmarks.posts_feed --posts 1000000 --queries 50
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from time import perf_counter
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from benchmarks.common import print_summary, summarize
+from leaf.config.database import AsyncSessionLocal
+from leaf.models import Post
+from leaf.repositories.posts import get_feed_async
+
+SEED_STATEMENTS = [
+    """
+    INSERT INTO users (email, hashed_password, first_name, last_name,
+                       disabled, permissions, created_at, updated_at)
+    SELECT 'feed-benchmark-' || i || '@leaf.com', '', 'Leaf', 'User',
+           false, 0, now(), now()
+    FROM generate_series(1, :users) AS i
+    """,
+    """
+    INSERT INTO threat_categories (name, created_at, updated_at)
+    VALUES ('feed-benchmark', now(), now())
+    """,
+    """
+    INSERT INTO threats (location, category_id)
+    SELECT ST_MakePoint(14 + random() * 10, 49 + random() * 6),
+           (SELECT max(id) FROM threat_categories)
+    FROM generate_series(1, :threats) AS i
+    """,
+    # Ids inserted by a single statement are consecutive
+    """
+    CREATE TEMPORARY TABLE benchmark_ids ON COMMIT DROP AS
+    SELECT (SELECT min(id) FROM users WHERE email LIKE 'feed-benchmark-%') AS user_id,
+           (SELECT max(id) - :threats + 1 FROM threats) AS threat_id,
+           (SELECT coalesce(max(id), 0) + 1 FROM posts) AS post_id
+    """,
+    # Every post is one second older than the previous one
+    """
+    INSERT INTO posts (user_id, threat_id, content, image, is_visible,
+                       created_at, updated_at)
+    SELECT user_id + i % :users, threat_id + i % :threats, 'Post ' || i,
+           'images/post.jpg', 'true', now() - make_interval(secs => i), now()
+    FROM benchmark_ids, generate_series(1, :posts) AS i
+    """,
+    # Likes of a post come from different users
+    """
+    INSERT INTO likes (user_id, post_id, created_at, updated_at)
+    SELECT user_id + (posts.id * 7 + k) % :users, posts.id, now(), now()
+    FROM benchmark_ids, posts, generate_series(1, :likes) AS k
+    WHERE posts.id >= benchmark_ids.post_id
+    """,
+    """
+    INSERT INTO comments (user_id, post_id, content, created_at, updated_at)
+    SELECT user_id + (posts.id * 13 + k) % :users, posts.id, 'Comment', now(), now()
+    FROM benchmark_ids, posts, generate_series(1, :comments) AS k
+    WHERE posts.id >= benchmark_ids.post_id
+    """,
+    # Counters are maintained by ORM events, which bulk inserts skip
+    """
+    UPDATE posts SET like_count = :likes, comment_count = :comments
+    FROM benchmark_ids WHERE posts.id >= benchmark_ids.post_id
+    """,
+    "ANALYZE users, threats, posts, likes, comments",
+]
+
+
+def load_orm_page(db: Session, user_id: int, offset: int, limit: int) -> list:
+    posts = db.scalars(
+        select(Post)
+        .order_by(Post.created_at.desc(), Post.id.desc())
+        .offset(offset)
+        .limit(limit),
+    ).all()
+    return [
+        (
+            post.user,
+            post.threat,
+            len(post.likes),
+            len(post.comments),
+            any(like.user_id == user_id for like in post.likes),
+        )
+        for post in posts
+    ]
+
+
+async def measure(name, call, queries):
+    latencies = []
+    start = perf_counter()
+    for _ in range(queries):
+        call_start = perf_counter()
+        await call()
+        latencies.append(perf_counter() - call_start)
+    print_summary(summarize(name, latencies, perf_counter() - start))
+
+
+async def main(args: argparse.Namespace):
+    parameters = {
+        "users": args.users,
+        "threats": args.threats,
+        "posts": args.posts,
+        "likes": args.likes,
+        "comments": args.comments,
+    }
+    async with AsyncSessionLocal() as db:
+        try:
+            seed_start = perf_counter()
+            for statement in SEED_STATEMENTS:
+                await db.execute(text(statement), parameters)
+            print(f"seeded {args.posts} posts in {perf_counter() - seed_start:.1f}s")
+            user_id = (
+                await db.execute(text("SELECT user_id FROM benchmark_ids"))
+            ).scalar()
+            deep_post = (
+                await db.execute(
+                    select(Post.created_at, Post.id)
+                    .order_by(Post.created_at.desc(), Post.id.desc())
+                    .offset(args.depth - 1)
+                    .limit(1),
+                )
+            ).one()
+
+            async def feed_first_page():
+                await get_feed_async(db, user_id, limit=args.limit)
+
+            async def feed_deep_page():
+                await get_feed_async(
+                    db,
+                    user_id,
+                    cursor=tuple(deep_post),
+                    limit=args.limit,
+                )
+
+            async def orm_first_page():
+                await db.run_sync(load_orm_page, user_id, 0, args.limit)
+                db.expunge_all()
+
+            async def orm_deep_page():
+                await db.run_sync(load_orm_page, user_id, args.depth, args.limit)
+                db.expunge_all()
+
+            for name, call in (
+                ("feed first page", feed_first_page),
+                (f"feed depth={args.depth}", feed_deep_page),
+                ("orm_lazy first page", orm_first_page),
+                (f"orm_lazy depth={args.depth}", orm_deep_page),
+            ):
+                await measure(name, call, args.queries)
+        finally:
+            await db.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--threats", type=int, default=10_000)
+    parser.add_argument("--likes", type=int, default=3, help="per post")
+    parser.add_argument("--comments", type=int, default=1, help="per post")
+    parser.add_argument("--depth", type=int, default=100_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
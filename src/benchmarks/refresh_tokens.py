@@ -0,0 +1,125 @@
+"""Latency of a new access token with the password and with a refresh token
+
+Needs a database with the tables created. A user is created for the run and
+deleted at the end together with its sessions. `login` posts the password
+to `/users/token`, which verifies it with bcrypt, `refresh` exchanges the
+latest refresh token at `/users/token/refresh`.
+
+`revocation_check` is the cost added to every authorized request: a lookup
+of a live session in a revocation list holding `--revoked` sessions, with
+the exact set in the process.
+
+    python -m benchmarks.refresh_tokens --requests 200
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from time import perf_counter
+from uuid import uuid4
+
+import httpx
+from sqlalchemy import delete, select
+
+from benchmarks.common import print_summary, summarize
+from leaf.auth import get_password_hash
+from leaf.config.config import get_settings
+from leaf.config.database import SessionLocal
+from leaf.main import app
+from leaf.models import User, UserSession
+from leaf.repositories.users import create_one
+from leaf.sessions import RevocationList
+
+settings = get_settings()
+
+EMAIL = "refresh-benchmark@leaf.com"
+PASSWORD = "password"
+
+
+async def run_login(client: httpx.AsyncClient, requests: int) -> str:
+    latencies = []
+    start = perf_counter()
+    for _ in range(requests):
+        call_start = perf_counter()
+        response = await client.post(
+            "/users/token",
+            json={"username": EMAIL, "password": PASSWORD},
+        )
+        latencies.append(perf_counter() - call_start)
+        assert response.status_code == 200, response.text
+    elapsed = perf_counter() - start
+    print_summary(summarize("login", latencies, elapsed))
+    return response.json()["refresh_token"]
+
+
+async def run_refresh(
+    client: httpx.AsyncClient,
+    refresh_token: str,
+    requests: int,
+) -> None:
+    latencies = []
+    start = perf_counter()
+    for _ in range(requests):
+        call_start = perf_counter()
+        response = await client.post(
+            "/users/token/refresh",
+            json={"refresh_token": refresh_token},
+        )
+        latencies.append(perf_counter() - call_start)
+        assert response.status_code == 200, response.text
+        refresh_token = response.json()["refresh_token"]
+    elapsed = perf_counter() - start
+    print_summary(summarize("refresh", latencies, elapsed))
+
+
+async def run_revocation_check(revoked: int, checks: int) -> None:
+    revocations = RevocationList(
+        ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        capacity=settings.SESSION_REVOCATION_CAPACITY,
+        error_rate=settings.SESSION_REVOCATION_ERROR_RATE,
+    )
+    for _ in range(revoked):
+        await revocations.revoke(uuid4().hex)
+    session_ids = [uuid4().hex for _ in range(checks)]
+    start = perf_counter()
+    for session_id in session_ids:
+        await revocations.is_revoked(session_id)
+    elapsed = perf_counter() - start
+    # Microseconds, milliseconds of `summarize` round to 0
+    print(
+        f"revocation_check: {checks} checks, {checks / elapsed:,.0f}/s, "
+        f"mean={elapsed / checks * 1_000_000:.3f}us, "
+        f"false_positives={revocations.stats()['false_positives']}",
+    )
+
+
+async def main(args: argparse.Namespace):
+    with SessionLocal() as db:
+        create_one(
+            db,
+            email=EMAIL,
+            hashed_password=get_password_hash(PASSWORD),
+            first_name="Leaf",
+            last_name="User",
+            disabled=False,
+        )
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            refresh_token = await run_login(client, args.requests)
+            await run_refresh(client, refresh_token, args.requests)
+    finally:
+        with SessionLocal() as db:
+            user_id = select(User.id).where(User.email == EMAIL).scalar_subquery()
+            db.execute(delete(UserSession).where(UserSession.user_id == user_id))
+            db.execute(delete(User).where(User.email == EMAIL))
+            db.commit()
+    await run_revocation_check(args.revoked, args.checks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--revoked", type=int, default=10000)
+    parser.add_argument("--checks", type=int, default=100000)
+    asyncio.run(main(parser.parse_args()))
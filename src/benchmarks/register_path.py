@@ -0,0 +1,120 @@
+"""Latency of `/users/register` without password hashing and database
+
+Password hashing and `create_profile_async` are replaced with stubs and the
+mail outbox uses fakeredis, so only the work done by the request handler
+itself is measured. `inline_render` is the previous implementation which
+compiled the URL template, rendered the email body and built the MIME
+message in the handler, `queued_template` only queues the template name
+and parameters.
+
+    python -m benchmarks.register_path --requests 2000
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from itertools import count
+from time import perf_counter
+
+import fakeredis
+import httpx
+from jinja2 import Environment, FileSystemLoader
+
+from benchmarks.common import print_summary, summarize
+from leaf import tasks
+from leaf.config.config import get_settings
+from leaf.config.database import get_async_db
+from leaf.config.jinja_config import EMAIL_TEMPLATES_DIRECTORY
+from leaf.mail import MailOutbox, get_mail_outbox, set_mail_outbox
+from leaf.main import app
+from leaf.permissions import decode_permissions
+from leaf.routers import users
+from leaf.schemas.users import UserSchema
+
+settings = get_settings()
+legacy_env = Environment(loader=FileSystemLoader(EMAIL_TEMPLATES_DIRECTORY))
+user_ids = count(1)
+
+
+async def hash_password(password: str) -> str:
+    return "hashed"
+
+
+async def create_user(db, **user_props) -> UserSchema:
+    del user_props["hashed_password"]
+    return UserSchema(
+        id=next(user_ids),
+        permissions=decode_permissions(0),
+        groups=[],
+        **user_props,
+    )
+
+
+async def no_db():
+    yield None
+
+
+def queue_rendered_emails(emails):
+    """Previous implementation of the email part of `register`"""
+    for to, _, params in emails:
+        url_template = legacy_env.from_string(settings.CONFIRMATION_URL)
+        confirm_url = url_template.render(
+            confirmation_token=params["confirmation_token"],
+        )
+        template = legacy_env.get_template("confirmation_email.html")
+        msg_content = template.render(confirm_url=confirm_url)
+        message = MIMEMultipart("alternative")
+        message["Subject"] = "Leaf account - email confirmation"
+        message["From"] = settings.SMTP_CONFIG["EMAIL"]
+        message["To"] = to
+        message.attach(MIMEText(msg_content, "html"))
+        get_mail_outbox().push([(to, message.as_string())])
+        tasks.deliver_mail.delay()
+
+
+async def run(name: str, requests: int):
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        latencies = []
+        start = perf_counter()
+        for i in range(requests):
+            call_start = perf_counter()
+            response = await client.post(
+                "/users/register",
+                json={
+                    "email": f"user{i}@leaf.com",
+                    "password": "password",
+                    "first_name": "Leaf",
+                    "last_name": "User",
+                },
+            )
+            latencies.append(perf_counter() - call_start)
+            assert response.status_code == 201, response.text
+        elapsed = perf_counter() - start
+    print_summary(summarize(name, latencies, elapsed))
+
+
+async def main(args: argparse.Namespace):
+    users.get_password_hash_async = hash_password
+    users.create_profile_async = create_user
+    tasks.deliver_mail.delay = lambda: None
+    app.dependency_overrides[get_async_db] = no_db
+    set_mail_outbox(MailOutbox(fakeredis.FakeRedis()))
+
+    queue_emails = users.queue_emails
+    for name, queue in (
+        ("inline_render", queue_rendered_emails),
+        ("queued_template", queue_emails),
+    ):
+        users.queue_emails = queue
+        # Warm up template caches and the app
+        await run(f"{name} [warm up]", 50)
+        await run(name, args.requests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
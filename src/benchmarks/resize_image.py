@@ -0,0 +1,107 @@
+"""Time and peak memory of `resize_image` per upload
+
+Uses JPEG files from `--corpus` (e.g. photos taken with a phone) or
+generates synthetic 12 Mpx photos. Every upload is resized in a fresh
+process, so peak RSS is measured per upload. `per_size` is the previous
+implementation which decoded the upload once per size.
+
+    python -m benchmarks.resize_image --corpus ~/Pictures/phone
+
+"""
+from __future__ import annotations
+
+import argparse
+import resource
+import shutil
+import tempfile
+from multiprocessing import get_context
+from pathlib import Path
+from statistics import mean
+from time import perf_counter
+
+from PIL import Image
+
+from leaf.storage import LocalStorageBackend, set_storage_backend
+from leaf.tasks import resize_image
+
+IMAGE_SIZES = [["854", "480"], ["1280", "720"], ["1920", "1080"]]
+
+
+def resize_image_per_size(file_path: str, image_sizes):
+    path = Path(file_path)
+    for width, height in image_sizes:
+        image = Image.open(path, mode="r")
+        image.thumbnail((int(width), int(height)))
+        image.save(str(path.parent) + "/" + str(height) + "_" + str(path.name))
+    path.unlink()
+
+
+def resize_image_pipeline(file_path: str, image_sizes):
+    path = Path(file_path)
+    set_storage_backend(LocalStorageBackend(path.parent))
+    resize_image(path.name, image_sizes)
+
+
+IMPLEMENTATIONS = {
+    "per_size": resize_image_per_size,
+    "pipeline": resize_image_pipeline,
+}
+
+
+def generate_corpus(directory: Path, count: int) -> list[Path]:
+    photos = []
+    for i in range(count):
+        noise = Image.effect_noise((4032, 3024), 64 + i)
+        gradient = Image.linear_gradient("L").resize((4032, 3024))
+        photo = Image.merge("RGB", (noise, gradient, gradient.rotate(90)))
+        photo_path = directory / f"photo_{i}.jpg"
+        photo.save(photo_path, quality=92)
+        photos.append(photo_path)
+    return photos
+
+
+def resize_upload(implementation: str, photo: str, workdir: str) -> tuple:
+    upload = Path(workdir) / Path(photo).name
+    shutil.copy(photo, upload)
+    start = perf_counter()
+    IMPLEMENTATIONS[implementation](str(upload), IMAGE_SIZES)
+    elapsed = perf_counter() - start
+    output_size = sum(f.stat().st_size for f in Path(workdir).rglob("*.*"))
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return elapsed, peak_rss_mb, output_size
+
+
+def run(photos: list[Path]):
+    for implementation in IMPLEMENTATIONS:
+        results = []
+        for photo in photos:
+            with tempfile.TemporaryDirectory() as workdir:
+                with get_context("spawn").Pool(1) as pool:
+                    results.append(
+                        pool.apply(
+                            resize_upload,
+                            (implementation, str(photo), workdir),
+                        ),
+                    )
+        times, rss, sizes = zip(*results)
+        print(
+            f"{implementation}: {len(results)} uploads, "
+            f"mean={mean(times) * 1000:.1f}ms, max={max(times) * 1000:.1f}ms, "
+            f"peak_rss={max(rss):.1f}MB, output={mean(sizes) / 1024:.0f}KB",
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", type=Path)
+    parser.add_argument("--count", type=int, default=5)
+    args = parser.parse_args()
+    if args.corpus:
+        run(sorted(args.corpus.glob("*.jp*g"))[: args.count])
+    else:
+        with tempfile.TemporaryDirectory() as corpus:
+            # Generated in a child process, because children inherit
+            # peak RSS of this process
+            with get_context("spawn").Pool(1) as pool:
+                photos = pool.apply(generate_corpus, (Path(corpus), args.count))
+            run(photos)
@@ -0,0 +1,106 @@
+"""Time of rendering a response with a list of users, per user
+
+Lists of 10, 1k and 100k `UserSchema` with permissions and a group are
+rendered the way a route with `response_model=List[UserSchema]` does it.
+`default` is FastAPI's path: the schemas are converted to dicts, validated
+against the response model, encoded by `jsonable_encoder` and dumped with
+`json`. `orjson` is the same path with `leaf.responses.JSONResponse`,
+`schema_route` is the path of `SchemaRoute` which dumps the returned schemas
+with orjson right away. Smaller lists are rendered repeatedly, every size
+renders at least `--items` users.
+
+    python -m benchmarks.serialize_users --items 200000
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from time import perf_counter
+from typing import Callable, List
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from starlette.responses import JSONResponse as StarletteJSONResponse
+
+from leaf.permissions import decode_permissions
+from leaf.responses import JSONResponse
+from leaf.schemas.users import GroupProfileSchema, UserSchema
+
+SIZES = (10, 1_000, 100_000)
+
+response_field = create_response_field(
+    name="Response_get_users",
+    type_=List[UserSchema],
+)
+
+
+def create_users(count: int) -> List[UserSchema]:
+    return [
+        UserSchema(
+            id=i + 1,
+            email=f"user{i}@leaf.com",
+            first_name="Leaf",
+            last_name="User",
+            disabled=False,
+            profile_image=f"/media/images/{i:064x}.webp",
+            permissions=decode_permissions(i % 64),
+            groups=[GroupProfileSchema(id=i % 10 + 1, name=f"Group {i % 10}")],
+        )
+        for i in range(count)
+    ]
+
+
+async def render_default(users: List[UserSchema]) -> bytes:
+    content = await serialize_response(field=response_field, response_content=users)
+    return StarletteJSONResponse(content).body
+
+
+async def render_orjson(users: List[UserSchema]) -> bytes:
+    content = await serialize_response(field=response_field, response_content=users)
+    return JSONResponse(content).body
+
+
+async def render_schema_route(users: List[UserSchema]) -> bytes:
+    return JSONResponse(users).body
+
+
+async def measure(
+    name: str,
+    render: Callable,
+    users: List[UserSchema],
+    items: int,
+) -> None:
+    repeats = max(1, items // len(users))
+    # Warm up caches of pydantic and the encoders
+    await render(users[:10])
+    start = perf_counter()
+    for _ in range(repeats):
+        body = await render(users)
+    elapsed = perf_counter() - start
+    per_item = elapsed / (repeats * len(users)) * 1_000_000
+    print(
+        f"{name} [{len(users)} users]: {repeats} renders, "
+        f"{per_item:.3f}us per user, {len(body) / len(users):.0f} bytes per user",
+    )
+
+
+async def main(args: argparse.Namespace):
+    all_users = create_users(max(SIZES))
+    expected = await render_default(all_users[:100])
+    for render in (render_orjson, render_schema_route):
+        assert await render(all_users[:100]) == expected, render.__name__
+    for size in SIZES:
+        users = all_users[:size]
+        for name, render in (
+            ("default", render_default),
+            ("orjson", render_orjson),
+            ("schema_route", render_schema_route),
+        ):
+            await measure(name, render, users, args.items)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=200_000)
+    asyncio.run(main(parser.parse_args()))
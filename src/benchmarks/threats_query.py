@@ -0,0 +1,151 @@
+"""Latency of `/threats` radius, bounding box and vector tile queries
+
+Needs a database with PostGIS and the tables created (e.g. `docker-compose up`
+and `alembic upgrade head`). Synthetic threats spread over Poland are inserted
+in a transaction which is rolled back at the end, so the database is left
+unchanged. Every query is run with the spatial indexes and once more with
+index scans disabled, which is how the queries ran before the indexes existed.
+Tiles are built without the tile cache, at a zoom level with clusters
+(`--cluster-zoom`) and one with single threats (`--threats-zoom`).
+
+    python -m benchmarks.threats_query --threats 500000 --queries 200
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+from time import perf_counter
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from benchmarks.common import print_summary, summarize
+from leaf.config.database import AsyncSessionLocal
+from leaf.models import Threat, ThreatCategory
+from leaf.repositories.threats import (
+    get_threat_tile_async,
+    get_threats_in_bbox_async,
+    get_threats_in_radius_async,
+)
+from leaf.tiles import tile_containing
+
+MIN_LONGITUDE, MAX_LONGITUDE = 14.1, 24.1
+MIN_LATITUDE, MAX_LATITUDE = 49.0, 54.8
+CATEGORIES = 8
+
+
+async def create_threats(db: AsyncSession, count: int) -> list[int]:
+    categories = [ThreatCategory(name=f"benchmark{i}") for i in range(CATEGORIES)]
+    db.add_all(categories)
+    await db.flush()
+    category_ids = [category.id for category in categories]
+    series = func.generate_series(1, count).table_valued("value").alias("series")
+    await db.execute(
+        insert(Threat).from_select(
+            ["location", "category_id"],
+            select(
+                func.ST_MakePoint(
+                    MIN_LONGITUDE + func.random() * (MAX_LONGITUDE - MIN_LONGITUDE),
+                    MIN_LATITUDE + func.random() * (MAX_LATITUDE - MIN_LATITUDE),
+                ),
+                array(category_ids)[1 + series.c.value % CATEGORIES],
+            ),
+        ),
+    )
+    await db.execute(text("ANALYZE threats"))
+    return category_ids
+
+
+def random_point(rng: random.Random) -> tuple[float, float]:
+    return (
+        rng.uniform(MIN_LONGITUDE, MAX_LONGITUDE),
+        rng.uniform(MIN_LATITUDE, MAX_LATITUDE),
+    )
+
+
+async def run_radius(db, rng, args, category_ids):
+    longitude, latitude = random_point(rng)
+    return await get_threats_in_radius_async(
+        db,
+        longitude,
+        latitude,
+        args.radius,
+        category_ids=category_ids,
+        limit=args.limit,
+    )
+
+
+async def run_bbox(db, rng, args, category_ids):
+    longitude, latitude = random_point(rng)
+    return await get_threats_in_bbox_async(
+        db,
+        longitude,
+        latitude,
+        longitude + args.bbox_size,
+        latitude + args.bbox_size,
+        category_ids=category_ids,
+        limit=args.limit,
+    )
+
+
+async def run_cluster_tile(db, rng, args, category_ids):
+    z = args.cluster_zoom
+    x, y = tile_containing(*random_point(rng), z)
+    return await get_threat_tile_async(db, z, x, y, cluster_max_zoom=z)
+
+
+async def run_threats_tile(db, rng, args, category_ids):
+    z = args.threats_zoom
+    x, y = tile_containing(*random_point(rng), z)
+    return await get_threat_tile_async(db, z, x, y, cluster_max_zoom=z - 1)
+
+
+async def measure(db, name, query, args, category_ids):
+    rng = random.Random(args.seed)
+    latencies = []
+    start = perf_counter()
+    for _ in range(args.queries):
+        call_start = perf_counter()
+        await query(db, rng, args, category_ids)
+        latencies.append(perf_counter() - call_start)
+    print_summary(summarize(name, latencies, perf_counter() - start))
+
+
+async def main(args: argparse.Namespace):
+    async with AsyncSessionLocal() as db:
+        category_ids = await create_threats(db, args.threats)
+        filtered = category_ids[:2]
+        try:
+            for index_scans in ("on", "off"):
+                await db.execute(text(f"SET LOCAL enable_indexscan = {index_scans}"))
+                await db.execute(text(f"SET LOCAL enable_bitmapscan = {index_scans}"))
+                for name, query in (("radius", run_radius), ("bbox", run_bbox)):
+                    for categories in (None, filtered):
+                        label = f"{name} indexes={index_scans}"
+                        if categories:
+                            label += " categories=2"
+                        await measure(db, label, query, args, categories)
+                for name, query in (
+                    (f"tile z={args.cluster_zoom}", run_cluster_tile),
+                    (f"tile z={args.threats_zoom}", run_threats_tile),
+                ):
+                    label = f"{name} indexes={index_scans}"
+                    await measure(db, label, query, args, None)
+        finally:
+            await db.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threats", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radius", type=float, default=2000, help="meters")
+    parser.add_argument("--bbox-size", type=float, default=0.05, help="degrees")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--cluster-zoom", type=int, default=9)
+    parser.add_argument("--threats-zoom", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
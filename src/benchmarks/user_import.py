@@ -0,0 +1,123 @@
+"""Users created per second by the bulk import
+
+Needs a database with the tables created. `create_one` is the previous way
+of creating users, one INSERT and commit per user, `create_many` inserts
+batches of `--batch-size` users with a single statement. Passwords are
+hashed up front for both, so only the database work is compared. Created
+users have emails starting with `import-benchmark-` and are deleted at the
+end.
+
+`hash_sequential` and `hash_thread_pool` hash `--hashes` passwords in the
+calling thread and in a pool of `--workers` threads like `import_users`,
+with the rounds set by `PASSWORD_HASH_ROUNDS`. bcrypt releases the GIL, so
+the pool scales with the number of cores.
+
+    python -m benchmarks.user_import --users 10000 --hashes 200
+
+"""
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from sqlalchemy import delete
+
+from benchmarks.common import print_summary, summarize
+from leaf.auth import get_password_hash
+from leaf.config.database import SessionLocal
+from leaf.models import User
+from leaf.repositories.users import create_many, create_one
+
+EMAIL_PREFIX = "import-benchmark-"
+
+
+def user_props(name: str, i: int, hashed_password: str) -> dict:
+    return {
+        "email": f"{EMAIL_PREFIX}{name}-{i}@leaf.com",
+        "hashed_password": hashed_password,
+        "first_name": "Leaf",
+        "last_name": "Volunteer",
+        "disabled": True,
+    }
+
+
+def insert_one_by_one(db, users: int, hashed_password: str) -> list:
+    latencies = []
+    for i in range(users):
+        start = perf_counter()
+        create_one(db, **user_props("one", i, hashed_password))
+        latencies.append(perf_counter() - start)
+    return latencies
+
+
+def insert_in_batches(db, users: int, hashed_password: str, batch_size: int):
+    latencies = []
+    for first in range(0, users, batch_size):
+        batch = [
+            user_props("many", i, hashed_password)
+            for i in range(first, min(first + batch_size, users))
+        ]
+        start = perf_counter()
+        create_many(db, batch)
+        # Latency of a single user, to compare with `create_one`
+        latencies.extend([(perf_counter() - start) / len(batch)] * len(batch))
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--hashes", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    hashed_password = get_password_hash("Elektryk1@")
+    with SessionLocal() as db:
+        try:
+            for name, insert in (
+                ("create_one", insert_one_by_one),
+                (
+                    "create_many",
+                    lambda db, users, hashed: insert_in_batches(
+                        db,
+                        users,
+                        hashed,
+                        args.batch_size,
+                    ),
+                ),
+            ):
+                start = perf_counter()
+                latencies = insert(db, args.users, hashed_password)
+                print_summary(summarize(name, latencies, perf_counter() - start))
+        finally:
+            db.execute(delete(User).where(User.email.startswith(EMAIL_PREFIX)))
+            db.commit()
+
+    passwords = [f"password-{i}" for i in range(args.hashes)]
+    start = perf_counter()
+    latencies = []
+    for password in passwords:
+        call_start = perf_counter()
+        get_password_hash(password)
+        latencies.append(perf_counter() - call_start)
+    print_summary(summarize("hash_sequential", latencies, perf_counter() - start))
+
+    with ThreadPoolExecutor(args.workers) as executor:
+        # Starts the worker threads
+        list(executor.map(get_password_hash, passwords[: args.workers]))
+        start = perf_counter()
+        list(executor.map(get_password_hash, passwords))
+        elapsed = perf_counter() - start
+    print_summary(
+        summarize(
+            "hash_thread_pool",
+            [elapsed / len(passwords)] * len(passwords),
+            elapsed,
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
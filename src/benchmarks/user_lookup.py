@@ -0,0 +1,164 @@
+"""Time and memory of loading a user profile by email
+
+Needs a database with the tables created. `--users` users in `--groups`
+groups each are created for the run and deleted at the end. `orm_instance`
+is the previous implementation of `get_user_by_email_async`, which loaded
+a `User` with `joinedload(User.groups)` and built the schema from its
+`__dict__`, `projection` selects only the columns of the schema with the
+groups aggregated into one row.
+
+Time is measured per lookup, memory is the peak of memory allocated during
+a lookup as traced by `tracemalloc`, mostly by building the result.
+
+    python -m benchmarks.user_lookup --lookups 2000
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import tracemalloc
+from pathlib import Path
+from statistics import mean
+from time import perf_counter
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from benchmarks.common import print_summary, summarize
+from leaf.config.database import AsyncSessionLocal, SessionLocal
+from leaf.media import get_media_image_url
+from leaf.models import Group, GroupMembership, User
+from leaf.permissions import decode_permissions
+from leaf.repositories.users import get_user_by_email_async
+from leaf.schemas.users import GroupProfileSchema, UserSchema
+
+PREFIX = "lookup-benchmark"
+
+
+async def orm_instance_lookup(
+    db: AsyncSession,
+    email: str,
+    image_size: Optional[int] = None,
+) -> Optional[UserSchema]:
+    """Previous implementation of `get_user_by_email_async`"""
+    group_mask = (
+        select(func.bit_or(Group.permissions))
+        .join(GroupMembership, GroupMembership.group_id == Group.id)
+        .where(GroupMembership.user_id == User.id)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        select(User, User.permissions.bitwise_or(func.coalesce(group_mask, 0)))
+        .options(joinedload(User.groups))
+        .where(User.email == email),
+    )
+    row = result.unique().first()
+    if not row:
+        return None
+    user, permission_mask = row
+    groups = (
+        [GroupProfileSchema(id=group.id, name=group.name) for group in user.groups]
+        if user.groups
+        else []
+    )
+    permissions = decode_permissions(permission_mask)
+    user_image = None
+    if profile_image := user.profile_image:
+        user_image = get_media_image_url(Path(profile_image), image_size)
+    user_data = user.__dict__
+    del user_data["permissions"]
+    del user_data["groups"]
+    del user_data["hashed_password"]
+    user_data.pop("profile_image", None)
+    return UserSchema(
+        **user_data,
+        profile_image=user_image,
+        permissions=permissions,
+        groups=groups,
+    )
+
+
+def seed(users: int, groups: int) -> list[str]:
+    with SessionLocal() as db:
+        db_groups = [
+            Group(name=f"{PREFIX}-{i}", permissions=1 << (i % 6)) for i in range(groups)
+        ]
+        db_users = [
+            User(
+                email=f"{PREFIX}-{i}@leaf.com",
+                hashed_password="",
+                first_name="Leaf",
+                last_name="User",
+                disabled=False,
+                profile_image=f"images/{i:064x}.webp",
+                groups=db_groups,
+            )
+            for i in range(users)
+        ]
+        db.add_all(db_users)
+        db.commit()
+        return [user.email for user in db_users]
+
+
+def cleanup() -> None:
+    with SessionLocal() as db:
+        users = select(User.id).where(User.email.startswith(PREFIX))
+        db.execute(delete(GroupMembership).where(GroupMembership.user_id.in_(users)))
+        db.execute(delete(User).where(User.email.startswith(PREFIX)))
+        db.execute(delete(Group).where(Group.name.startswith(PREFIX)))
+        db.commit()
+
+
+async def run(name: str, lookup, emails: list[str], lookups: int) -> None:
+    async with AsyncSessionLocal() as db:
+        # Warm up the connection and caches of statements
+        for email in emails[:50]:
+            await lookup(db, email)
+            db.expunge_all()
+
+        latencies = []
+        start = perf_counter()
+        for i in range(lookups):
+            call_start = perf_counter()
+            user = await lookup(db, emails[i % len(emails)])
+            latencies.append(perf_counter() - call_start)
+            # Every lookup loads the user again, like a request does
+            db.expunge_all()
+        elapsed = perf_counter() - start
+        assert user is not None
+        print_summary(summarize(name, latencies, elapsed))
+
+        peaks = []
+        tracemalloc.start()
+        for i in range(min(lookups, 500)):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            await lookup(db, emails[i % len(emails)])
+            _, peak = tracemalloc.get_traced_memory()
+            db.expunge_all()
+            peaks.append(peak - before)
+        tracemalloc.stop()
+        print(f"{name}: peak={mean(peaks) / 1024:.1f}KiB allocated per lookup")
+
+
+async def main(args: argparse.Namespace):
+    emails = seed(args.users, args.groups)
+    try:
+        for name, lookup in (
+            ("orm_instance", orm_instance_lookup),
+            ("projection", get_user_by_email_async),
+        ):
+            await run(name, lookup, emails, args.lookups)
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--groups", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,56 @@
+"""Latency of resolving the current user from a JWT, with and without `user_cache`
+
+Needs a configured database with an existing user:
+
+    python -m benchmarks.users_me_cache --email user@example.it
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from datetime import timedelta
+from time import perf_counter
+
+from benchmarks.common import print_summary, summarize
+from leaf.auth import create_access_token, get_current_user
+from leaf.cache import get_user_cache
+from leaf.config.config import get_settings
+from leaf.config.database import AsyncSessionLocal
+
+settings = get_settings()
+
+
+async def run(email: str, calls: int, cache_enabled: bool):
+    settings.USER_CACHE_ENABLED = cache_enabled
+    get_user_cache().clear()
+    token = create_access_token(
+        data={"sub": email},
+        secret_key=settings.SECRET_KEY,
+        algorithm=settings.ALGORITHM,
+        expires_delta=timedelta(minutes=5),
+    )
+    image_size = list(settings.IMAGE_SIZES.values())[0][1]
+    latencies = []
+    async with AsyncSessionLocal() as db:
+        start = perf_counter()
+        for _ in range(calls):
+            call_start = perf_counter()
+            await get_current_user(token, db, settings, image_size)
+            latencies.append(perf_counter() - call_start)
+        elapsed = perf_counter() - start
+    label = "on" if cache_enabled else "off"
+    print_summary(summarize(f"get_current_user [cache {label}]", latencies, elapsed))
+
+
+async def main(args: argparse.Namespace):
+    await run(args.email, args.calls, cache_enabled=False)
+    await run(args.email, args.calls, cache_enabled=True)
+    print(get_user_cache().stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--calls", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
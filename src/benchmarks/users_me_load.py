@@ -0,0 +1,68 @@
+"""Load test for the `/users/me` endpoint
+
+Run it against a running API (e.g. `docker-compose up`) once on the commit
+before a change and once after it, then compare requests per second:
+
+    python -m benchmarks.users_me_load --email user@example.it --password secret
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from time import perf_counter
+
+import httpx
+
+from benchmarks.common import print_summary, summarize
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    r = await client.post(
+        "/users/token",
+        json={"username": email, "password": password},
+    )
+    r.raise_for_status()
+    return r.json()["access_token"]
+
+
+async def worker(
+    client: httpx.AsyncClient,
+    token: str,
+    requests: int,
+    latencies: list,
+):
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(requests):
+        start = perf_counter()
+        r = await client.get("/users/me", headers=headers)
+        latencies.append(perf_counter() - start)
+        r.raise_for_status()
+
+
+async def run(args: argparse.Namespace):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits) as client:
+        token = await login(client, args.email, args.password)
+        latencies: list = []
+        start = perf_counter()
+        await asyncio.gather(
+            *(
+                worker(client, token, args.requests, latencies)
+                for _ in range(args.concurrency)
+            ),
+        )
+        elapsed = perf_counter() - start
+    print_summary(
+        summarize(f"GET /users/me x{args.concurrency}", latencies, elapsed),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
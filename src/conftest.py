@@ -6,9 +6,13 @@ from sqlalchemy import DDL, text
 from sqlalchemy.orm import Session
 from sqlalchemy_utils import create_database, database_exists, drop_database
 
-from leaf.config.database import Base, get_db
+from leaf.config.database import Base, get_async_db
 from leaf.main import app
-from tests.database_test import SQLALCHEMY_TESTING_DATABASE_URL, engine
+from tests.database_test import (
+    SQLALCHEMY_TESTING_DATABASE_URL,
+    TestingAsyncSessionLocal,
+    engine,
+)
 from tests.factories.common import FactoriesSession
 
 
@@ -39,9 +43,25 @@ def db(db_engine):
     connection.close()
 
 
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+async def get_testing_async_db():
+    async with TestingAsyncSessionLocal() as async_db:
+        yield async_db
+
+
+@pytest.fixture(scope="function")
+async def async_db():
+    async with TestingAsyncSessionLocal() as async_db:
+        yield async_db
+
+
 @pytest.fixture(scope="function")
 def client(db):
-    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_async_db] = get_testing_async_db
 
     with TestClient(app) as c:
         yield c
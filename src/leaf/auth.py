@@ -2,26 +2,53 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta
 from os import environ
-from typing import Annotated
+from typing import Annotated, Callable
 
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from itsdangerous import URLSafeTimedSerializer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from starlette import status
 
+from leaf.cache import (
+    cache_token_version_async,
+    cache_user_async,
+    get_cached_token_version_async,
+    get_cached_user_async,
+)
 from leaf.config import config
 from leaf.config.config import get_settings
-from leaf.config.database import get_db
+from leaf.config.database import get_async_db
+from leaf.config.executors import BoundedExecutor
 from leaf.media import get_image_size
 from leaf.models import User
-from leaf.repositories.users import get_user_by_email
-from leaf.schemas.users import TokenDataSchema
+from leaf.models.user import PermissionsType
+from leaf.permissions import decode_permissions, permission_mask
+from leaf.repositories.users import (
+    get_token_version_async,
+    get_user_by_email_async,
+)
+from leaf.schemas.users import PrincipalSchema, TokenDataSchema, UserSchema
+from leaf.sessions import get_revocation_list
+
+settings = get_settings()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.PASSWORD_HASH_ROUNDS,
+)
+password_hashing_executor = BoundedExecutor(
+    "password_hashing",
+    workers=settings.PASSWORD_HASH_WORKERS,
+    kind=settings.PASSWORD_HASH_EXECUTOR,
+    max_queue_depth=settings.PASSWORD_HASH_MAX_QUEUE_DEPTH,
+)
 
 
 def verify_password(plain_password, hashed_password):
@@ -32,6 +59,18 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password, hashed_password):
+    return await password_hashing_executor.run(
+        verify_password,
+        plain_password,
+        hashed_password,
+    )
+
+
+async def get_password_hash_async(password):
+    return await password_hashing_executor.run(get_password_hash, password)
+
+
 def authenticate_user(db: Session, username: str, password: str):
     user = db.query(User).filter(User.disabled == False, User.email == username).first()
     if not user:
@@ -41,6 +80,18 @@ def authenticate_user(db: Session, username: str, password: str):
     return user
 
 
+async def authenticate_user_async(db: AsyncSession, username: str, password: str):
+    result = await db.execute(
+        select(User).where(User.disabled == False, User.email == username),
+    )
+    user = result.scalars().first()
+    if not user:
+        return False
+    if not await verify_password_async(password, user.hashed_password):
+        return False
+    return user
+
+
 def create_access_token(
     data: dict,
     secret_key: str,
@@ -90,37 +141,151 @@ def confirm_token(
     return email
 
 
-async def get_current_user(
-    token: Annotated[str, Depends(oauth2_scheme)],
-    db: Annotated[Session, Depends(get_db)],
-    settings: Annotated[config.Settings, Depends(get_settings)],
-    image_size: Annotated[int, Depends(get_image_size)],
-) -> User:
-    credentials_exception = HTTPException(
+def create_user_claims(user: UserSchema, token_version: int) -> dict:
+    """Claims of an access token which let `get_current_principal` authorize
+    the user without the database"""
+    return {
+        "sub": user.email,
+        "uid": user.id,
+        "perm": user.permissions.mask,
+        "grp": [group.id for group in user.groups],
+        "ver": token_version,
+    }
+
+
+def principal_from_user(user: UserSchema) -> PrincipalSchema:
+    return PrincipalSchema(
+        id=user.id,
+        email=user.email,
+        permissions=user.permissions,
+        group_ids=[group.id for group in user.groups],
+    )
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+async def is_token_version_current(
+    db: AsyncSession,
+    user_id: int,
+    version: int,
+) -> bool:
+    """Tokens with claims are revoked by incrementing the user's token version"""
+    current = await get_cached_token_version_async(user_id)
+    if current is None:
+        current = await get_token_version_async(db, user_id)
+        if current is None:
+            return False
+        await cache_token_version_async(user_id, current)
+    return version == current
+
+
+async def decode_access_token(
+    token: str,
+    db: AsyncSession,
+    settings: config.Settings,
+) -> dict:
     try:
-        username = verify_token(
+        payload = jwt.decode(
             token,
-            secret_key=settings.SECRET_KEY,
-            algorithm=settings.ALGORITHM,
+            settings.SECRET_KEY,
+            algorithms=[settings.ALGORITHM],
         )
-        if username is None:
-            raise credentials_exception
-        token_data = TokenDataSchema(username=username)
     except JWTError:
-        raise credentials_exception
-    user = get_user_by_email(db, token_data.username, image_size)
+        raise _credentials_exception()
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+    # Checked even when claims are disabled, so revoked tokens stay revoked
+    if "ver" in payload and not await is_token_version_current(
+        db,
+        payload["uid"],
+        payload["ver"],
+    ):
+        raise _credentials_exception()
+    if "sid" in payload and await get_revocation_list().is_revoked(payload["sid"]):
+        raise _credentials_exception()
+    return payload
+
+
+async def _get_user(
+    db: AsyncSession,
+    email: str,
+    image_size: int | None,
+) -> UserSchema:
+    user = await get_cached_user_async(email, image_size)
     if user is None:
-        raise credentials_exception
+        user = await get_user_by_email_async(db, email, image_size)
+        if user is None:
+            raise _credentials_exception()
+        await cache_user_async(user, image_size)
     return user
 
 
+async def get_current_user(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: Annotated[AsyncSession, Depends(get_async_db)],
+    settings: Annotated[config.Settings, Depends(get_settings)],
+    image_size: Annotated[int, Depends(get_image_size)],
+) -> User:
+    payload = await decode_access_token(token, db, settings)
+    token_data = TokenDataSchema(username=payload["sub"])
+    return await _get_user(db, token_data.username, image_size)
+
+
 async def get_current_active_user(
     current_user: Annotated[User, Depends(get_current_user)],
 ) -> User:
     if current_user.disabled:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+
+async def get_current_principal(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: Annotated[AsyncSession, Depends(get_async_db)],
+    settings: Annotated[config.Settings, Depends(get_settings)],
+) -> PrincipalSchema:
+    """Caller of the request, for endpoints which only authorize it
+
+    With `TOKEN_CLAIMS_ENABLED` it is read from the token claims and only
+    the token version is checked, usually in the cache. Tokens without
+    claims load the user profile like `get_current_active_user`.
+    """
+    payload = await decode_access_token(token, db, settings)
+    if settings.TOKEN_CLAIMS_ENABLED and "ver" in payload:
+        return PrincipalSchema(
+            id=payload["uid"],
+            email=payload["sub"],
+            permissions=decode_permissions(payload["perm"]),
+            group_ids=payload["grp"],
+        )
+    user = await _get_user(db, payload["sub"], None)
+    if user.disabled:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return principal_from_user(user)
+
+
+def require(*permissions: PermissionsType) -> Callable:
+    """Dependency which allows only users with all of the permissions
+
+    Permissions of the user's groups count as well, e.g.
+    `Depends(require(PermissionsType.read_threats))`.
+    """
+    required = permission_mask(*permissions)
+
+    async def check_permissions(
+        principal: Annotated[PrincipalSchema, Depends(get_current_principal)],
+    ) -> PrincipalSchema:
+        if principal.permissions.mask & required != required:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions",
+            )
+        return principal
+
+    return check_permissions
@@ -0,0 +1,35 @@
+from leaf.cache.backends import (
+    CacheBackend,
+    InMemoryCacheBackend,
+    RedisCacheBackend,
+)
+from leaf.cache.invalidation import invalidate_on_commit
+from leaf.cache.tiles import (
+    cache_tile,
+    cache_tile_async,
+    get_cached_tile,
+    get_cached_tile_async,
+    get_tile_cache,
+    invalidate_threat_tiles,
+    set_tile_cache_backend,
+)
+from leaf.cache.tokens import (
+    cache_token_version,
+    cache_token_version_async,
+    get_cached_token_version,
+    get_cached_token_version_async,
+    get_token_version_cache,
+    invalidate_token_version,
+    invalidate_token_version_async,
+    set_token_version_cache_backend,
+)
+from leaf.cache.users import (
+    cache_user,
+    cache_user_async,
+    get_cached_user,
+    get_cached_user_async,
+    get_user_cache,
+    invalidate_user,
+    invalidate_user_async,
+    set_user_cache_backend,
+)
@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import abc
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Optional
+
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+from starlette.concurrency import run_in_threadpool
+
+from leaf.config.logger import logger
+
+
+class CacheBackend(abc.ABC):
+    """Key-value store used by the caches in `leaf.cache`"""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        pass
+
+    @abc.abstractmethod
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        pass
+
+    async def get_async(self, key: str) -> Optional[Any]:
+        """`get` for the event loop, backends doing I/O don't block it"""
+        return self.get(key)
+
+    async def set_async(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+    async def delete_async(self, key: str) -> None:
+        self.delete(key)
+
+    def start(self) -> None:
+        """Starts background work of the backend, called on app startup"""
+
+    def stop(self) -> None:
+        """Stops background work of the backend, called on app shutdown"""
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """Thread safe LRU cache which additionally expires entries after `ttl` seconds
+
+    Entries live in the memory of a single process.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        timer: Callable[[], float] = monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self.timer():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (self.timer() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class RedisCacheBackend(CacheBackend):
+    """Cache shared by all API and Celery processes
+
+    Values are kept in Redis under `{namespace}:{key}` and additionally in
+    a small in-memory cache of every process. Deletes are published on
+    the `{namespace}:invalidate` channel, so the other processes drop their
+    local copies as well. When Redis is unavailable reads are treated as
+    misses, so callers fall back to the database.
+
+    The `_async` methods use `async_client`, without it the blocking calls
+    run in the thread pool.
+    """
+
+    CLEAR_ALL = "*"
+
+    def __init__(
+        self,
+        client: Redis,
+        namespace: str,
+        ttl: int,
+        dumps: Callable[[Any], bytes],
+        loads: Callable[[bytes], Any],
+        local: Optional[InMemoryCacheBackend] = None,
+        async_client: Optional[AsyncRedis] = None,
+    ):
+        self.client = client
+        self.async_client = async_client
+        self.namespace = namespace
+        self.channel = f"{namespace}:invalidate"
+        self.ttl = ttl
+        self.dumps = dumps
+        self.loads = loads
+        self.local = local
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._listener = None
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str) -> Optional[Any]:
+        if self.local is not None:
+            value = self.local.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+        try:
+            raw = self.client.get(self._key(key))
+        except RedisError:
+            self.errors += 1
+            logger.warning(f"Cache read failed for key {self._key(key)}")
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        value = self.loads(raw)
+        if self.local is not None:
+            self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.local is not None:
+            self.local.set(key, value)
+        try:
+            self.client.set(self._key(key), self.dumps(value), ex=self.ttl)
+        except RedisError:
+            self.errors += 1
+            logger.warning(f"Cache write failed for key {self._key(key)}")
+
+    def delete(self, key: str) -> None:
+        if self.local is not None:
+            self.local.delete(key)
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            pipeline.delete(self._key(key))
+            pipeline.publish(self.channel, key)
+            pipeline.execute()
+        except RedisError:
+            self.errors += 1
+            logger.error(f"Cache invalidation failed for key {self._key(key)}")
+
+    async def get_async(self, key: str) -> Optional[Any]:
+        if self.async_client is None:
+            return await run_in_threadpool(self.get, key)
+        if self.local is not None:
+            value = self.local.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+        try:
+            raw = await self.async_client.get(self._key(key))
+        except RedisError:
+            self.errors += 1
+            logger.warning(f"Cache read failed for key {self._key(key)}")
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        value = self.loads(raw)
+        if self.local is not None:
+            self.local.set(key, value)
+        return value
+
+    async def set_async(self, key: str, value: Any) -> None:
+        if self.async_client is None:
+            await run_in_threadpool(self.set, key, value)
+            return
+        if self.local is not None:
+            self.local.set(key, value)
+        try:
+            await self.async_client.set(self._key(key), self.dumps(value), ex=self.ttl)
+        except RedisError:
+            self.errors += 1
+            logger.warning(f"Cache write failed for key {self._key(key)}")
+
+    async def delete_async(self, key: str) -> None:
+        if self.async_client is None:
+            await run_in_threadpool(self.delete, key)
+            return
+        if self.local is not None:
+            self.local.delete(key)
+        try:
+            pipeline = self.async_client.pipeline(transaction=False)
+            pipeline.delete(self._key(key))
+            pipeline.publish(self.channel, key)
+            await pipeline.execute()
+        except RedisError:
+            self.errors += 1
+            logger.error(f"Cache invalidation failed for key {self._key(key)}")
+
+    def clear(self) -> None:
+        if self.local is not None:
+            self.local.clear()
+        try:
+            keys = list(self.client.scan_iter(match=self._key("*"), count=1000))
+            if keys:
+                self.client.unlink(*keys)
+            self.client.publish(self.channel, self.CLEAR_ALL)
+        except RedisError:
+            self.errors += 1
+            logger.error(f"Cache clear failed for namespace {self.namespace}")
+
+    def _on_invalidate(self, message: dict) -> None:
+        if self.local is None:
+            return
+        key = message["data"]
+        if isinstance(key, bytes):
+            key = key.decode()
+        if key == self.CLEAR_ALL:
+            self.local.clear()
+        else:
+            self.local.delete(key)
+
+    def start(self) -> None:
+        if self.local is None or self._listener is not None:
+            return
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: self._on_invalidate})
+        self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "local": self.local.stats() if self.local is not None else None,
+        }
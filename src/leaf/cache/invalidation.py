@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, SessionTransaction
+
+# Invalidations waiting for the commit, kept in `Session.info`
+PENDING_KEY = "leaf_cache_invalidations"
+
+
+def invalidate_on_commit(
+    session: Optional[Session],
+    invalidate: Callable[..., None],
+    *args,
+) -> None:
+    """Calls `invalidate(*args)` after the session's transaction commits
+
+    Mapper events fire at flush, while the transaction is still open, so
+    a request reading in between would cache the old rows again. Pending
+    invalidations are collected once per arguments and dropped when the
+    transaction rolls back. Without a session there's nothing to wait for,
+    `invalidate` is called right away.
+    """
+    if session is None:
+        invalidate(*args)
+        return
+    session.info.setdefault(PENDING_KEY, {})[(invalidate, *args)] = None
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session):
+    for invalidate, *args in session.info.pop(PENDING_KEY, {}):
+        invalidate(*args)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_rolled_back(session: Session, previous_transaction: SessionTransaction):
+    # Changes of the outer transaction are still committed after a rollback
+    # of a savepoint
+    if previous_transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import re
+import struct
+from typing import Iterable, Optional, Set, Tuple
+
+from geoalchemy2.elements import WKBElement
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+from leaf.cache.backends import (
+    CacheBackend,
+    InMemoryCacheBackend,
+    RedisCacheBackend,
+)
+from leaf.cache.invalidation import invalidate_on_commit
+from leaf.config.config import get_settings
+from leaf.models import Threat
+from leaf.tiles import tiles_containing
+
+settings = get_settings()
+
+POINT_PATTERN = re.compile(r"POINT\s*\(\s*(\S+)\s+([^\s)]+)", re.IGNORECASE)
+# Set in the geometry type of EWKB when SRID follows it
+EWKB_SRID_FLAG = 0x20000000
+
+
+def create_tile_cache_backend() -> CacheBackend:
+    local = InMemoryCacheBackend(
+        max_size=settings.TILE_CACHE_MAX_SIZE,
+        ttl=settings.TILE_CACHE_TTL,
+    )
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCacheBackend(
+            Redis.from_url(settings.CACHE_REDIS_URL),
+            namespace="leaf:tiles",
+            ttl=settings.TILE_CACHE_TTL,
+            dumps=bytes,
+            loads=bytes,
+            local=local,
+            async_client=AsyncRedis.from_url(settings.CACHE_REDIS_URL),
+        )
+    return local
+
+
+tile_cache: CacheBackend = create_tile_cache_backend()
+
+
+def get_tile_cache() -> CacheBackend:
+    return tile_cache
+
+
+def set_tile_cache_backend(backend: CacheBackend) -> None:
+    """Replaces the backend of the tile cache, e.g. with fakeredis in tests"""
+    global tile_cache
+    tile_cache.stop()
+    tile_cache = backend
+
+
+def _tile_key(z: int, x: int, y: int) -> str:
+    return f"{z}/{x}/{y}"
+
+
+def _is_cached_zoom(z: int) -> bool:
+    return settings.TILE_CACHE_ENABLED and z <= settings.TILE_CACHE_MAX_ZOOM
+
+
+def get_cached_tile(z: int, x: int, y: int) -> Optional[bytes]:
+    if not _is_cached_zoom(z):
+        return None
+    return tile_cache.get(_tile_key(z, x, y))
+
+
+def cache_tile(z: int, x: int, y: int, tile: bytes) -> None:
+    if _is_cached_zoom(z):
+        tile_cache.set(_tile_key(z, x, y), tile)
+
+
+async def get_cached_tile_async(z: int, x: int, y: int) -> Optional[bytes]:
+    if not _is_cached_zoom(z):
+        return None
+    return await tile_cache.get_async(_tile_key(z, x, y))
+
+
+async def cache_tile_async(z: int, x: int, y: int, tile: bytes) -> None:
+    if _is_cached_zoom(z):
+        await tile_cache.set_async(_tile_key(z, x, y), tile)
+
+
+def _threat_tile_keys(points: Iterable[Tuple[float, float]]) -> Set[str]:
+    return {
+        _tile_key(*tile)
+        for longitude, latitude in points
+        for tile in tiles_containing(
+            longitude,
+            latitude,
+            settings.TILE_CACHE_MAX_ZOOM,
+        )
+    }
+
+
+def _invalidate_tile(key: str) -> None:
+    tile_cache.delete(key)
+
+
+def invalidate_threat_tiles(points: Iterable[Tuple[float, float]]) -> None:
+    """Removes cached tiles of every zoom level which contain the points
+
+    Points are (longitude, latitude) pairs. Tiles which show a point only
+    in their buffer are left until they expire.
+    """
+    for key in _threat_tile_keys(points):
+        _invalidate_tile(key)
+
+
+def location_coordinates(location) -> Optional[Tuple[float, float]]:
+    """Longitude and latitude of a point in any form accepted by `Threat.location`
+
+    Locations loaded from the database are EWKB, the ones set by the
+    application usually WKT or EWKT, e.g. `SRID=4326;POINT(21.01 52.22)`.
+    """
+    if location is None:
+        return None
+    if isinstance(location, WKBElement):
+        data = location.data
+        data = bytes.fromhex(data) if isinstance(data, str) else bytes(data)
+        byte_order = "<" if data[0] == 1 else ">"
+        (geometry_type,) = struct.unpack_from(f"{byte_order}I", data, 1)
+        offset = 9 if geometry_type & EWKB_SRID_FLAG else 5
+        if len(data) < offset + 16:
+            return None
+        return struct.unpack_from(f"{byte_order}dd", data, offset)
+    match = POINT_PATTERN.search(str(getattr(location, "data", location)))
+    if match is None:
+        return None
+    return float(match[1]), float(match[2])
+
+
+def _threat_locations(target: Threat) -> Iterable[Tuple[float, float]]:
+    history = inspect(target).attrs.location.history
+    for location in [target.location, *history.deleted]:
+        if (coordinates := location_coordinates(location)) is not None:
+            yield coordinates
+
+
+# Bulk statements (e.g. `update(Threat)`) don't emit these events, tiles
+# changed by them stay cached until TILE_CACHE_TTL. Tiles are collected at
+# flush, while the old location is known, and invalidated after the commit
+@event.listens_for(Threat, "after_insert")
+@event.listens_for(Threat, "after_update")
+@event.listens_for(Threat, "after_delete")
+def _invalidate_threat_tiles(mapper, connection, target: Threat):
+    session = object_session(target)
+    for key in _threat_tile_keys(_threat_locations(target)):
+        invalidate_on_commit(session, _invalidate_tile, key)
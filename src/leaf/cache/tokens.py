@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+from leaf.cache.backends import (
+    CacheBackend,
+    InMemoryCacheBackend,
+    RedisCacheBackend,
+)
+from leaf.cache.invalidation import invalidate_on_commit
+from leaf.config.config import get_settings
+from leaf.models import User
+
+settings = get_settings()
+
+
+def create_token_version_cache_backend() -> CacheBackend:
+    """Current token versions of users, checked by every request with claims
+
+    With the in-memory backend other processes see an incremented version
+    after `TOKEN_VERSION_CACHE_TTL` seconds at most, with Redis right away.
+    """
+    local = InMemoryCacheBackend(
+        max_size=settings.TOKEN_VERSION_CACHE_MAX_SIZE,
+        ttl=settings.TOKEN_VERSION_CACHE_TTL,
+    )
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCacheBackend(
+            Redis.from_url(settings.CACHE_REDIS_URL),
+            namespace="leaf:token-versions",
+            ttl=settings.TOKEN_VERSION_CACHE_TTL,
+            dumps=lambda version: str(version).encode(),
+            loads=int,
+            # Revocation has to reach all processes, versions are not kept
+            # locally
+            local=None,
+            async_client=AsyncRedis.from_url(settings.CACHE_REDIS_URL),
+        )
+    return local
+
+
+token_version_cache: CacheBackend = create_token_version_cache_backend()
+
+
+def get_token_version_cache() -> CacheBackend:
+    return token_version_cache
+
+
+def set_token_version_cache_backend(backend: CacheBackend) -> None:
+    """Replaces the backend of the token version cache, e.g. in tests"""
+    global token_version_cache
+    token_version_cache.stop()
+    token_version_cache = backend
+
+
+def get_cached_token_version(user_id: int) -> Optional[int]:
+    return token_version_cache.get(str(user_id))
+
+
+def cache_token_version(user_id: int, version: int) -> None:
+    token_version_cache.set(str(user_id), version)
+
+
+def invalidate_token_version(user_id: int) -> None:
+    token_version_cache.delete(str(user_id))
+
+
+async def get_cached_token_version_async(user_id: int) -> Optional[int]:
+    return await token_version_cache.get_async(str(user_id))
+
+
+async def cache_token_version_async(user_id: int, version: int) -> None:
+    await token_version_cache.set_async(str(user_id), version)
+
+
+async def invalidate_token_version_async(user_id: int) -> None:
+    await token_version_cache.delete_async(str(user_id))
+
+
+# Invalidated after the commit, otherwise a request in between could cache
+# the old version again and revoked tokens would pass until the TTL
+@event.listens_for(User, "after_update")
+def _invalidate_updated_token_version(mapper, connection, target: User):
+    if inspect(target).attrs.token_version.history.has_changes():
+        invalidate_on_commit(
+            object_session(target),
+            invalidate_token_version,
+            target.id,
+        )
+
+
+@event.listens_for(User, "after_delete")
+def _invalidate_deleted_token_version(mapper, connection, target: User):
+    invalidate_on_commit(object_session(target), invalidate_token_version, target.id)
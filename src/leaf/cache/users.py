@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import orjson
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import object_session
+
+from leaf.cache.backends import (
+    CacheBackend,
+    InMemoryCacheBackend,
+    RedisCacheBackend,
+)
+from leaf.cache.invalidation import invalidate_on_commit
+from leaf.config.config import get_settings
+from leaf.config.database import get_replica_router
+from leaf.models import Group, GroupMembership, User
+from leaf.schemas.users import UserSchema
+
+settings = get_settings()
+
+
+def dump_user(user: UserSchema) -> bytes:
+    return orjson.dumps(user.dict())
+
+
+def load_user(raw: bytes) -> UserSchema:
+    return UserSchema.parse_obj(orjson.loads(raw))
+
+
+def create_user_cache_backend() -> CacheBackend:
+    local = InMemoryCacheBackend(
+        max_size=settings.USER_CACHE_MAX_SIZE,
+        ttl=settings.USER_CACHE_TTL,
+    )
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCacheBackend(
+            Redis.from_url(settings.CACHE_REDIS_URL),
+            # Versioned, profiles cached before the permission mask was
+            # added to them can't be loaded
+            namespace="leaf:users:v2",
+            ttl=settings.USER_CACHE_TTL,
+            dumps=dump_user,
+            loads=load_user,
+            local=local,
+            async_client=AsyncRedis.from_url(settings.CACHE_REDIS_URL),
+        )
+    return local
+
+
+user_cache: CacheBackend = create_user_cache_backend()
+
+
+def get_user_cache() -> CacheBackend:
+    return user_cache
+
+
+def set_user_cache_backend(backend: CacheBackend) -> None:
+    """Replaces the backend of the user cache, e.g. with fakeredis in tests"""
+    global user_cache
+    user_cache.stop()
+    user_cache = backend
+
+
+def _user_key(email: str, image_size: Optional[int]) -> str:
+    return f"{email}:{image_size}"
+
+
+def get_cached_user(email: str, image_size: Optional[int]) -> Optional[UserSchema]:
+    if not settings.USER_CACHE_ENABLED:
+        return None
+    return user_cache.get(_user_key(email, image_size))
+
+
+def cache_user(user: UserSchema, image_size: Optional[int]) -> None:
+    if settings.USER_CACHE_ENABLED:
+        user_cache.set(_user_key(user.email, image_size), user)
+
+
+async def get_cached_user_async(
+    email: str,
+    image_size: Optional[int],
+) -> Optional[UserSchema]:
+    if not settings.USER_CACHE_ENABLED:
+        return None
+    return await user_cache.get_async(_user_key(email, image_size))
+
+
+async def cache_user_async(user: UserSchema, image_size: Optional[int]) -> None:
+    if settings.USER_CACHE_ENABLED:
+        await user_cache.set_async(_user_key(user.email, image_size), user)
+
+
+def _user_keys(email: str) -> list[str]:
+    return [
+        _user_key(email, None),
+        *(_user_key(email, height) for _, height in settings.IMAGE_SIZES.values()),
+    ]
+
+
+def invalidate_user(email: str) -> None:
+    """Removes cached profiles of the user in every image size
+
+    The profile is read from the primary for the read your writes window,
+    so the cache isn't filled again from a replica which is behind.
+    """
+    get_replica_router().mark_write(email)
+    for key in _user_keys(email):
+        user_cache.delete(key)
+
+
+def clear_user_cache() -> None:
+    user_cache.clear()
+
+
+async def invalidate_user_async(email: str) -> None:
+    await get_replica_router().mark_write_async(email)
+    for key in _user_keys(email):
+        await user_cache.delete_async(key)
+
+
+# Changes are flushed before the commit, profiles are invalidated once it
+# succeeds, see `invalidate_on_commit`
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_updated_user(mapper, connection, target: User):
+    session = object_session(target)
+    for email in [target.email, *inspect(target).attrs.email.history.deleted]:
+        invalidate_on_commit(session, invalidate_user, email)
+
+
+@event.listens_for(User.groups, "append")
+@event.listens_for(User.groups, "remove")
+def _invalidate_user_groups(target: User, value, initiator):
+    invalidate_on_commit(object_session(target), invalidate_user, target.email)
+
+
+@event.listens_for(GroupMembership, "after_insert")
+@event.listens_for(GroupMembership, "after_delete")
+def _invalidate_group_member(mapper, connection, target: GroupMembership):
+    email = connection.execute(
+        select(User.email).where(User.id == target.user_id),
+    ).scalar()
+    if email:
+        invalidate_on_commit(object_session(target), invalidate_user, email)
+
+
+@event.listens_for(Group, "after_update")
+@event.listens_for(Group, "after_delete")
+def _invalidate_group(mapper, connection, target: Group):
+    # Group name is a part of every member profile
+    invalidate_on_commit(object_session(target), clear_user_cache)
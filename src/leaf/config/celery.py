@@ -1,9 +1,37 @@
 from __future__ import annotations
 
+from time import perf_counter
+
 from celery import Celery
+from celery.signals import (
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+)
+from prometheus_client import start_http_server
 
 from leaf.config.config import get_settings
-from leaf.tasks import resize_image, send_mail
+from leaf.config.database import engine
+from leaf.config.logger import logger
+from leaf.config.metrics import (
+    TASK_SECONDS,
+    get_registry,
+    is_multiprocess,
+    mark_process_dead,
+)
+from leaf.emails import compile_email_templates
+from leaf.mail import close_mail_dispatcher
+from leaf.tasks import (
+    collect_media_garbage,
+    deliver_mail,
+    fan_out_post,
+    import_users,
+    reconcile_post_counts,
+    resize_image,
+    send_mail,
+)
 
 settings = get_settings()
 
@@ -16,3 +44,78 @@ celery = Celery(
 )
 celery.task(send_mail)
 celery.task(resize_image)
+celery.task(collect_media_garbage)
+celery.task(deliver_mail)
+celery.task(reconcile_post_counts)
+celery.task(fan_out_post)
+celery.task(import_users)
+
+celery.conf.beat_schedule = {
+    "collect-media-garbage": {
+        "task": collect_media_garbage.name,
+        "schedule": settings.MEDIA_GC_INTERVAL,
+        "args": (settings.MEDIA_GC_GRACE_PERIOD,),
+    },
+    "reconcile-post-counts": {
+        "task": reconcile_post_counts.name,
+        "schedule": settings.POST_COUNTS_RECONCILE_INTERVAL,
+        "args": (settings.POST_COUNTS_RECONCILE_BATCH_SIZE,),
+    },
+}
+
+
+@worker_process_init.connect
+def prepare_email_templates(**kwargs):
+    compile_email_templates()
+
+
+@worker_process_init.connect
+def reset_database_pool(**kwargs):
+    # Connections opened before the fork belong to the parent process
+    engine.dispose(close=False)
+
+
+@worker_process_shutdown.connect
+def close_smtp_connection(**kwargs):
+    close_mail_dispatcher()
+
+
+@worker_process_shutdown.connect
+def remove_process_metrics(pid=None, **kwargs):
+    mark_process_dead(pid)
+
+
+@worker_init.connect
+def serve_metrics(**kwargs):
+    """Serves metrics of the worker's task processes
+
+    Tasks run in child processes, without `PROMETHEUS_MULTIPROC_DIR` their
+    metrics never reach the registry of the main process, which would serve
+    empty histograms.
+    """
+    if not settings.CELERY_METRICS_PORT:
+        return
+    if not is_multiprocess():
+        logger.warning(
+            "Celery metrics are not served, PROMETHEUS_MULTIPROC_DIR is not set",
+        )
+        return
+    start_http_server(settings.CELERY_METRICS_PORT, registry=get_registry())
+
+
+# Start times of tasks running in this process by task id
+task_started_at: dict[str, float] = {}
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    task_started_at[task_id] = perf_counter()
+
+
+@task_postrun.connect
+def observe_task_duration(task_id=None, task=None, state=None, **kwargs):
+    started_at = task_started_at.pop(task_id, None)
+    if started_at is not None:
+        TASK_SECONDS.labels(task.name, state or "UNKNOWN").observe(
+            perf_counter() - started_at,
+        )
@@ -17,15 +17,78 @@ class Settings(BaseSettings):
         "DATABASE": env("POSTGRES_DB"),
     }
 
+    # Pools are per process, uvicorn workers use DB_POOL_SIZE and Celery
+    # workers DB_WORKER_POOL_SIZE
+    DB_POOL_SIZE = env.int("DB_POOL_SIZE", 5)
+    DB_MAX_OVERFLOW = env.int("DB_MAX_OVERFLOW", 10)
+    DB_WORKER_POOL_SIZE = env.int("DB_WORKER_POOL_SIZE", 2)
+    DB_WORKER_MAX_OVERFLOW = env.int("DB_WORKER_MAX_OVERFLOW", 2)
+    DB_POOL_TIMEOUT = env.float("DB_POOL_TIMEOUT", 30)
+    # Seconds after which connections are reopened, -1 keeps them open
+    DB_POOL_RECYCLE = env.int("DB_POOL_RECYCLE", -1)
+    DB_POOL_PRE_PING = env.bool("DB_POOL_PRE_PING", False)
+    # Connections go through PgBouncer in transaction pooling mode
+    DB_PGBOUNCER = env.bool("DB_PGBOUNCER", False)
+    # Read replicas as host:port=weight, e.g. "replica-1:5432=2,replica-2=1",
+    # with the credentials and database of the primary. Kept as a string, a
+    # dict field would be parsed as JSON by pydantic
+    DB_REPLICAS = env("DB_REPLICAS", "")
+    # Replicas further behind are not used, keep it below the read your
+    # writes window
+    DB_REPLICA_MAX_LAG = env.float("DB_REPLICA_MAX_LAG", 1)
+    DB_REPLICA_CHECK_INTERVAL = env.float("DB_REPLICA_CHECK_INTERVAL", 5)
+    DB_REPLICA_CHECK_TIMEOUT = env.float("DB_REPLICA_CHECK_TIMEOUT", 1)
+    # Seconds after a write in which reads of the user go to the primary
+    DB_READ_YOUR_WRITES_WINDOW = env.float("DB_READ_YOUR_WRITES_WINDOW", 5)
+    # Engine events which time queries add about 15us to every query
+    DB_QUERY_METRICS_ENABLED = env.bool("DB_QUERY_METRICS_ENABLED", True)
+
     LOG_LEVEL = env.log_level("LOG_LEVEL")
 
     SECRET_KEY = env("SECRET_KEY")
     SECURITY_PASSWORD_SALT = env("SECURITY_PASSWORD_SALT")
     ALGORITHM = env("ALGORITHM")
     ACCESS_TOKEN_EXPIRE_MINUTES = env.int("ACCESS_TOKEN_EXPIRE_MINUTES")
+    # Access tokens carry user id, permissions and groups, so authorization
+    # doesn't need the database
+    TOKEN_CLAIMS_ENABLED = env.bool("TOKEN_CLAIMS_ENABLED", False)
+    REFRESH_TOKEN_EXPIRE_DAYS = env.int("REFRESH_TOKEN_EXPIRE_DAYS", 30)
+    # Sessions revoked within an access token lifetime, more of them only
+    # raise the false positive rate of the revocation filter
+    SESSION_REVOCATION_CAPACITY = env.int("SESSION_REVOCATION_CAPACITY", 100000)
+    SESSION_REVOCATION_ERROR_RATE = env.float("SESSION_REVOCATION_ERROR_RATE", 0.001)
+    SESSION_REVOCATION_SYNC_INTERVAL = env.float("SESSION_REVOCATION_SYNC_INTERVAL", 5)
+
+    PASSWORD_HASH_ROUNDS = env.int("PASSWORD_HASH_ROUNDS", 12)
+    PASSWORD_HASH_EXECUTOR = env("PASSWORD_HASH_EXECUTOR", "thread")
+    PASSWORD_HASH_WORKERS = env.int("PASSWORD_HASH_WORKERS", 4)
+    PASSWORD_HASH_MAX_QUEUE_DEPTH = env.int("PASSWORD_HASH_MAX_QUEUE_DEPTH", 0)
+
+    USER_IMPORT_MAX_SIZE = env.int("USER_IMPORT_MAX_SIZE", 50 * 1024 * 1024)
+    USER_IMPORT_BATCH_SIZE = env.int("USER_IMPORT_BATCH_SIZE", 1000)
+    USER_IMPORT_HASH_WORKERS = env.int("USER_IMPORT_HASH_WORKERS", 4)
+
+    CACHE_BACKEND = env("CACHE_BACKEND", "memory")
+    CACHE_REDIS_URL = env("CACHE_REDIS_URL", "redis://redis:6379/2")
+    USER_CACHE_ENABLED = env.bool("USER_CACHE_ENABLED", True)
+    USER_CACHE_TTL = env.int("USER_CACHE_TTL", 60)
+    USER_CACHE_MAX_SIZE = env.int("USER_CACHE_MAX_SIZE", 10000)
+    TOKEN_VERSION_CACHE_TTL = env.int("TOKEN_VERSION_CACHE_TTL", 30)
+    TOKEN_VERSION_CACHE_MAX_SIZE = env.int("TOKEN_VERSION_CACHE_MAX_SIZE", 100000)
+    TILE_CACHE_ENABLED = env.bool("TILE_CACHE_ENABLED", True)
+    TILE_CACHE_TTL = env.int("TILE_CACHE_TTL", 60 * 60)
+    TILE_CACHE_MAX_SIZE = env.int("TILE_CACHE_MAX_SIZE", 2000)
+    # Tiles of higher zoom levels are cheap to build and too many to cache
+    TILE_CACHE_MAX_ZOOM = env.int("TILE_CACHE_MAX_ZOOM", 16)
+    # Up to this zoom level tiles contain clusters instead of single threats
+    TILE_CLUSTER_MAX_ZOOM = env.int("TILE_CLUSTER_MAX_ZOOM", 12)
 
     CELERY_BROKER_URL = env("CELERY_BROKER_URL")
     CELERY_RESULT_BACKEND = env("CELERY_RESULT_BACKEND")
+    # Port of the metrics of Celery worker processes, 0 doesn't serve them.
+    # They are only served with PROMETHEUS_MULTIPROC_DIR, which collects
+    # metrics of the worker's child processes
+    CELERY_METRICS_PORT = env.int("CELERY_METRICS_PORT", 0)
 
     AVAILABLE_IMAGE_SIZES = env("AVAILABLE_IMAGE_SIZES")
     IMAGE_SIZES = {
@@ -33,8 +96,38 @@ class Settings(BaseSettings):
         for size in AVAILABLE_IMAGE_SIZES.split(",")
     }
 
+    # Comma separated, a list field would be parsed as JSON by pydantic
+    IMAGE_VARIANT_FORMATS = env("IMAGE_VARIANT_FORMATS", "webp,avif")
+    # Threads of a worker process encoding and uploading resized images
+    IMAGE_RESIZE_WORKERS = env.int("IMAGE_RESIZE_WORKERS", 4)
+
     MEDIA_FOLDER = env("MEDIA_FOLDER")
+    MAX_UPLOAD_SIZE = env.int("MAX_UPLOAD_SIZE", 10 * 1024 * 1024)
     MEDIA_BASE_URL = env("MEDIA_BASE_URL")
+    MEDIA_GC_INTERVAL = env.int("MEDIA_GC_INTERVAL", 60 * 60)
+    MEDIA_GC_GRACE_PERIOD = env.int("MEDIA_GC_GRACE_PERIOD", 24 * 60 * 60)
+
+    POST_COUNTS_RECONCILE_INTERVAL = env.int("POST_COUNTS_RECONCILE_INTERVAL", 60 * 60)
+    POST_COUNTS_RECONCILE_BATCH_SIZE = env.int(
+        "POST_COUNTS_RECONCILE_BATCH_SIZE",
+        10000,
+    )
+
+    TIMELINE_FANOUT_ENABLED = env.bool("TIMELINE_FANOUT_ENABLED", False)
+    TIMELINE_REDIS_URL = env("TIMELINE_REDIS_URL", "redis://redis:6379/3")
+    TIMELINE_MAX_LENGTH = env.int("TIMELINE_MAX_LENGTH", 800)
+    # Posts of members of larger groups are merged into timelines on read
+    TIMELINE_FANOUT_MAX_GROUP_SIZE = env.int("TIMELINE_FANOUT_MAX_GROUP_SIZE", 1000)
+
+    STORAGE_BACKEND = env("STORAGE_BACKEND", "local")
+    S3_BUCKET = env("S3_BUCKET", "leaf-media")
+    S3_ENDPOINT_URL = env("S3_ENDPOINT_URL", "")
+    S3_REGION = env("S3_REGION", "")
+    S3_ACCESS_KEY_ID = env("S3_ACCESS_KEY_ID", "")
+    S3_SECRET_ACCESS_KEY = env("S3_SECRET_ACCESS_KEY", "")
+    S3_MAX_POOL_CONNECTIONS = env.int("S3_MAX_POOL_CONNECTIONS", 20)
+    S3_MULTIPART_PART_SIZE = env.int("S3_MULTIPART_PART_SIZE", 8 * 1024 * 1024)
+    S3_PRESIGNED_URL_EXPIRES = env.int("S3_PRESIGNED_URL_EXPIRES", 60 * 60)
 
     CONFIRMATION_URL = env("CONFIRMATION_URL")
     PASSWORD_RESET_URL = env("PASSWORD_RESET_URL")
@@ -45,7 +138,17 @@ class Settings(BaseSettings):
         "PASSWORD": env("SMTP_PASSWORD"),
         "HOST": env("SMTP_HOST"),
         "PORT": env("SMTP_PORT"),
+        # ssl, starttls or none
+        "SECURITY": env("SMTP_SECURITY", "starttls"),
     }
+    MAIL_OUTBOX_REDIS_URL = env("MAIL_OUTBOX_REDIS_URL", CELERY_BROKER_URL)
+    MAIL_BATCH_SIZE = env.int("MAIL_BATCH_SIZE", 50)
+    # Per worker process, in mails per second
+    MAIL_RATE_LIMIT = env.float("MAIL_RATE_LIMIT", 10)
+    MAIL_RATE_BURST = env.int("MAIL_RATE_BURST", 20)
+    MAIL_MAX_RETRIES = env.int("MAIL_MAX_RETRIES", 3)
+    MAIL_RETRY_BACKOFF = env.float("MAIL_RETRY_BACKOFF", 1)
+    MAIL_IDLE_TIMEOUT = env.int("MAIL_IDLE_TIMEOUT", 60)
 
 
 @lru_cache
@@ -1,28 +1,194 @@
 from __future__ import annotations
 
-from os import environ
+from typing import Optional
+from uuid import uuid4
 
-from sqlalchemy import create_engine
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy import URL, Engine, create_engine
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, Pool, QueuePool
+from starlette.requests import Request
 
-SQLALCHEMY_DATABASE_URL = (
-    f"postgresql://{environ.get('POSTGRES_USER')}:{environ.get('POSTGRES_PASSWORD')}"
-    f"@{environ.get('POSTGRES_HOST')}:{environ.get('POSTGRES_PORT')}/{environ.get('POSTGRES_DB')}"
+from leaf.config.config import get_settings
+from leaf.config.metrics import instrument_engine
+from leaf.config.pool_metrics import metered_pool_class
+from leaf.config.replicas import (
+    READ_METHODS,
+    RecentWrites,
+    Replica,
+    ReplicaRouter,
+    get_request_user,
+    parse_replicas,
 )
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+settings = get_settings()
+
+
+def get_database_url(
+    drivername: str = "postgresql",
+    database: Optional[str] = None,
+    host: Optional[str] = None,
+    port: Optional[str] = None,
+) -> URL:
+    return URL.create(
+        drivername,
+        username=settings.DB_CONFIG["USER"],
+        password=settings.DB_CONFIG["PASSWORD"],
+        host=host or settings.DB_CONFIG["HOST"],
+        port=port or settings.DB_CONFIG["PORT"],
+        database=database or settings.DB_CONFIG["DATABASE"],
+    )
+
+
+def engine_options(profile: str, pool_class: type[Pool]) -> dict:
+    """Pool options of engines of API processes, Celery workers and migrations
+
+    Pools are per process, every uvicorn and Celery worker process opens up
+    to pool size plus max overflow connections. API processes have a pool
+    of that size for every replica as well.
+    """
+    if profile == "migrations":
+        # A single connection for the run, closed at the end
+        return {"poolclass": NullPool}
+    if settings.DB_PGBOUNCER:
+        # PgBouncer pools the server connections, a second pool in the
+        # process would only hold on to them
+        return {
+            "poolclass": metered_pool_class(NullPool, profile),
+            "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        }
+    if profile in ("api", "replica"):
+        pool_size, max_overflow = settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW
+    elif profile == "worker":
+        pool_size = settings.DB_WORKER_POOL_SIZE
+        max_overflow = settings.DB_WORKER_MAX_OVERFLOW
+    else:
+        raise ValueError(f"Unknown engine profile: {profile}")
+    return {
+        "poolclass": metered_pool_class(pool_class, profile),
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def create_database_engine(profile: str, database: Optional[str] = None) -> Engine:
+    engine = create_engine(
+        get_database_url(database=database),
+        **engine_options(profile, QueuePool),
+    )
+    if settings.DB_QUERY_METRICS_ENABLED and profile != "migrations":
+        instrument_engine(engine, profile)
+    return engine
+
+
+def create_async_database_engine(
+    profile: str,
+    database: Optional[str] = None,
+    host: Optional[str] = None,
+    port: Optional[str] = None,
+) -> AsyncEngine:
+    options = engine_options(profile, AsyncAdaptedQueuePool)
+    if settings.DB_PGBOUNCER:
+        # In transaction mode statements prepared on one server connection
+        # are not there in the next transaction
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    engine = create_async_engine(
+        get_database_url("postgresql+asyncpg", database, host, port),
+        **options,
+    )
+    if settings.DB_QUERY_METRICS_ENABLED:
+        instrument_engine(engine.sync_engine, profile)
+    return engine
+
+
+def create_replica_router() -> ReplicaRouter:
+    replicas = []
+    for host, port, weight in parse_replicas(settings.DB_REPLICAS):
+        engine = create_async_database_engine("replica", host=host, port=port)
+        replicas.append(Replica(f"{host}:{port}" if port else host, engine, weight))
+    client = async_client = None
+    if settings.CACHE_BACKEND == "redis":
+        client = Redis.from_url(settings.CACHE_REDIS_URL)
+        async_client = AsyncRedis.from_url(settings.CACHE_REDIS_URL)
+    return ReplicaRouter(
+        replicas,
+        RecentWrites(
+            settings.DB_READ_YOUR_WRITES_WINDOW,
+            client,
+            async_client=async_client,
+        ),
+        max_lag=settings.DB_REPLICA_MAX_LAG,
+        check_interval=settings.DB_REPLICA_CHECK_INTERVAL,
+        check_timeout=settings.DB_REPLICA_CHECK_TIMEOUT,
+    )
+
+
+# Sync engine is kept for Celery workers, request handlers only use the
+# async engines. Pools of both are opened by the processes which use them,
+# see `MeteredPool`
+engine = create_database_engine("worker")
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
     bind=engine,
 )
 
+# Async engine is used by API request handlers, so DB round trips
+# do not block the event loop
+async_engine = create_async_database_engine("api")
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False,
+    expire_on_commit=False,
+    bind=async_engine,
+)
+
+replica_router: ReplicaRouter = create_replica_router()
+
+
+def get_replica_router() -> ReplicaRouter:
+    return replica_router
+
+
+def set_replica_router(router: ReplicaRouter) -> None:
+    """Replaces the replica router, e.g. with test databases"""
+    global replica_router
+    replica_router.stop()
+    replica_router = router
+
+
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def get_async_db(request: Request):
+    """Session of the request, on a replica when the request only reads"""
+    router = get_replica_router()
+    user = replica = None
+    if router.replicas:
+        user = get_request_user(request)
+        replica = await router.route(request.method, user)
+    bind = async_engine if replica is None else replica.engine
+    async with AsyncSessionLocal(bind=bind) as db:
+        try:
+            yield db
+        except Exception as e:
+            if replica is not None:
+                router.on_error(replica, e)
+            raise
+        finally:
+            # Marked at the start as well, the window counts from the end of
+            # the write
+            if user is not None and request.method not in READ_METHODS:
+                await router.mark_write_async(user)
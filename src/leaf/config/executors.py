@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from functools import partial
+from threading import Lock
+from typing import Any, Callable
+
+from prometheus_client import Counter, Gauge
+
+EXECUTOR_PENDING_CALLS = Gauge(
+    "leaf_executor_pending_calls",
+    "Calls running in the executor or waiting in its queue",
+    ["executor"],
+    multiprocess_mode="livesum",
+)
+EXECUTOR_QUEUE_DEPTH = Gauge(
+    "leaf_executor_queue_depth",
+    "Calls waiting for a worker of the executor",
+    ["executor"],
+    multiprocess_mode="livesum",
+)
+EXECUTOR_REJECTIONS = Counter(
+    "leaf_executor_rejections",
+    "Calls rejected because the queue of the executor was full",
+    ["executor"],
+)
+
+
+class ExecutorSaturated(Exception):
+    """Call rejected because the queue of the executor is full"""
+
+    def __init__(self, name: str, queue_depth: int):
+        super().__init__(f"Queue of executor {name} is full: {queue_depth} calls")
+        self.name = name
+        self.queue_depth = queue_depth
+
+
+class BoundedExecutor:
+    """Runs blocking, CPU heavy calls outside of the event loop
+
+    Concurrency is capped by the number of workers, calls above the cap wait
+    in the executor queue. When `max_queue_depth` is reached new calls are
+    rejected with `ExecutorSaturated` instead of piling up behind the
+    workers, the app answers them with 503.
+
+    Pending calls, the queue depth and rejections are exported as
+    Prometheus metrics labeled by `name`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers: int,
+        kind: str = "thread",
+        max_queue_depth: int = 0,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.name = name
+        self.workers = workers
+        self.kind = kind
+        self.max_queue_depth = max_queue_depth
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.peak_queue_depth = 0
+        self._executor: Executor | None = None
+        self._lock = Lock()
+        self._pending_gauge = EXECUTOR_PENDING_CALLS.labels(name)
+        self._queue_depth_gauge = EXECUTOR_QUEUE_DEPTH.labels(name)
+        self._rejections = EXECUTOR_REJECTIONS.labels(name)
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            executor_class = (
+                ProcessPoolExecutor if self.kind == "process" else ThreadPoolExecutor
+            )
+            self._executor = executor_class(max_workers=self.workers)
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self.pending - self.workers, 0)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            if self.max_queue_depth and self.queue_depth >= self.max_queue_depth:
+                self.rejected += 1
+                self._rejections.inc()
+                raise ExecutorSaturated(self.name, self.queue_depth)
+            self.pending += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth)
+            self._publish()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor,
+                partial(func, *args, **kwargs),
+            )
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+                self._publish()
+
+    def _publish(self) -> None:
+        self._pending_gauge.set(self.pending)
+        self._queue_depth_gauge.set(self.queue_depth)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "workers": self.workers,
+            "pending": self.pending,
+            "queue_depth": self.queue_depth,
+            "peak_queue_depth": self.peak_queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -2,10 +2,14 @@ from __future__ import annotations
 
 from pathlib import Path
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
+EMAIL_TEMPLATES_DIRECTORY = Path(__file__).parent.parent / "static/templates/emails"
+
+# Templates don't change while the app runs, so they are compiled once per
+# process and the compiled code is shared by processes through the cache
 env = Environment(
-    loader=FileSystemLoader(
-        Path("leaf/static/templates/emails"),
-    ),
+    loader=FileSystemLoader(EMAIL_TEMPLATES_DIRECTORY),
+    bytecode_cache=FileSystemBytecodeCache(),
+    auto_reload=False,
 )
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import os
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Optional
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import Engine, event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Requests not handled by a `SchemaRoute`, e.g. 404s and the docs, share
+# a label, so arbitrary paths don't add series
+UNMATCHED_ROUTE = "<unmatched>"
+
+REQUEST_SECONDS = Histogram(
+    "leaf_http_request_seconds",
+    "Time of handling a request until the response is sent",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "leaf_http_requests_in_progress",
+    "Requests being handled",
+    multiprocess_mode="livesum",
+)
+REQUEST_DB_QUERIES = Histogram(
+    "leaf_http_request_db_queries",
+    "Database queries executed by a request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "leaf_http_request_db_seconds",
+    "Time a request spent in database queries",
+    ["method", "route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DB_QUERY_SECONDS = Histogram(
+    "leaf_db_query_seconds",
+    "Time of executing a database query",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+TASK_SECONDS = Histogram(
+    "leaf_celery_task_seconds",
+    "Time of running a Celery task",
+    ["task", "state"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
+
+class QueryStats:
+    """Database queries of a single request"""
+
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+request_queries: ContextVar[Optional[QueryStats]] = ContextVar(
+    "request_queries",
+    default=None,
+)
+
+
+def is_multiprocess() -> bool:
+    """Whether metrics are written to files shared by all processes
+
+    `PROMETHEUS_MULTIPROC_DIR` has to point to an empty directory before
+    any process starts, every uvicorn and Celery worker process then adds
+    its own files.
+    """
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def get_registry() -> CollectorRegistry:
+    if not is_multiprocess():
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def generate_metrics() -> bytes:
+    """Metrics of all processes in the Prometheus text format"""
+    return generate_latest(get_registry())
+
+
+def mark_process_dead(pid: Optional[int] = None) -> None:
+    """Removes gauges of a stopped process from the aggregates"""
+    if is_multiprocess():
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+def instrument_engine(engine: Engine, profile: str) -> None:
+    """Times queries of the engine and counts them in the current request
+
+    The start is kept on the execution context, so failed queries leave
+    nothing behind.
+    """
+    histogram = DB_QUERY_SECONDS.labels(profile)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.leaf_query_started_at = perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        started_at = getattr(context, "leaf_query_started_at", None)
+        if started_at is None:
+            return
+        elapsed = perf_counter() - started_at
+        histogram.observe(elapsed)
+        stats = request_queries.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+
+
+class MetricsMiddleware:
+    """Records latency, status and database queries of every HTTP request
+
+    Requests are labeled by the path template of their route, which
+    `SchemaRoute` puts in the scope. Children of the labeled metrics are
+    kept per label values, so a request costs a few timer reads and three
+    observations.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._children: dict[tuple, tuple] = {}
+
+    def _metrics(self, method: str, route: str, status: str) -> tuple:
+        key = (method, route, status)
+        children = self._children.get(key)
+        if children is None:
+            children = self._children[key] = (
+                REQUEST_SECONDS.labels(method, route, status),
+                REQUEST_DB_QUERIES.labels(method, route),
+                REQUEST_DB_SECONDS.labels(method, route),
+            )
+        return children
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = QueryStats()
+        token = request_queries.set(stats)
+        REQUESTS_IN_PROGRESS.inc()
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - start
+            REQUESTS_IN_PROGRESS.dec()
+            request_queries.reset(token)
+            route = scope.get("route")
+            seconds, queries, query_seconds = self._metrics(
+                scope["method"],
+                route.path if route is not None else UNMATCHED_ROUTE,
+                str(status),
+            )
+            seconds.observe(elapsed)
+            queries.observe(stats.count)
+            query_seconds.observe(stats.seconds)
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from threading import Lock
+from time import perf_counter
+from typing import Type
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import Pool
+
+POOL_CHECKOUT_SECONDS = Histogram(
+    "leaf_db_pool_checkout_seconds",
+    "Time spent waiting for a connection from the pool",
+    ["engine"],
+    buckets=(
+        0.0005,
+        0.001,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1,
+        2.5,
+        5,
+        10,
+        30,
+    ),
+)
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    "leaf_db_pool_checkout_timeouts",
+    "Checkouts which gave up after the pool timeout",
+    ["engine"],
+)
+POOL_CONNECTIONS_IN_USE = Gauge(
+    "leaf_db_pool_connections_in_use",
+    "Connections checked out of the pool",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+POOL_OVERFLOW = Gauge(
+    "leaf_db_pool_overflow_connections",
+    "Connections open above the pool size",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+# Pool sizes plus maximum overflows of the pools of the profile used by the
+# process, summed over processes it is the number of connections Postgres
+# has to allow
+POOL_MAX_CONNECTIONS = Gauge(
+    "leaf_db_pool_max_connections",
+    "Pool size plus maximum overflow",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+
+
+class MeteredPool:
+    """Mixin of pool classes which records checkouts of connections
+
+    Waiting for a connection is timed around `_do_get`, the only place where
+    pools block, connections in use are counted until they are returned.
+
+    Every process imports all engines, a pool adds its size to the maximum
+    connections of the profile on its first checkout, so engines a process
+    never uses aren't counted. It is taken back when the pool is disposed.
+    """
+
+    engine_profile = "default"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._max_connections_lock = Lock()
+        self._counted_max_connections = 0
+
+    def _count_max_connections(self) -> None:
+        size = getattr(self, "size", None)
+        if size is None:
+            return
+        with self._max_connections_lock:
+            if not self._counted_max_connections:
+                self._counted_max_connections = size() + max(self._max_overflow, 0)
+                POOL_MAX_CONNECTIONS.labels(self.engine_profile).inc(
+                    self._counted_max_connections,
+                )
+
+    def _update_usage(self, delta: int) -> None:
+        POOL_CONNECTIONS_IN_USE.labels(self.engine_profile).inc(delta)
+        overflow = getattr(self, "overflow", None)
+        if overflow is not None:
+            POOL_OVERFLOW.labels(self.engine_profile).set(max(overflow(), 0))
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            record = super()._do_get()
+        except TimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.labels(self.engine_profile).inc()
+            raise
+        finally:
+            POOL_CHECKOUT_SECONDS.labels(self.engine_profile).observe(
+                perf_counter() - start,
+            )
+        if not self._counted_max_connections:
+            self._count_max_connections()
+        self._update_usage(1)
+        return record
+
+    def _do_return_conn(self, record) -> None:
+        super()._do_return_conn(record)
+        self._update_usage(-1)
+
+    def dispose(self) -> None:
+        super().dispose()
+        with self._max_connections_lock:
+            if self._counted_max_connections:
+                POOL_MAX_CONNECTIONS.labels(self.engine_profile).dec(
+                    self._counted_max_connections,
+                )
+                self._counted_max_connections = 0
+
+
+@lru_cache
+def metered_pool_class(pool_class: Type[Pool], engine_profile: str) -> Type[Pool]:
+    """Pool class with metrics labeled by the profile of the engine
+
+    The label is a class attribute, so it is kept when the engine recreates
+    its pool.
+    """
+    return type(
+        f"Metered{pool_class.__name__}",
+        (MeteredPool, pool_class),
+        {"engine_profile": engine_profile},
+    )
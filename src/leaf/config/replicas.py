@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from time import monotonic
+from typing import Callable, Optional, Sequence
+
+from jose import JWTError, jwt
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from leaf.config.logger import logger
+
+# Requests with these methods only read, their sessions may use a replica
+READ_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+# Seconds the replica is behind the primary, 0 when it replayed everything
+# it received, so idle replicas don't look lagging
+POSTGRES_LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            extract(epoch FROM now() - pg_last_xact_replay_timestamp()),
+            0
+        )
+    END
+    """,
+)
+# Other databases, e.g. SQLite standing in for a replica, are never behind
+LAG_QUERY = text("SELECT 0")
+
+
+def parse_replicas(value: str) -> list[tuple[str, Optional[str], int]]:
+    """Host, port and weight of replicas listed as `host:port=weight`
+
+    Port and weight are optional, e.g. `replica-1:5432=2,replica-2`.
+    """
+    replicas = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        address, _, weight = entry.partition("=")
+        host, _, port = address.partition(":")
+        try:
+            replicas.append((host, port or None, int(weight or 1)))
+        except ValueError:
+            raise ValueError(f"Invalid weight of replica {address}: {weight}")
+    return replicas
+
+
+class Replica:
+    """Read-only copy of the primary database and its health"""
+
+    def __init__(self, name: str, engine: AsyncEngine, weight: int = 1):
+        if weight < 1:
+            raise ValueError(f"Weight of replica {name} has to be positive")
+        self.name = name
+        self.engine = engine
+        self.weight = weight
+        self.healthy = True
+        self.lag: Optional[float] = None
+        self.reads = 0
+        # Smooth weighted round-robin state
+        self.current_weight = 0
+
+    def lag_query(self):
+        if self.engine.dialect.name == "postgresql":
+            return POSTGRES_LAG_QUERY
+        return LAG_QUERY
+
+
+class RecentWrites:
+    """Users who wrote in the last `window` seconds
+
+    Reads of these users go to the primary, so they see their own writes
+    before the replicas replay them. Without Redis the users are kept in
+    the process, so only requests handled by the same process see them.
+    When Redis is unavailable every user is treated as a recent writer.
+
+    Requests use the `_async` methods on `async_client`, without it the
+    blocking calls run in the thread pool.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        client: Optional[Redis] = None,
+        key: str = "leaf:db:recent-writes",
+        max_size: int = 100000,
+        clock: Callable[[], float] = monotonic,
+        async_client: Optional[AsyncRedis] = None,
+    ):
+        self.window = window
+        self.client = client
+        self.async_client = async_client
+        self.key = key
+        self.max_size = max_size
+        self.clock = clock
+        self.errors = 0
+        self._writes: OrderedDict[str, float] = OrderedDict()
+
+    def _key(self, user: str) -> str:
+        return f"{self.key}:{user}"
+
+    def _mark_local(self, user: str) -> None:
+        self._writes[user] = self.clock() + self.window
+        self._writes.move_to_end(user)
+        while len(self._writes) > self.max_size:
+            self._writes.popitem(last=False)
+
+    def _contains_local(self, user: str) -> bool:
+        expires_at = self._writes.get(user)
+        if expires_at is None:
+            return False
+        if expires_at <= self.clock():
+            del self._writes[user]
+            return False
+        return True
+
+    def mark(self, user: str) -> None:
+        if self.client is not None:
+            try:
+                self.client.set(self._key(user), 1, px=int(self.window * 1000))
+            except RedisError:
+                self.errors += 1
+                logger.warning(f"Recent write of {user} was not recorded")
+            return
+        self._mark_local(user)
+
+    def __contains__(self, user: str) -> bool:
+        if self.client is not None:
+            try:
+                return bool(self.client.exists(self._key(user)))
+            except RedisError:
+                self.errors += 1
+                return True
+        return self._contains_local(user)
+
+    async def mark_async(self, user: str) -> None:
+        if self.async_client is None:
+            if self.client is not None:
+                await run_in_threadpool(self.mark, user)
+            else:
+                self._mark_local(user)
+            return
+        try:
+            await self.async_client.set(
+                self._key(user),
+                1,
+                px=int(self.window * 1000),
+            )
+        except RedisError:
+            self.errors += 1
+            logger.warning(f"Recent write of {user} was not recorded")
+
+    async def contains_async(self, user: str) -> bool:
+        if self.async_client is None:
+            if self.client is not None:
+                return await run_in_threadpool(self.__contains__, user)
+            return self._contains_local(user)
+        try:
+            return bool(await self.async_client.exists(self._key(user)))
+        except RedisError:
+            self.errors += 1
+            return True
+
+
+def get_request_user(request: Request) -> Optional[str]:
+    """Subject of the bearer token of the request, if it has one
+
+    Only used to route the request, so the token is not verified, that is
+    done by the authentication dependencies.
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
+
+
+class ReplicaRouter:
+    """Chooses the database of a request's session
+
+    Requests which only read use a healthy replica, replicas are taken in
+    smooth weighted round-robin order. Writes, reads of users who wrote in
+    the last `recent_writes.window` seconds and all requests when no replica
+    is healthy use the primary.
+
+    Replicas are checked every `check_interval` seconds in the background,
+    a replica which doesn't answer in `check_timeout` seconds or lags more
+    than `max_lag` seconds behind the primary is not used until it passes
+    a check again. `max_lag` should stay below the recent writes window,
+    otherwise users may not see their own writes.
+    """
+
+    def __init__(
+        self,
+        replicas: Sequence[Replica],
+        recent_writes: RecentWrites,
+        max_lag: float = 1,
+        check_interval: float = 5,
+        check_timeout: float = 1,
+    ):
+        self.replicas = list(replicas)
+        self.recent_writes = recent_writes
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.primary_reads = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def choose(self) -> Optional[Replica]:
+        best = None
+        total = 0
+        for replica in self.replicas:
+            if not replica.healthy:
+                continue
+            replica.current_weight += replica.weight
+            total += replica.weight
+            if best is None or replica.current_weight > best.current_weight:
+                best = replica
+        if best is not None:
+            best.current_weight -= total
+        return best
+
+    async def route(self, method: str, user: Optional[str]) -> Optional[Replica]:
+        """Replica for a request, `None` for the primary"""
+        if not self.replicas:
+            return None
+        if method not in READ_METHODS:
+            if user is not None:
+                await self.recent_writes.mark_async(user)
+            return None
+        replica = None
+        if user is None or not await self.recent_writes.contains_async(user):
+            replica = self.choose()
+        if replica is None:
+            self.primary_reads += 1
+        else:
+            replica.reads += 1
+        return replica
+
+    def mark_write(self, user: str) -> None:
+        """Reads of the user go to the primary for the recent writes window"""
+        if self.replicas:
+            self.recent_writes.mark(user)
+
+    async def mark_write_async(self, user: str) -> None:
+        if self.replicas:
+            await self.recent_writes.mark_async(user)
+
+    def set_health(self, replica: Replica, healthy: bool) -> None:
+        if healthy != replica.healthy:
+            if healthy:
+                logger.info(f"Replica {replica.name} is back, lag {replica.lag}s")
+            else:
+                logger.warning(f"Replica {replica.name} is out, lag {replica.lag}s")
+        replica.healthy = healthy
+
+    def on_error(self, replica: Replica, error: BaseException) -> None:
+        """Takes the replica out after a lost connection until the next check"""
+        if isinstance(error, OSError) or (
+            isinstance(error, DBAPIError) and error.connection_invalidated
+        ):
+            self.set_health(replica, False)
+
+    async def check(self, replica: Replica) -> bool:
+        try:
+            async with asyncio.timeout(self.check_timeout):
+                async with replica.engine.connect() as connection:
+                    lag = await connection.scalar(replica.lag_query())
+        # Any failure takes the replica out, the checks go on
+        except Exception as e:
+            logger.debug(f"Check of replica {replica.name} failed: {e!r}")
+            replica.lag = None
+            self.set_health(replica, False)
+            return False
+        replica.lag = float(lag)
+        self.set_health(replica, replica.lag <= self.max_lag)
+        return replica.healthy
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+
+    async def _run_checks(self) -> None:
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.check_interval)
+
+    def start(self) -> None:
+        """Starts the health checks, called on app startup"""
+        if self.replicas and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run_checks())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "primary_reads": self.primary_reads,
+            "recent_write_errors": self.recent_writes.errors,
+            "replicas": {
+                replica.name: {
+                    "weight": replica.weight,
+                    "healthy": replica.healthy,
+                    "lag": replica.lag,
+                    "reads": replica.reads,
+                }
+                for replica in self.replicas
+            },
+        }
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from functools import lru_cache
+from typing import Dict, NamedTuple, Tuple
+
+from jinja2 import Template
+
+from leaf.config.config import get_settings
+from leaf.config.jinja_config import env
+from leaf.mail import Mail
+
+# Recipient, name of the template in `EMAIL_TEMPLATES` and its parameters
+Email = Tuple[str, str, dict]
+
+
+class EmailTemplate(NamedTuple):
+    subject: str
+    body: str
+    # Template variable name and the setting with the URL template
+    # rendered with the same parameters as the body
+    urls: Dict[str, str] = {}
+
+
+EMAIL_TEMPLATES = {
+    "confirmation": EmailTemplate(
+        subject="Leaf account - email confirmation",
+        body="confirmation_email.html",
+        urls={"confirm_url": "CONFIRMATION_URL"},
+    ),
+    "password_reset": EmailTemplate(
+        subject="Leaf account - password reset",
+        body="password_reset.html",
+        urls={"reset_url": "PASSWORD_RESET_URL"},
+    ),
+}
+
+
+@lru_cache
+def get_url_template(source: str) -> Template:
+    return env.from_string(source)
+
+
+def compile_email_templates() -> None:
+    """Compiles all email templates upfront, e.g. when a worker starts"""
+    settings = get_settings()
+    for email_template in EMAIL_TEMPLATES.values():
+        env.get_template(email_template.body)
+        for setting in email_template.urls.values():
+            get_url_template(getattr(settings, setting))
+
+
+def compose_email(to: str, template_name: str, params: dict) -> Mail:
+    """Renders email queued with `queue_emails` into a MIME message"""
+    settings = get_settings()
+    email_template = EMAIL_TEMPLATES[template_name]
+    context = dict(params)
+    for name, setting in email_template.urls.items():
+        context[name] = get_url_template(getattr(settings, setting)).render(params)
+    message = MIMEMultipart("alternative")
+    message["Subject"] = email_template.subject
+    message["From"] = settings.SMTP_CONFIG["EMAIL"]
+    message["To"] = to
+    message.attach(
+        MIMEText(env.get_template(email_template.body).render(context), "html"),
+    )
+    return to, message.as_string()
@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import smtplib
+import socket
+import ssl
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import orjson
+from redis import Redis
+
+from leaf.config.config import get_settings
+from leaf.config.logger import logger
+
+settings = get_settings()
+
+# Recipient and the whole MIME message
+Mail = Tuple[str, str]
+
+# Errors after which the connection is reopened and the message sent again
+TRANSIENT_SMTP_ERRORS = (
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    smtplib.SMTPHeloError,
+    socket.timeout,
+    ConnectionError,
+)
+
+
+class TokenBucket:
+    """Rate limiter which allows bursts of up to `capacity` calls
+
+    Tokens are refilled at `rate` per second, `acquire` blocks until
+    a token is available.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: int,
+        timer: Callable[[], float] = monotonic,
+        sleeper: Callable[[float], None] = sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.timer = timer
+        self.sleeper = sleeper
+        self.tokens = float(capacity)
+        self.updated_at = timer()
+        self._lock = Lock()
+
+    def _refill(self) -> None:
+        now = self.timer()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated_at) * self.rate,
+        )
+        self.updated_at = now
+
+    def acquire(self) -> float:
+        """Takes a token, returns number of seconds spent waiting for it"""
+        waited = 0.0
+        with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+                self.sleeper(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= 1
+        return waited
+
+
+def is_transient_error(error: Exception) -> bool:
+    if isinstance(error, TRANSIENT_SMTP_ERRORS):
+        return True
+    # 4xx replies are temporary, e.g. 421 too many connections
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    return False
+
+
+class SMTPDispatcher:
+    """Sends mails over a single authenticated SMTP connection
+
+    The connection is opened on the first send and reused by the following
+    ones, so TLS handshake and login happen once per process instead of
+    once per mail. It is reopened when the server closes it or after
+    `idle_timeout` seconds without sending. Transient failures are retried
+    with exponential backoff, permanent ones (5xx replies) are not.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        rate_limit: Optional[TokenBucket] = None,
+        max_retries: int = 3,
+        retry_backoff: float = 1.0,
+        idle_timeout: float = 60,
+        timeout: float = 30,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        sleeper: Callable[[float], None] = sleep,
+    ):
+        self.config = config
+        self.rate_limit = rate_limit
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.sleeper = sleeper
+        self.connections_opened = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._connection: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._lock = Lock()
+
+    def _open(self) -> smtplib.SMTP:
+        host, port = self.config["HOST"], int(self.config["PORT"])
+        security = self.config.get("SECURITY", "starttls")
+        if security == "ssl":
+            connection = smtplib.SMTP_SSL(
+                host,
+                port,
+                timeout=self.timeout,
+                context=self.ssl_context,
+            )
+        else:
+            connection = smtplib.SMTP(host, port, timeout=self.timeout)
+            if security == "starttls":
+                connection.starttls(context=self.ssl_context)
+        if self.config.get("USERNAME"):
+            connection.login(self.config["USERNAME"], self.config["PASSWORD"])
+        self.connections_opened += 1
+        logger.debug(f"SMTP connection opened to {host}:{port}")
+        return connection
+
+    def _get_connection(self) -> smtplib.SMTP:
+        if (
+            self._connection is not None
+            and monotonic() - self._last_used > self.idle_timeout
+        ):
+            # Servers drop idle clients, don't wait for a failed send
+            self.close()
+        if self._connection is None:
+            self._connection = self._open()
+        return self._connection
+
+    def close(self) -> None:
+        if self._connection is None:
+            return
+        try:
+            self._connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self._connection.close()
+        self._connection = None
+
+    def _send_one(self, to: str, msg: str) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._get_connection().sendmail(self.config["EMAIL"], to, msg)
+                self._last_used = monotonic()
+                return
+            except (smtplib.SMTPException, OSError) as error:
+                if not is_transient_error(error) or attempt == self.max_retries:
+                    raise
+                self.retried += 1
+                delay = self.retry_backoff * 2**attempt
+                logger.warning(
+                    f"Sending mail failed with {error!r}, retrying in {delay}s",
+                    extra={"user": to},
+                )
+                self.close()
+                self.sleeper(delay)
+
+    def send(self, mails: Sequence[Mail]) -> List[Mail]:
+        """Sends mails one after another over the shared connection
+
+        Returns: mails which failed with a transient error after all retries,
+        they can be sent again later
+        """
+        postponed = []
+        with self._lock:
+            for mail in mails:
+                to, msg = mail
+                if self.rate_limit is not None:
+                    self.rate_limit.acquire()
+                try:
+                    self._send_one(to, msg)
+                except (smtplib.SMTPException, OSError) as error:
+                    self.failed += 1
+                    if is_transient_error(error):
+                        postponed.append(mail)
+                    logger.error(
+                        f"Mail not sent: {error!r}",
+                        extra={"user": to},
+                    )
+                    continue
+                self.sent += 1
+                logger.debug("Message sent", extra={"user": to})
+        return postponed
+
+    def stats(self) -> dict:
+        return {
+            "connections_opened": self.connections_opened,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+class MailOutbox:
+    """Queue of emails waiting for delivery, shared by API and Celery processes
+
+    Emails are kept in a Redis list as JSON arrays, so a worker can take
+    many of them at once and send them as a batch.
+    """
+
+    def __init__(self, client: Redis, key: str = "leaf:mail:outbox"):
+        self.client = client
+        self.key = key
+
+    def push(self, items: Sequence[tuple]) -> None:
+        if items:
+            self.client.rpush(self.key, *(orjson.dumps(item) for item in items))
+
+    def pop(self, count: int) -> List[tuple]:
+        raw_items = self.client.lpop(self.key, count) or []
+        return [tuple(orjson.loads(raw)) for raw in raw_items]
+
+    def __len__(self) -> int:
+        return self.client.llen(self.key)
+
+
+def create_mail_dispatcher() -> SMTPDispatcher:
+    return SMTPDispatcher(
+        settings.SMTP_CONFIG,
+        rate_limit=TokenBucket(settings.MAIL_RATE_LIMIT, settings.MAIL_RATE_BURST),
+        max_retries=settings.MAIL_MAX_RETRIES,
+        retry_backoff=settings.MAIL_RETRY_BACKOFF,
+        idle_timeout=settings.MAIL_IDLE_TIMEOUT,
+    )
+
+
+# Created on first use, so every worker process has its own connection
+mail_dispatcher: Optional[SMTPDispatcher] = None
+mail_outbox: Optional[MailOutbox] = None
+
+
+def get_mail_dispatcher() -> SMTPDispatcher:
+    global mail_dispatcher
+    if mail_dispatcher is None:
+        mail_dispatcher = create_mail_dispatcher()
+    return mail_dispatcher
+
+
+def get_mail_outbox() -> MailOutbox:
+    global mail_outbox
+    if mail_outbox is None:
+        mail_outbox = MailOutbox(Redis.from_url(settings.MAIL_OUTBOX_REDIS_URL))
+    return mail_outbox
+
+
+def set_mail_outbox(outbox: Optional[MailOutbox]) -> None:
+    """Replaces the outbox, e.g. with fakeredis in tests"""
+    global mail_outbox
+    mail_outbox = outbox
+
+
+def close_mail_dispatcher() -> None:
+    global mail_dispatcher
+    if mail_dispatcher is not None:
+        mail_dispatcher.close()
+        mail_dispatcher = None
@@ -1,10 +1,16 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request
+from starlette import status
 
+from leaf.auth import password_hashing_executor
+from leaf.cache import get_tile_cache, get_token_version_cache, get_user_cache
 from leaf.config.config import get_settings
-from leaf.routers import users
+from leaf.config.database import get_replica_router
+from leaf.config.executors import ExecutorSaturated
+from leaf.config.metrics import MetricsMiddleware, mark_process_dead
+from leaf.responses import JSONResponse
+from leaf.routers import admin, media, metrics, posts, threats, users
 
 settings = get_settings()
 
@@ -13,14 +19,62 @@ app = FastAPI(
     title="Leaf",
     description="Let's clean up your neighbourhood together",
     version="0.0.1",
+    default_response_class=JSONResponse,
     contact={
         "name": "Roland Sobczak",
         "email": "rolandsobczak@icloud.com",
     },
 )
+app.add_middleware(MetricsMiddleware)
 app.include_router(users.router)
-app.mount(
-    settings.MEDIA_BASE_URL,
-    StaticFiles(directory=settings.MEDIA_FOLDER),
-    name="media",
-)
+app.include_router(threats.router)
+app.include_router(posts.router)
+app.include_router(admin.router)
+app.include_router(metrics.router)
+app.include_router(media.router, prefix=settings.MEDIA_BASE_URL)
+
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(
+    request: Request,
+    exc: ExecutorSaturated,
+) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Server is busy, try again later"},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.on_event("startup")
+def start_caches():
+    get_user_cache().start()
+    get_tile_cache().start()
+    get_token_version_cache().start()
+
+
+@app.on_event("shutdown")
+def stop_caches():
+    get_user_cache().stop()
+    get_tile_cache().stop()
+    get_token_version_cache().stop()
+
+
+@app.on_event("startup")
+def start_replica_checks():
+    get_replica_router().start()
+
+
+@app.on_event("shutdown")
+def stop_replica_checks():
+    get_replica_router().stop()
+
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    password_hashing_executor.shutdown()
+
+
+@app.on_event("shutdown")
+def remove_process_metrics():
+    mark_process_dead()
@@ -1,37 +1,276 @@
 from __future__ import annotations
 
-from glob import glob
-from os import makedirs, path, remove
-from pathlib import Path
-from typing import Annotated
+import hashlib
+from collections import defaultdict
+from pathlib import Path, PurePosixPath
+from time import time
+from typing import Annotated, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
 
-from fastapi import Depends, Header, HTTPException
+import anyio
+from fastapi import Header, HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
 from starlette import status
 
-from leaf.config.config import Settings, get_settings
+from leaf.config.config import get_settings
+from leaf.storage import StorageBackend, StoredObject
 
+# Images are content addressed, stored as `images/{digest[:2]}/{digest}.{ext}`
+# where digest is SHA-256 of the uploaded file. Files in this directory
+# never change, so they are served with long-lived cache headers.
+IMAGES_DIRECTORY = "images"
+# Complete uploads waiting to be moved to `IMAGES_DIRECTORY`
+UPLOADS_DIRECTORY = "uploads"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
-def get_resource_absolute_path(
-    relative_resource_path: Path,
-    settings: Settings = Depends(get_settings),
-):
-    return Path("/", settings.MEDIA_FOLDER, *relative_resource_path.parts)
+# Multipart boundaries and part headers sent together with the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Number of bytes needed to recognize every format in `sniff_image_format`
+IMAGE_SIGNATURE_SIZE = 12
+
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+
+def get_image_resource_key(digest: str, image_format: str) -> str:
+    return f"{IMAGES_DIRECTORY}/{digest[:2]}/{digest}.{image_format}"
+
+
+def get_resized_resource_key(resource_key: str, height: int | str) -> str:
+    key = PurePosixPath(resource_key)
+    return str(key.with_name(f"{height}_{key.name}"))
+
+
+def is_immutable_resource(resource_key: str) -> bool:
+    return resource_key.startswith(f"{IMAGES_DIRECTORY}/")
+
+
+def _get_digest(resource_key: str) -> str:
+    return PurePosixPath(resource_key).stem.rsplit("_", 1)[-1]
 
 
-def create_media_resource(absolute_resource_path: Path, file: bytes):
-    directory = absolute_resource_path.parent
-    if not path.exists(directory):
-        makedirs(directory)
-    with open(absolute_resource_path, "wb") as handler:
-        handler.write(file)
+def _store_image(storage: StorageBackend, resource_key: str, upload_key: str) -> bool:
+    default_height = list(get_settings().IMAGE_SIZES.values())[0][1]
+    for key in (get_resized_resource_key(resource_key, default_height), resource_key):
+        if storage.stat(key) is None:
+            continue
+        # Same image was uploaded before. Garbage collection keeps all files
+        # of an image when any of them is recent, so touching one is enough.
+        try:
+            storage.touch(key)
+        except FileNotFoundError:
+            # Upload was just resized and removed
+            continue
+        storage.delete([upload_key])
+        return False
+    storage.move(upload_key, resource_key)
+    return True
 
 
-def flush_old_media_resources(absolute_resource_path: Path):
-    old_user_images = glob(
-        f"{str(absolute_resource_path.parent)}/*{str(absolute_resource_path.stem)}.*",
+async def create_media_resource(
+    storage: StorageBackend,
+    resource_key: str,
+    upload_key: str,
+) -> bool:
+    """Moves uploaded file received by `receive_image_upload` to its place
+
+    Returns: False when the same content is already stored, the upload is
+    dropped then and doesn't have to be processed again
+    """
+    return await anyio.to_thread.run_sync(
+        _store_image,
+        storage,
+        resource_key,
+        upload_key,
     )
-    for file in old_user_images:
-        remove(file)
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """Recognizes image format from the magic bytes at the beginning of the file
+
+    Returns: file extension of the format or None if it isn't a supported image
+    """
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header[4:8] == b"ftyp" and header[8:12] in (b"avif", b"avis"):
+        return "avif"
+    return None
+
+
+def _require_image_format(header: bytes) -> str:
+    image_format = sniff_image_format(header)
+    if image_format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Unsupported image format",
+        )
+    return image_format
+
+
+class MultipartFileField:
+    """Collects data of a single file field from a streamed multipart body"""
+
+    def __init__(self, field_name: str):
+        self.field_name = field_name
+        self.found = False
+        self._in_field = False
+        self._header_name = b""
+        self._header_value = b""
+        self._content_disposition = b""
+        self._chunks: List[bytes] = []
+
+    def on_part_begin(self) -> None:
+        self._content_disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._content_disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._content_disposition)
+        self._in_field = (
+            not self.found
+            and options.get(b"name") == self.field_name.encode()
+            and b"filename" in options
+        )
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_field:
+            self._chunks.append(data[start:end])
+
+    def on_part_end(self) -> None:
+        if self._in_field:
+            self._in_field = False
+            self.found = True
+
+    def pop_chunks(self) -> List[bytes]:
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+
+async def receive_image_upload(
+    request: Request,
+    field_name: str,
+    storage: StorageBackend,
+    max_size: int,
+) -> Tuple[str, str, str]:
+    """Streams image from multipart request field to the media storage
+
+    Body is never held in memory as a whole, chunks are passed to the
+    storage writer as they arrive. Upload is aborted with 413 as soon as it
+    exceeds `max_size` bytes and with 415 when its magic bytes don't match
+    any supported image format.
+
+    Returns: key of the upload in `UPLOADS_DIRECTORY`, image format and
+    SHA-256 hex digest of the file
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > max_size + MULTIPART_OVERHEAD:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File is too large! Maximum size is {max_size} bytes",
+        )
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Multipart form data expected",
+        )
+
+    field = MultipartFileField(field_name)
+    parser = MultipartParser(params[b"boundary"], field.callbacks())
+    upload_key = f"{UPLOADS_DIRECTORY}/{uuid4().hex}"
+    writer = await anyio.to_thread.run_sync(storage.open_writer, upload_key)
+    size = 0
+    digest = hashlib.sha256()
+    header = b""
+    image_format = None
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for data in field.pop_chunks():
+                size += len(data)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File is too large! Maximum size is {max_size} bytes",
+                    )
+                if image_format is None:
+                    header += data
+                    if len(header) >= IMAGE_SIGNATURE_SIZE:
+                        image_format = _require_image_format(header)
+                digest.update(data)
+                await anyio.to_thread.run_sync(writer.write, data)
+        if not field.found:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"File field '{field_name}' is required",
+            )
+        if image_format is None:
+            image_format = _require_image_format(header)
+        await anyio.to_thread.run_sync(writer.commit)
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            await anyio.to_thread.run_sync(writer.abort)
+        raise
+    return upload_key, image_format, digest.hexdigest()
+
+
+def remove_unreferenced_media(
+    storage: StorageBackend,
+    referenced_resources: Iterable[str],
+    grace_period: float,
+    now: Optional[float] = None,
+) -> List[str]:
+    """Removes stored images which are not referenced anymore
+
+    Files modified within `grace_period` seconds are kept, because their
+    reference may not be saved yet. Abandoned uploads are removed as well.
+
+    Returns: keys of removed files
+    """
+    deadline = (time() if now is None else now) - grace_period
+    referenced = {_get_digest(resource) for resource in referenced_resources}
+    images: Dict[str, List[StoredObject]] = defaultdict(list)
+    for stored in storage.list(f"{IMAGES_DIRECTORY}/"):
+        images[_get_digest(stored.key)].append(stored)
+    removed = []
+    for digest, files in images.items():
+        if digest in referenced or max(file.modified for file in files) > deadline:
+            continue
+        removed.extend(file.key for file in files)
+    for upload in storage.list(f"{UPLOADS_DIRECTORY}/"):
+        if upload.modified <= deadline:
+            removed.append(upload.key)
+    storage.delete(removed)
+    return removed
 
 
 def get_media_image_url(
@@ -55,3 +294,56 @@ async def get_image_size(
         status_code=status.HTTP_400_BAD_REQUEST,
         detail=f"Wrong image size! Available sizes are: {settings.AVAILABLE_IMAGE_SIZES}",
     )
+
+
+# Modern formats produced by `resize_image` next to the original one
+IMAGE_VARIANT_MEDIA_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+}
+
+
+def get_accepted_media_types(accept: Optional[str]) -> set:
+    accepted = set()
+    for media_range in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if media_type and quality > 0:
+            accepted.add(media_type.lower())
+    return accepted
+
+
+def negotiate_image_variant(
+    storage: StorageBackend,
+    resource_key: str,
+    accept: Optional[str],
+) -> Optional[StoredObject]:
+    """Picks the smallest existing variant of the image which client accepts
+
+    Modern formats have to be listed explicitly in the `Accept` header,
+    the original format is always acceptable.
+
+    Returns: picked stored object or None if image doesn't exist
+    """
+    accepted = get_accepted_media_types(accept)
+    candidates = [resource_key]
+    for extension, media_type in IMAGE_VARIANT_MEDIA_TYPES.items():
+        if media_type in accepted:
+            candidates.append(
+                str(PurePosixPath(resource_key).with_suffix(f".{extension}")),
+            )
+    existing = [
+        stored
+        for stored in (storage.stat(candidate) for candidate in candidates)
+        if stored is not None
+    ]
+    if not existing:
+        return None
+    return min(existing, key=lambda stored: stored.size)
@@ -1,6 +1,7 @@
 from leaf.models.comments import Comment
 from leaf.models.like import Like
 from leaf.models.post import Post
+from leaf.models.session import UserSession
 from leaf.models.threat import Threat
 from leaf.models.threat_category import ThreatCategory
 from leaf.models.user import Group, GroupMembership, User
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from sqlalchemy import ForeignKey, String
+from sqlalchemy import ForeignKey, String, Update, event, update
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from leaf.config.database import Base
 from leaf.models.mixins import TimestampedMixin
+from leaf.models.post import Post
 
 
 class Comment(TimestampedMixin, Base):
@@ -17,6 +18,24 @@ class Comment(TimestampedMixin, Base):
     )
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     user: Mapped["User"] = relationship(back_populates="comments", uselist=False)
-    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id"))
+    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id"), index=True)
     post: Mapped["Post"] = relationship(back_populates="comments", uselist=False)
     content: Mapped[str] = mapped_column(String(255))
+
+
+def update_comment_count(post_id: int, delta: int) -> Update:
+    return (
+        update(Post.__table__).where(Post.id == post_id)
+        # Post itself isn't modified, so updated_at is kept
+        .values(comment_count=Post.comment_count + delta, updated_at=Post.updated_at)
+    )
+
+
+@event.listens_for(Comment, "after_insert")
+def _increment_comment_count(mapper, connection, target: Comment):
+    connection.execute(update_comment_count(target.post_id, 1))
+
+
+@event.listens_for(Comment, "after_delete")
+def _decrement_comment_count(mapper, connection, target: Comment):
+    connection.execute(update_comment_count(target.post_id, -1))
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, UniqueConstraint, Update, event, update
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from leaf.config.database import Base
 from leaf.models.mixins import TimestampedMixin
+from leaf.models.post import Post
 
 
 class Like(TimestampedMixin, Base):
     __tablename__ = "likes"
+    # A user likes a post at most once
+    __table_args__ = (UniqueConstraint("user_id", "post_id"),)
 
     id: Mapped[int] = mapped_column(
         autoincrement=True,
@@ -17,5 +20,23 @@ class Like(TimestampedMixin, Base):
     )
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     user: Mapped["User"] = relationship(back_populates="likes", uselist=False)
-    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id"))
+    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id"), index=True)
     post: Mapped["Post"] = relationship(back_populates="likes", uselist=False)
+
+
+def update_like_count(post_id: int, delta: int) -> Update:
+    return (
+        update(Post.__table__).where(Post.id == post_id)
+        # Post itself isn't modified, so updated_at is kept
+        .values(like_count=Post.like_count + delta, updated_at=Post.updated_at)
+    )
+
+
+@event.listens_for(Like, "after_insert")
+def _increment_like_count(mapper, connection, target: Like):
+    connection.execute(update_like_count(target.post_id, 1))
+
+
+@event.listens_for(Like, "after_delete")
+def _decrement_like_count(mapper, connection, target: Like):
+    connection.execute(update_like_count(target.post_id, -1))
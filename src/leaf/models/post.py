@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import Optional
 
-from sqlalchemy import ForeignKey, String
+from sqlalchemy import ForeignKey, Index, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from leaf.config.database import Base
@@ -11,6 +11,12 @@ from leaf.models.mixins import TimestampedMixin
 
 class Post(TimestampedMixin, Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        # Feed is ordered by creation time, id breaks ties
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        # Home feed reads newest posts of chosen authors
+        Index("ix_posts_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(
         autoincrement=True,
@@ -26,3 +32,6 @@ class Post(TimestampedMixin, Base):
     likes: Mapped["Like"] = relationship(back_populates="post")
     threat_id: Mapped[int] = mapped_column(ForeignKey("threats.id"))
     threat: Mapped["Threat"] = relationship(back_populates="posts", uselist=False)
+    # Kept up to date by Like and Comment events, repaired by a periodic task
+    like_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    comment_count: Mapped[int] = mapped_column(default=0, server_default="0")
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, Index, String, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from leaf.config.database import Base
+from leaf.models.mixins import TimestampedMixin
+
+
+class UserSession(TimestampedMixin, Base):
+    """Session started by a login, refreshed with rotating refresh tokens"""
+
+    __tablename__ = "user_sessions"
+    __table_args__ = (
+        # Revocation lists without Redis read sessions revoked recently
+        Index(
+            "ix_user_sessions_revoked_at",
+            "revoked_at",
+            postgresql_where=text("revoked_at IS NOT NULL"),
+        ),
+    )
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    # SHA-256 of the latest refresh token, earlier tokens of the session are
+    # reused ones
+    token_hash: Mapped[str] = mapped_column(String(64))
+    # Token version of the user at login, the session ends when it changes
+    token_version: Mapped[int]
+    expires_at: Mapped[datetime]
+    revoked_at: Mapped[datetime] = mapped_column(nullable=True)
@@ -1,5 +1,5 @@
 from geoalchemy2 import Geometry
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import Column, ForeignKey, Index, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from leaf.config.database import Base
@@ -13,10 +13,24 @@ class Threat(Base):
         primary_key=True,
         index=True,
     )
-    location = Column(Geometry("POINT"))
-    category_id: Mapped[int] = mapped_column(ForeignKey("threat_categories.id"))
+    # Longitude and latitude in WGS 84, indexes are declared below
+    location = Column(Geometry("POINT", spatial_index=False))
+    category_id: Mapped[int] = mapped_column(
+        ForeignKey("threat_categories.id"),
+        index=True,
+    )
     category: Mapped["ThreatCategory"] = relationship(
         back_populates="threats",
         uselist=False,
     )
     posts: Mapped["Post"] = relationship(back_populates="threat")
+
+
+# Bounding box queries compare geometries
+Index("idx_threats_location", Threat.location, postgresql_using="gist")
+# Radius queries measure distance in meters on the sphere
+Index(
+    "idx_threats_location_geography",
+    func.geography(Threat.location),
+    postgresql_using="gist",
+)
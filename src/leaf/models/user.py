@@ -19,12 +19,23 @@ class PermissionsType(enum.Enum):
     modify_threats = 32
 
 
+# Names and values of permissions, reading them from the enum is slow
+PERMISSION_VALUES = tuple(
+    (permission.name, permission.value) for permission in PermissionsType
+)
+
+
 class GroupMembership(TimestampedMixin, Base):
     __tablename__ = "groups_users"
 
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
     # user: Mapped["User"] = relationship()
-    group_id: Mapped[int] = mapped_column(ForeignKey("groups.id"), primary_key=True)
+    # Primary key starts with user_id, members of a group need their own index
+    group_id: Mapped[int] = mapped_column(
+        ForeignKey("groups.id"),
+        primary_key=True,
+        index=True,
+    )
     # group: Mapped["Group"] = relationship()
 
 
@@ -46,21 +57,37 @@ class User(TimestampedMixin, Base):
     comments: Mapped["Comment"] = relationship(back_populates="user")
     likes: Mapped["Like"] = relationship(back_populates="user")
     permissions: Mapped[int] = mapped_column(default=0)
-    groups: Mapped["Group"] = relationship(
+    # Incremented to revoke access tokens with claims issued before
+    token_version: Mapped[int] = mapped_column(default=0, server_default="0")
+    groups: Mapped[List["Group"]] = relationship(
         secondary="groups_users",
         back_populates="users",
     )
 
+    @property
+    def permission_mask(self) -> int:
+        """User's own permissions ORed with permissions of the user's groups
+
+        Same mask as the one of the user's profile, loads the groups if they
+        weren't loaded yet.
+        """
+        mask = self.permissions or 0
+        for group in self.groups:
+            mask |= group.permissions
+        return mask
+
     def check_permissions(self, permission: int) -> bool:
         """Checks if User have specified permission using & byte operator
 
+        Permissions granted by the user's groups count as well.
+
         Args:
             permission (int): Permission to check,
             Should be a value from PermissionsType Enum
 
         Returns: True if user have permission, False if User doesn't have
         """
-        return bool(self.permissions & permission)
+        return bool(self.permission_mask & permission)
 
     @property
     def mapped_permissions(self) -> dict:
@@ -78,10 +105,8 @@ class User(TimestampedMixin, Base):
         Returns: dict with mapped permissions
 
         """
-        return {
-            permission.name: self.check_permissions(permission.value)
-            for permission in PermissionsType
-        }
+        mask = self.permission_mask
+        return {name: bool(mask & value) for name, value in PERMISSION_VALUES}
 
 
 class Group(TimestampedMixin, Base):
@@ -94,7 +119,7 @@ class Group(TimestampedMixin, Base):
     )
     name: Mapped[str] = mapped_column(String(255), unique=True)
     permissions: Mapped[int]
-    users: Mapped["User"] = relationship(
+    users: Mapped[List["User"]] = relationship(
         secondary="groups_users",
         back_populates="groups",
     )
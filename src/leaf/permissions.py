@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+from leaf.models.user import PermissionsType
+from leaf.schemas.users import PermissionsSchema
+
+# Mask with every permission set
+ALL_PERMISSIONS = sum(permission.value for permission in PermissionsType)
+
+
+def permission_mask(*permissions: PermissionsType) -> int:
+    mask = 0
+    for permission in permissions:
+        mask |= permission.value
+    return mask
+
+
+def has_permission(mask: int, permission: PermissionsType) -> bool:
+    return mask & permission.value == permission.value
+
+
+@lru_cache(maxsize=ALL_PERMISSIONS + 1)
+def decode_permissions(mask: int) -> PermissionsSchema:
+    """Permissions of the mask by name, built once for every mask
+
+    There are only as many masks as combinations of `PermissionsType`, so
+    all of them fit in the cache. The schema is immutable, it is shared
+    by all users with the same permissions.
+    """
+    return PermissionsSchema(
+        mask=mask,
+        **{
+            permission.name: bool(mask & permission.value)
+            for permission in PermissionsType
+        },
+    )
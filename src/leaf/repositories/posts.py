@@ -0,0 +1,405 @@
+from __future__ import annotations
+
+import base64
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import orjson
+from sqlalchemy import (
+    CTE,
+    Select,
+    delete,
+    exists,
+    func,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+
+from leaf.media import get_media_image_url
+from leaf.models import Comment, GroupMembership, Like, Post, Threat, User
+from leaf.models.like import update_like_count
+from leaf.schemas.posts import PostAuthorSchema, PostPageSchema, PostSchema
+from leaf.schemas.threats import ThreatSchema
+from leaf.timeline import TimelineEntry, TimelineStore, timeline_score
+
+# Creation time and id of the last post of the previous page
+FeedCursor = Tuple[datetime, int]
+
+
+def encode_feed_cursor(cursor: FeedCursor) -> str:
+    created_at, post_id = cursor
+    raw = orjson.dumps([created_at.isoformat(), post_id])
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_feed_cursor(cursor: str) -> FeedCursor:
+    """Raises ValueError if the cursor wasn't created by `encode_feed_cursor`"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, post_id = orjson.loads(raw)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (TypeError, ValueError, orjson.JSONDecodeError) as error:
+        raise ValueError(f"Invalid feed cursor: {cursor}") from error
+
+
+def _select_page_columns() -> Select:
+    return select(
+        Post.id,
+        Post.user_id,
+        Post.threat_id,
+        Post.content,
+        Post.image,
+        Post.created_at,
+        Post.like_count,
+        Post.comment_count,
+    )
+
+
+def _select_page_posts(page: CTE, user_id: int) -> Select:
+    # Page of posts is selected first, so joins and the "liked by me"
+    # check are done only for the posts of the page
+    liked_by_me = exists().where(Like.user_id == user_id, Like.post_id == page.c.id)
+    return (
+        select(
+            page.c.id,
+            page.c.content,
+            page.c.image,
+            page.c.created_at,
+            User.id.label("author_id"),
+            User.first_name,
+            User.last_name,
+            User.profile_image,
+            Threat.id.label("threat_id"),
+            Threat.category_id,
+            func.ST_X(Threat.location).label("longitude"),
+            func.ST_Y(Threat.location).label("latitude"),
+            page.c.like_count,
+            page.c.comment_count,
+            liked_by_me.label("liked_by_me"),
+        )
+        .select_from(page)
+        .join(Threat, Threat.id == page.c.threat_id)
+        .outerjoin(User, User.id == page.c.user_id)
+        .order_by(page.c.created_at.desc(), page.c.id.desc())
+    )
+
+
+def _apply_feed_cursor(query: Select, cursor: Optional[FeedCursor], limit: int):
+    if cursor is not None:
+        query = query.where(tuple_(Post.created_at, Post.id) < tuple_(*cursor))
+    # One row more than requested is fetched to know if a next page exists
+    return query.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit + 1)
+
+
+def _select_feed(user_id: int, cursor: Optional[FeedCursor], limit: int) -> Select:
+    page = _apply_feed_cursor(_select_page_columns(), cursor, limit).cte("page")
+    return _select_page_posts(page, user_id)
+
+
+def _to_post_schema(row, image_size: Optional[int]) -> PostSchema:
+    author = None
+    if row.author_id is not None:
+        profile_image = None
+        if row.profile_image:
+            profile_image = get_media_image_url(Path(row.profile_image), image_size)
+        author = PostAuthorSchema(
+            id=row.author_id,
+            first_name=row.first_name,
+            last_name=row.last_name,
+            profile_image=profile_image,
+        )
+    return PostSchema(
+        id=row.id,
+        content=row.content,
+        image=row.image,
+        created_at=row.created_at,
+        author=author,
+        threat=ThreatSchema(
+            id=row.threat_id,
+            category_id=row.category_id,
+            longitude=row.longitude,
+            latitude=row.latitude,
+        ),
+        like_count=row.like_count,
+        comment_count=row.comment_count,
+        liked_by_me=row.liked_by_me,
+    )
+
+
+def _to_post_page(rows, limit: int, image_size: Optional[int]) -> PostPageSchema:
+    items = [_to_post_schema(row, image_size) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_feed_cursor((items[-1].created_at, items[-1].id))
+    return PostPageSchema(items=items, next_cursor=next_cursor)
+
+
+async def get_feed_async(
+    db: AsyncSession,
+    user_id: int,
+    cursor: Optional[FeedCursor] = None,
+    limit: int = 20,
+    image_size: Optional[int] = None,
+) -> PostPageSchema:
+    """Page of posts from the newest, with numbers of their likes and comments
+
+    The whole page is loaded with a single query.
+    """
+    rows = (await db.execute(_select_feed(user_id, cursor, limit))).all()
+    return _to_post_page(rows, limit, image_size)
+
+
+def _group_size(group_id):
+    return (
+        select(func.count())
+        .where(GroupMembership.group_id == group_id)
+        .scalar_subquery()
+    )
+
+
+def _select_home_posts(
+    user_id: int,
+    cursor: Optional[FeedCursor],
+    limit: int,
+    min_group_size: Optional[int] = None,
+) -> Select:
+    """Ids and creation times of posts of the user and members of their groups
+
+    With `min_group_size` only posts of members of groups with more than
+    that many members are selected, and the user's own posts are not.
+    """
+    memberships = aliased(GroupMembership)
+    groups = select(memberships.group_id).where(memberships.user_id == user_id)
+    if min_group_size is not None:
+        groups = groups.where(_group_size(memberships.group_id) > min_group_size)
+    authors = select(GroupMembership.user_id).where(
+        GroupMembership.group_id.in_(groups),
+    )
+    condition = Post.user_id.in_(authors)
+    if min_group_size is None:
+        condition = or_(condition, Post.user_id == user_id)
+    return _apply_feed_cursor(
+        select(Post.id, Post.created_at).where(condition),
+        cursor,
+        limit,
+    )
+
+
+async def _get_home_entries_async(
+    db: AsyncSession,
+    user_id: int,
+    cursor: Optional[FeedCursor],
+    limit: int,
+    min_group_size: Optional[int] = None,
+) -> List[TimelineEntry]:
+    query = _select_home_posts(user_id, cursor, limit, min_group_size)
+    return [
+        (post_id, timeline_score(created_at))
+        for post_id, created_at in (await db.execute(query)).all()
+    ]
+
+
+async def get_home_feed_async(
+    db: AsyncSession,
+    user_id: int,
+    cursor: Optional[FeedCursor] = None,
+    limit: int = 20,
+    image_size: Optional[int] = None,
+    timeline: Optional[TimelineStore] = None,
+    max_group_size: int = 0,
+) -> PostPageSchema:
+    """Page of posts of the user and of members of the user's groups
+
+    With `timeline` the page is read from the user's precomputed timeline,
+    and only posts of members of groups larger than `max_group_size`, which
+    are not added to timelines, are still queried. Posts are found with
+    a query over group memberships (fan out on read) without `timeline`,
+    and for pages the timeline can't fill, i.e. posts older than the
+    timeline keeps or published before it was built.
+    """
+    entries: List[TimelineEntry] = []
+    if timeline is not None:
+        before = None
+        if cursor is not None:
+            before = (cursor[1], timeline_score(cursor[0]))
+        entries = await timeline.range_async(user_id, before, limit + 1)
+    if len(entries) <= limit:
+        entries = await _get_home_entries_async(db, user_id, cursor, limit)
+    else:
+        entries += await _get_home_entries_async(
+            db,
+            user_id,
+            cursor,
+            limit,
+            min_group_size=max_group_size,
+        )
+        entries = sorted(
+            set(entries),
+            key=lambda entry: (entry[1], entry[0]),
+            reverse=True,
+        )[: limit + 1]
+    if not entries:
+        return PostPageSchema(items=[])
+    page = (
+        _select_page_columns()
+        .where(Post.id.in_([post_id for post_id, _ in entries]))
+        .cte("page")
+    )
+    rows = (await db.execute(_select_page_posts(page, user_id))).all()
+    # Timelines may still contain deleted posts, the page is shorter then
+    items = [_to_post_schema(row, image_size) for row in rows[:limit]]
+    next_cursor = None
+    if len(entries) > limit and items:
+        next_cursor = encode_feed_cursor((items[-1].created_at, items[-1].id))
+    return PostPageSchema(items=items, next_cursor=next_cursor)
+
+
+def get_timeline_recipients(
+    db: Session,
+    post_id: int,
+    max_group_size: int,
+) -> Optional[Tuple[datetime, List[int]]]:
+    """Creation time of the post and users whose timelines should show it
+
+    Those are the author and members of the author's groups with at most
+    `max_group_size` members. Returns None if the post doesn't exist.
+    """
+    post = db.execute(
+        select(Post.user_id, Post.created_at).where(Post.id == post_id),
+    ).first()
+    if post is None:
+        return None
+    memberships = aliased(GroupMembership)
+    groups = select(memberships.group_id).where(
+        memberships.user_id == post.user_id,
+        _group_size(memberships.group_id) <= max_group_size,
+    )
+    recipients = set(
+        db.scalars(
+            select(GroupMembership.user_id)
+            .where(GroupMembership.group_id.in_(groups))
+            .distinct(),
+        ),
+    )
+    if post.user_id is not None:
+        recipients.add(post.user_id)
+    return post.created_at, sorted(recipients)
+
+
+async def like_post_async(
+    db: AsyncSession,
+    user_id: int,
+    post_id: int,
+) -> Optional[int]:
+    """Likes the post unless the user already likes it
+
+    Returns: number of likes of the post, None if the post doesn't exist
+    """
+    try:
+        inserted = (
+            await db.execute(
+                insert(Like)
+                .values(user_id=user_id, post_id=post_id)
+                .on_conflict_do_nothing(index_elements=["user_id", "post_id"])
+                .returning(Like.id),
+            )
+        ).first()
+    except IntegrityError:
+        # Foreign key of a missing post
+        await db.rollback()
+        return None
+    if inserted is None:
+        like_count = await db.scalar(select(Post.like_count).where(Post.id == post_id))
+    else:
+        like_count = await db.scalar(
+            update_like_count(post_id, 1).returning(Post.like_count),
+        )
+    await db.commit()
+    return like_count
+
+
+async def unlike_post_async(
+    db: AsyncSession,
+    user_id: int,
+    post_id: int,
+) -> Optional[int]:
+    """Removes like of the post, if the user likes it
+
+    Returns: number of likes of the post, None if the post doesn't exist
+    """
+    deleted = (
+        await db.execute(
+            delete(Like)
+            .where(Like.user_id == user_id, Like.post_id == post_id)
+            .returning(Like.id),
+        )
+    ).first()
+    if deleted is None:
+        like_count = await db.scalar(select(Post.like_count).where(Post.id == post_id))
+    else:
+        like_count = await db.scalar(
+            update_like_count(post_id, -1).returning(Post.like_count),
+        )
+    await db.commit()
+    return like_count
+
+
+def get_max_post_id(db: Session) -> int:
+    return db.scalar(select(func.max(Post.id))) or 0
+
+
+def repair_post_counts(db: Session, first_id: int, last_id: int) -> int:
+    """Sets like and comment counts of posts with ids in the range to the
+    real numbers of their likes and comments
+
+    Returns: number of posts which had wrong counts
+    """
+    # Likes and comments of the range are counted by one aggregate each
+    # instead of a subquery per post
+    like_counts = (
+        select(Like.post_id, func.count().label("count"))
+        .where(Like.post_id.between(first_id, last_id))
+        .group_by(Like.post_id)
+        .subquery("like_counts")
+    )
+    comment_counts = (
+        select(Comment.post_id, func.count().label("count"))
+        .where(Comment.post_id.between(first_id, last_id))
+        .group_by(Comment.post_id)
+        .subquery("comment_counts")
+    )
+    counts = (
+        select(
+            Post.id,
+            func.coalesce(like_counts.c.count, 0).label("like_count"),
+            func.coalesce(comment_counts.c.count, 0).label("comment_count"),
+        )
+        .outerjoin(like_counts, like_counts.c.post_id == Post.id)
+        .outerjoin(comment_counts, comment_counts.c.post_id == Post.id)
+        .where(Post.id.between(first_id, last_id))
+        .subquery("counts")
+    )
+    result = db.execute(
+        update(Post.__table__)
+        .where(
+            Post.id == counts.c.id,
+            or_(
+                Post.like_count != counts.c.like_count,
+                Post.comment_count != counts.c.comment_count,
+            ),
+        )
+        .values(
+            like_count=counts.c.like_count,
+            comment_count=counts.c.comment_count,
+            updated_at=Post.updated_at,
+        ),
+    )
+    db.commit()
+    return result.rowcount
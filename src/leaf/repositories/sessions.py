@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from typing import List, Optional
+
+from sqlalchemy import Row, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from leaf.models import User, UserSession
+
+
+async def create_session_async(
+    db: AsyncSession,
+    session_id: str,
+    user_id: int,
+    token_version: int,
+    token_hash: str,
+    expires_in: timedelta,
+) -> None:
+    db.add(
+        UserSession(
+            id=session_id,
+            user_id=user_id,
+            token_version=token_version,
+            token_hash=token_hash,
+            expires_at=func.now() + expires_in,
+        ),
+    )
+    await db.commit()
+
+
+async def rotate_session_async(
+    db: AsyncSession,
+    session_id: str,
+    token_hash: str,
+    new_token_hash: str,
+) -> Optional[Row]:
+    """Replaces the refresh token of the session with a single statement
+
+    The token is replaced only if it is the latest one of a live session of
+    an active user whose tokens were not revoked since the login, so two
+    requests with the same token can't both rotate it.
+
+    Returns: id, email and token version of the user, None if not rotated
+    """
+    result = await db.execute(
+        update(UserSession)
+        .where(
+            UserSession.id == session_id,
+            UserSession.token_hash == token_hash,
+            UserSession.revoked_at.is_(None),
+            UserSession.expires_at > func.now(),
+            User.id == UserSession.user_id,
+            User.disabled == False,
+            User.token_version == UserSession.token_version,
+        )
+        .values(token_hash=new_token_hash)
+        .returning(User.id, User.email, User.token_version),
+    )
+    row = result.first()
+    await db.commit()
+    return row
+
+
+async def get_session_async(
+    db: AsyncSession,
+    session_id: str,
+) -> Optional[UserSession]:
+    return await db.scalar(select(UserSession).where(UserSession.id == session_id))
+
+
+async def revoke_session_async(
+    db: AsyncSession,
+    session_id: str,
+    token_hash: Optional[str] = None,
+) -> bool:
+    """Revokes the session, only if its latest token has the hash if given
+
+    Returns: False if there is no such session or it was revoked before
+    """
+    conditions = [UserSession.id == session_id, UserSession.revoked_at.is_(None)]
+    if token_hash is not None:
+        conditions.append(UserSession.token_hash == token_hash)
+    result = await db.scalars(
+        update(UserSession)
+        .where(*conditions)
+        .values(revoked_at=func.now())
+        .returning(UserSession.id),
+    )
+    revoked = result.first() is not None
+    await db.commit()
+    return revoked
+
+
+def _revoked_within(seconds: float):
+    return UserSession.revoked_at > func.now() - timedelta(seconds=seconds)
+
+
+async def get_revoked_session_ids_async(
+    db: AsyncSession,
+    seconds: float,
+) -> List[str]:
+    """Ids of sessions revoked in the last `seconds`"""
+    result = await db.scalars(select(UserSession.id).where(_revoked_within(seconds)))
+    return list(result)
+
+
+async def is_session_revoked_async(
+    db: AsyncSession,
+    session_id: str,
+    seconds: float,
+) -> bool:
+    """Whether the session was revoked in the last `seconds`"""
+    return (
+        await db.scalar(
+            select(UserSession.id).where(
+                UserSession.id == session_id,
+                _revoked_within(seconds),
+            ),
+        )
+        is not None
+    )
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+from typing import Optional, Sequence
+
+from sqlalchemy import Integer, Select, String, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from leaf.models import Threat
+from leaf.schemas.threats import ThreatPageSchema, ThreatSchema
+from leaf.tiles import WEB_MERCATOR_SRID, tile_bounds, tile_size
+
+# Locations are stored without SRID and read as WGS 84 coordinates
+WGS84_SRID = 4326
+
+# Size of a vector tile in its own coordinates
+TILE_EXTENT = 4096
+# Points up to this distance outside of the tile are included as well,
+# so symbols on tile borders are not cut off
+TILE_BUFFER = 64
+# Clusters are built in a grid of this many cells per tile side
+TILE_CLUSTER_CELLS = 64
+
+
+def _select_threats(
+    category_ids: Optional[Sequence[int]],
+    after: Optional[int],
+    limit: int,
+) -> Select:
+    # Only coordinates are selected, so rows are not turned into ORM objects
+    # and geometries are not parsed in Python
+    query = (
+        select(
+            Threat.id,
+            Threat.category_id,
+            func.ST_X(Threat.location).label("longitude"),
+            func.ST_Y(Threat.location).label("latitude"),
+        )
+        .order_by(Threat.id)
+        .limit(limit + 1)
+    )
+    if category_ids:
+        query = query.where(Threat.category_id.in_(category_ids))
+    if after is not None:
+        query = query.where(Threat.id > after)
+    return query
+
+
+def _to_threat_page(rows: Sequence, limit: int) -> ThreatPageSchema:
+    # One row more than requested is fetched to know if a next page exists
+    items = [ThreatSchema(**row._mapping) for row in rows[:limit]]
+    next_cursor = items[-1].id if len(rows) > limit else None
+    return ThreatPageSchema(items=items, next_cursor=next_cursor)
+
+
+async def get_threats_in_radius_async(
+    db: AsyncSession,
+    longitude: float,
+    latitude: float,
+    radius: float,
+    category_ids: Optional[Sequence[int]] = None,
+    after: Optional[int] = None,
+    limit: int = 100,
+) -> ThreatPageSchema:
+    """Threats not further than `radius` meters from the point, ordered by id
+
+    Distance is measured on the geography type, which matches the
+    `idx_threats_location_geography` index.
+    """
+    center = func.geography(
+        func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), WGS84_SRID),
+    )
+    query = _select_threats(category_ids, after, limit).where(
+        func.ST_DWithin(func.geography(Threat.location), center, radius),
+    )
+    rows = (await db.execute(query)).all()
+    return _to_threat_page(rows, limit)
+
+
+async def get_threats_in_bbox_async(
+    db: AsyncSession,
+    min_longitude: float,
+    min_latitude: float,
+    max_longitude: float,
+    max_latitude: float,
+    category_ids: Optional[Sequence[int]] = None,
+    after: Optional[int] = None,
+    limit: int = 100,
+) -> ThreatPageSchema:
+    """Threats inside of the bounding box, ordered by id"""
+    envelope = func.ST_MakeEnvelope(
+        min_longitude,
+        min_latitude,
+        max_longitude,
+        max_latitude,
+    )
+    # For points bounding box overlap (&&) is the same as containment
+    query = _select_threats(category_ids, after, limit).where(
+        Threat.location.intersects(envelope),
+    )
+    rows = (await db.execute(query)).all()
+    return _to_threat_page(rows, limit)
+
+
+def _select_tile_points(z: int, x: int, y: int, buffer: int):
+    # Filtering in longitude and latitude uses idx_threats_location
+    bounds = func.ST_MakeEnvelope(*tile_bounds(z, x, y, buffer / TILE_EXTENT))
+    return select(
+        Threat.id,
+        Threat.category_id,
+        func.ST_Transform(
+            func.ST_SetSRID(Threat.location, WGS84_SRID),
+            WEB_MERCATOR_SRID,
+        ).label("geom"),
+    ).where(Threat.location.intersects(bounds))
+
+
+def _select_threat_features(z: int, x: int, y: int) -> Select:
+    points = _select_tile_points(z, x, y, TILE_BUFFER).subquery("points")
+    features = select(
+        points.c.id,
+        points.c.category_id,
+        func.ST_AsMVTGeom(
+            points.c.geom,
+            func.ST_TileEnvelope(z, x, y),
+            TILE_EXTENT,
+            TILE_BUFFER,
+        ).label("geom"),
+    ).subquery("threats")
+    return select(
+        func.ST_AsMVT(features.table_valued(), "threats", TILE_EXTENT, "geom", "id"),
+    )
+
+
+def _select_cluster_features(z: int, x: int, y: int) -> Select:
+    # Clusters are built only from points inside of the tile. The grid is
+    # aligned to tile borders, so no cluster is split between two tiles.
+    points = _select_tile_points(z, x, y, 0).subquery("points")
+    cell_size = tile_size(z) / TILE_CLUSTER_CELLS
+    # Snapping to the centers of the cells puts every point into the cell
+    # which contains it
+    cell = func.ST_SnapToGrid(
+        points.c.geom,
+        cell_size / 2,
+        cell_size / 2,
+        cell_size,
+        cell_size,
+    )
+    by_category = (
+        select(
+            cell.label("cell"),
+            points.c.category_id,
+            func.count().label("count"),
+            func.ST_Collect(points.c.geom).label("geom"),
+        )
+        .group_by(cell, points.c.category_id)
+        .subquery("by_category")
+    )
+    # Keys of the jsonb column become properties of the feature,
+    # e.g. `category_3: 12`
+    clusters = (
+        select(
+            func.ST_AsMVTGeom(
+                func.ST_Centroid(func.ST_Collect(by_category.c.geom)),
+                func.ST_TileEnvelope(z, x, y),
+                TILE_EXTENT,
+                0,
+            ).label("geom"),
+            func.sum(by_category.c.count).cast(Integer).label("count"),
+            func.jsonb_object_agg(
+                literal("category_") + by_category.c.category_id.cast(String),
+                by_category.c.count,
+            ).label("categories"),
+        )
+        .group_by(by_category.c.cell)
+        .subquery("clusters")
+    )
+    return select(
+        func.ST_AsMVT(clusters.table_valued(), "clusters", TILE_EXTENT, "geom"),
+    )
+
+
+async def get_threat_tile_async(
+    db: AsyncSession,
+    z: int,
+    x: int,
+    y: int,
+    cluster_max_zoom: int,
+) -> bytes:
+    """Mapbox Vector Tile with threats inside of the tile
+
+    Up to `cluster_max_zoom` the tile has a `clusters` layer with number of
+    threats of every category in a grid cell, above it a `threats` layer
+    with single threats.
+    """
+    if z <= cluster_max_zoom:
+        query = _select_cluster_features(z, x, y)
+    else:
+        query = _select_threat_features(z, x, y)
+    tile = (await db.execute(query)).scalar()
+    return bytes(tile) if tile is not None else b""
@@ -1,50 +1,91 @@
 from __future__ import annotations
 
-from typing import Optional
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Set
 
-from sqlalchemy import update
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import Row, Select, func, null, select, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
+from leaf.cache import (
+    invalidate_token_version,
+    invalidate_token_version_async,
+    invalidate_user,
+    invalidate_user_async,
+)
 from leaf.media import get_media_image_url
-from leaf.models import User
+from leaf.models import Group, GroupMembership, User
+from leaf.permissions import decode_permissions
 from leaf.schemas.users import GroupProfileSchema, UserSchema
 
 
+def select_user_profiles() -> Select:
+    """Columns of `UserSchema` with groups of the user aggregated into the row
+
+    Group ids and names are arrays in the same order, so a profile is one row
+    which is turned into the schema without loading an ORM instance.
+    """
+    has_group = Group.id.is_not(None)
+    return (
+        select(
+            User.id,
+            User.email,
+            User.first_name,
+            User.last_name,
+            User.disabled,
+            User.profile_image,
+            # User's own mask ORed with masks of the joined groups
+            User.permissions.bitwise_or(
+                func.coalesce(func.bit_or(Group.permissions), 0),
+            ).label("permission_mask"),
+            func.array_agg(aggregate_order_by(Group.id, Group.id))
+            .filter(has_group)
+            .label("group_ids"),
+            func.array_agg(aggregate_order_by(Group.name, Group.id))
+            .filter(has_group)
+            .label("group_names"),
+        )
+        .outerjoin(GroupMembership, GroupMembership.user_id == User.id)
+        .outerjoin(Group, Group.id == GroupMembership.group_id)
+        .group_by(User.id)
+    )
+
+
+def _to_user_schema(row: Row, image_size: Optional[int] = None) -> UserSchema:
+    """Builds the schema from a row of `select_user_profiles`
+
+    Values come from the database, so they are not validated again.
+    """
+    user_image = None
+    if profile_image := row.profile_image:
+        user_image = get_media_image_url(Path(profile_image), image_size)
+    groups = []
+    if row.group_ids:
+        groups = [
+            GroupProfileSchema.construct(id=group_id, name=name)
+            for group_id, name in zip(row.group_ids, row.group_names)
+        ]
+    return UserSchema.construct(
+        id=row.id,
+        email=row.email,
+        first_name=row.first_name,
+        last_name=row.last_name,
+        disabled=row.disabled,
+        profile_image=user_image,
+        permissions=decode_permissions(row.permission_mask),
+        groups=groups,
+    )
+
+
 def get_user_by_email(
     db: Session,
     email: str,
     image_size: Optional[int] = None,
 ) -> Optional[UserSchema]:
-    user = (
-        db.query(User)
-        .options(joinedload(User.groups))
-        .filter(User.email == email)
-        .first()
-    )
-
-    if user:
-        groups = (
-            [GroupProfileSchema(id=group.id, name=group.name) for group in user.groups]
-            if user.groups
-            else []
-        )
-        permissions = user.mapped_permissions
-        user_image = None
-        if profile_image := user.profile_image:
-            user_image = (get_media_image_url(profile_image, image_size),)
-
-        user_data = user.__dict__
-        del user_data["permissions"]
-        del user_data["groups"]
-        del user_data["hashed_password"]
-        user_data.pop("profile_image", None)
-
-        return UserSchema(
-            **user_data,
-            profile_image=user_image,
-            permissions=permissions,
-            groups=groups,
-        )
+    row = db.execute(select_user_profiles().where(User.email == email)).first()
+    if row:
+        return _to_user_schema(row, image_size)
     return None
 
 
@@ -53,38 +94,11 @@ def get_active_user_by_email(
     email: str,
     image_size: Optional[int] = None,
 ) -> UserSchema:
-    user = (
-        db.query(User)
-        .options(joinedload(User.groups))
-        .filter(
-            User.disabled == False,
-            User.email == email,
-        )
-        .first()
-    )
-    if user:
-        groups = (
-            [GroupProfileSchema(id=group.id, name=group.name) for group in user.groups]
-            if user.groups
-            else []
-        )
-        permissions = user.mapped_permissions
-        user_image = None
-        if profile_image := user.profile_image:
-            user_image = (get_media_image_url(profile_image, image_size),)
-
-        user_data = user.__dict__
-        del user_data["permissions"]
-        del user_data["groups"]
-        del user_data["hashed_password"]
-        user_data.pop("profile_image", None)
-
-        return UserSchema(
-            **user_data,
-            profile_image=user_image,
-            permissions=permissions,
-            groups=groups,
-        )
+    row = db.execute(
+        select_user_profiles().where(User.disabled == False, User.email == email),
+    ).first()
+    if row:
+        return _to_user_schema(row, image_size)
 
 
 def create_one(db: Session, **user_props) -> User:
@@ -95,12 +109,154 @@ def create_one(db: Session, **user_props) -> User:
     return db_user
 
 
+def _revoking_tokens(user_props: dict) -> dict:
+    """Tokens issued before the user is disabled or changes the password
+    stop working"""
+    if user_props.get("disabled") or "hashed_password" in user_props:
+        return {**user_props, "token_version": User.token_version + 1}
+    return user_props
+
+
 def update_one(db: Session, user_email: str, **user_props) -> None:
-    db.execute(
+    user_ids = db.scalars(
         update(User)
         .where(
             User.email == user_email,
         )
-        .values(**user_props),
-    )
+        .values(**_revoking_tokens(user_props))
+        .returning(User.id),
+    ).all()
+    db.commit()
+    invalidate_user(user_email)
+    for user_id in user_ids:
+        invalidate_token_version(user_id)
+
+
+def get_existing_emails(db: Session, emails: Iterable[str]) -> Set[str]:
+    return set(db.scalars(select(User.email).where(User.email.in_(list(emails)))))
+
+
+def create_many(db: Session, users: Sequence[dict]) -> List[str]:
+    """Inserts users with a single statement, emails which exist are skipped
+
+    Returns: emails of created users
+    """
+    if not users:
+        return []
+    created = db.scalars(
+        insert(User)
+        .values(list(users))
+        .on_conflict_do_nothing(index_elements=[User.email])
+        .returning(User.email),
+    ).all()
     db.commit()
+    return list(created)
+
+
+def get_profile_images(db: Session) -> list[str]:
+    return list(
+        db.scalars(
+            select(User.profile_image).where(User.profile_image.is_not(None)),
+        ),
+    )
+
+
+async def get_user_by_email_async(
+    db: AsyncSession,
+    email: str,
+    image_size: Optional[int] = None,
+) -> Optional[UserSchema]:
+    result = await db.execute(select_user_profiles().where(User.email == email))
+    row = result.first()
+    if row:
+        return _to_user_schema(row, image_size)
+    return None
+
+
+async def get_active_user_by_email_async(
+    db: AsyncSession,
+    email: str,
+    image_size: Optional[int] = None,
+) -> UserSchema:
+    result = await db.execute(
+        select_user_profiles().where(User.disabled == False, User.email == email),
+    )
+    row = result.first()
+    if row:
+        return _to_user_schema(row, image_size)
+
+
+async def create_one_async(db: AsyncSession, **user_props) -> User:
+    db_user = User(**user_props)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+
+async def create_profile_async(db: AsyncSession, **user_props) -> UserSchema:
+    """Creates a user and returns its profile from the same statement
+
+    A new user has no groups, the profile is built from the inserted row.
+    """
+    result = await db.execute(
+        insert(User)
+        .values(**user_props)
+        .returning(
+            User.id,
+            User.email,
+            User.first_name,
+            User.last_name,
+            User.disabled,
+            User.profile_image,
+            User.permissions.label("permission_mask"),
+            null().label("group_ids"),
+            null().label("group_names"),
+        ),
+    )
+    row = result.one()
+    await db.commit()
+    return _to_user_schema(row)
+
+
+async def update_one_async(db: AsyncSession, user_email: str, **user_props) -> None:
+    result = await db.scalars(
+        update(User)
+        .where(
+            User.email == user_email,
+        )
+        .values(**_revoking_tokens(user_props))
+        .returning(User.id),
+    )
+    user_ids = result.all()
+    await db.commit()
+    await invalidate_user_async(user_email)
+    for user_id in user_ids:
+        await invalidate_token_version_async(user_id)
+
+
+async def get_token_version_async(db: AsyncSession, user_id: int) -> Optional[int]:
+    return await db.scalar(select(User.token_version).where(User.id == user_id))
+
+
+async def update_many_async(
+    db: AsyncSession,
+    emails: Sequence[str],
+    **user_props,
+) -> List[str]:
+    """Updates users with a single statement and commit
+
+    Returns: emails of updated users
+    """
+    result = await db.execute(
+        update(User)
+        .where(User.email.in_(emails))
+        .values(**_revoking_tokens(user_props))
+        .returning(User.id, User.email),
+    )
+    updated = result.all()
+    await db.commit()
+    for user_id, email in updated:
+        await invalidate_user_async(email)
+        await invalidate_token_version_async(user_id)
+    return [email for _, email in updated]
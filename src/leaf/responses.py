@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+from functools import wraps
+from typing import Any, Callable, Optional, Type, get_args, get_origin
+
+import orjson
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.dependencies.models import Dependant
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute, request_response
+from fastapi.utils import is_body_allowed_for_status_code
+from pydantic import BaseModel, Extra
+from starlette.responses import JSONResponse as StarletteJSONResponse
+from starlette.responses import Response
+from starlette.routing import Match
+from starlette.types import Scope
+
+
+def _encode_default(value: Any) -> Any:
+    """Encodes what orjson doesn't serialize natively
+
+    Schemas reach it only from `SchemaRoute`, which checks that their field
+    names are the JSON keys.
+    """
+    if isinstance(value, BaseModel):
+        return value.__dict__
+    return jsonable_encoder(value)
+
+
+class JSONResponse(StarletteJSONResponse):
+    """Response encoded with orjson, the default response class of the app"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_encode_default,
+            option=orjson.OPT_NON_STR_KEYS,
+        )
+
+
+def is_plain_schema(model: Type[BaseModel], checked: Optional[set] = None) -> bool:
+    """Whether the schema and nested schemas are encoded as their `__dict__`
+
+    That is without aliases, custom JSON encoders and extra fields.
+    """
+    checked = set() if checked is None else checked
+    if model in checked:
+        return True
+    checked.add(model)
+    if model.__config__.json_encoders or model.__config__.extra == Extra.allow:
+        return False
+    for field in model.__fields__.values():
+        if field.alias != field.name:
+            return False
+        for type_ in (field.type_, *get_args(field.type_)):
+            if (
+                isinstance(type_, type)
+                and issubclass(type_, BaseModel)
+                and not is_plain_schema(type_, checked)
+            ):
+                return False
+    return True
+
+
+def _takes_response(dependant: Dependant) -> bool:
+    return dependant.response_param_name is not None or any(
+        _takes_response(dependency) for dependency in dependant.dependencies
+    )
+
+
+def _response_class(route: APIRoute) -> Type[Response]:
+    if isinstance(route.response_class, DefaultPlaceholder):
+        return route.response_class.value
+    return route.response_class
+
+
+def _response_schema(route: APIRoute) -> Optional[tuple[Type[BaseModel], bool]]:
+    """Schema returned by the route which can skip validation and whether
+    the route returns a list of them"""
+    if (
+        route.response_model_include is not None
+        or route.response_model_exclude is not None
+        or route.response_model_exclude_unset
+        or route.response_model_exclude_defaults
+        or route.response_model_exclude_none
+        or not route.response_model_by_alias
+        or (
+            route.status_code is not None
+            and not is_body_allowed_for_status_code(route.status_code)
+        )
+        or _takes_response(route.dependant)
+        or not issubclass(_response_class(route), JSONResponse)
+    ):
+        return None
+    model, many = route.response_model, False
+    if get_origin(model) is list:
+        (model,), many = get_args(model), True
+    if isinstance(model, type) and issubclass(model, BaseModel):
+        if is_plain_schema(model):
+            return model, many
+    return None
+
+
+def _send_schemas(
+    call: Callable,
+    model: Type[BaseModel],
+    many: bool,
+    response_class: Type[Response],
+    status_code: int,
+) -> Callable:
+    @wraps(call)
+    async def send_schemas(**values):
+        content = await call(**values)
+        if (
+            isinstance(content, list) and all(type(item) is model for item in content)
+            if many
+            else type(content) is model
+        ):
+            return response_class(content, status_code=status_code)
+        return content
+
+    return send_schemas
+
+
+class SchemaRoute(APIRoute):
+    """Route which sends schemas returned by the endpoint as they are
+
+    FastAPI converts a returned schema to a dict, validates it against the
+    response model again and encodes the new schema with `jsonable_encoder`
+    before the response is rendered. When an async endpoint returns an
+    instance of exactly the response model, or a list of them, it was
+    validated when it was created, so it is encoded by orjson right away.
+    Anything else, e.g. a dict or an ORM object, takes the usual path.
+
+    Matched routes are put in the scope as `route`, so middleware can label
+    requests by the path template.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        schema = _response_schema(self)
+        if schema is None or not asyncio.iscoroutinefunction(self.dependant.call):
+            return
+        self.dependant.call = _send_schemas(
+            self.dependant.call,
+            *schema,
+            response_class=_response_class(self),
+            status_code=self.status_code or 200,
+        )
+        self.app = request_response(self.get_route_handler())
+
+    def matches(self, scope: Scope) -> tuple[Match, Scope]:
+        match, child_scope = super().matches(scope)
+        if match == Match.FULL:
+            child_scope["route"] = self
+        return match, child_scope
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from uuid import uuid4
+
+import anyio
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from leaf.auth import require
+from leaf.config.celery import celery
+from leaf.config.config import Settings, get_settings
+from leaf.config.database import get_async_db
+from leaf.config.logger import logger
+from leaf.models.user import PermissionsType
+from leaf.repositories.users import update_many_async
+from leaf.responses import SchemaRoute
+from leaf.schemas.users import (
+    PrincipalSchema,
+    UserBatchUpdateResultSchema,
+    UserBatchUpdateSchema,
+    UserImportSchema,
+)
+from leaf.storage import StorageBackend, get_storage
+from leaf.tasks import import_users
+from leaf.user_import import USER_IMPORT_FORMATS
+
+IMPORTS_DIRECTORY = "imports"
+
+require_users_admin = require(PermissionsType.modify_users)
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_users_admin)],
+    route_class=SchemaRoute,
+)
+
+
+async def receive_import_upload(
+    request: Request,
+    storage: StorageBackend,
+    max_size: int,
+) -> str:
+    """Streams request body to the storage, returns key of the stored file"""
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File is too large! Maximum size is {max_size} bytes",
+        )
+    key = f"{IMPORTS_DIRECTORY}/{uuid4().hex}"
+    writer = await anyio.to_thread.run_sync(storage.open_writer, key)
+    size = 0
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"File is too large! Maximum size is {max_size} bytes",
+                )
+            await anyio.to_thread.run_sync(writer.write, chunk)
+        await anyio.to_thread.run_sync(writer.commit)
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            await anyio.to_thread.run_sync(writer.abort)
+        raise
+    return key
+
+
+@router.post(
+    "/users/import",
+    response_model=UserImportSchema,
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                content_type: {"schema": {"type": "string", "format": "binary"}}
+                for content_type in USER_IMPORT_FORMATS
+            },
+        },
+    },
+)
+async def start_user_import(
+    request: Request,
+    current_user: PrincipalSchema = Depends(require_users_admin),
+    settings: Settings = Depends(get_settings),
+    storage: StorageBackend = Depends(get_storage),
+):
+    """Creates users from a CSV file or NDJSON in the background
+
+    Rows have `email`, `password`, `first_name` and `last_name` fields. The
+    returned task id is used to follow the progress of the import.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    import_format = USER_IMPORT_FORMATS.get(content_type)
+    if import_format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Supported content types are: {', '.join(USER_IMPORT_FORMATS)}",
+        )
+    key = await receive_import_upload(
+        request,
+        storage,
+        max_size=settings.USER_IMPORT_MAX_SIZE,
+    )
+    task = import_users.delay(key, import_format)
+    logger.info(
+        "User import started",
+        extra={
+            "url": "/admin/users/import",
+            "method": "POST",
+            "ip": request.client.host,
+            "user": current_user.email,
+        },
+    )
+    return UserImportSchema(task_id=task.id, state=task.state)
+
+
+@router.get("/users/import/{task_id}", response_model=UserImportSchema)
+def get_user_import(task_id: str):
+    # Plain function, reading the result backend blocks, so FastAPI runs the
+    # handler in the threadpool
+    result = celery.AsyncResult(task_id)
+    # Counters are set in PROGRESS and SUCCESS states, exception in FAILURE
+    progress = result.info if isinstance(result.info, dict) else {}
+    return UserImportSchema(task_id=task_id, state=result.state, **progress)
+
+
+@router.patch("/users", response_model=UserBatchUpdateResultSchema)
+async def update_users(
+    request: Request,
+    body: UserBatchUpdateSchema = Body(...),
+    current_user: PrincipalSchema = Depends(require_users_admin),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Enables or disables many users with a single statement"""
+    updated = await update_many_async(db, body.emails, disabled=body.disabled)
+    logger.info(
+        f"{len(updated)} users {'disabled' if body.disabled else 'enabled'}",
+        extra={
+            "url": "/admin/users",
+            "method": "PATCH",
+            "ip": request.client.host,
+            "user": current_user.email,
+        },
+    )
+    return UserBatchUpdateResultSchema(updated=updated)
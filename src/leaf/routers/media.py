@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from pathlib import PurePosixPath
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from fastapi.responses import FileResponse, RedirectResponse, Response
+
+from leaf.config.config import Settings, get_settings
+from leaf.media import (
+    IMMUTABLE_CACHE_CONTROL,
+    is_immutable_resource,
+    negotiate_image_variant,
+)
+from leaf.responses import SchemaRoute
+from leaf.storage import StorageBackend, get_storage
+from leaf.storage.backends import validate_key
+
+router = APIRouter(tags=["media"], route_class=SchemaRoute)
+
+
+@router.api_route("/{resource_path:path}", methods=["GET", "HEAD"])
+def get_media_resource(
+    request: Request,
+    resource_path: str,
+    accept: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
+    settings: Settings = Depends(get_settings),
+    storage: StorageBackend = Depends(get_storage),
+):
+    try:
+        resource_key = validate_key(resource_path)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    stored = negotiate_image_variant(storage, resource_key, accept)
+    if stored is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    headers = {"Vary": "Accept"}
+
+    path = storage.local_path(stored.key)
+    if path is None:
+        # Remote storage, client downloads the file directly from it
+        expires_in = settings.S3_PRESIGNED_URL_EXPIRES
+        headers["Cache-Control"] = f"private, max-age={expires_in // 2}"
+        return RedirectResponse(
+            storage.presigned_url(stored.key, expires_in),
+            status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+            headers=headers,
+        )
+
+    if is_immutable_resource(resource_key):
+        # Name of a content addressed file identifies its content
+        headers["ETag"] = f'"{PurePosixPath(stored.key).name}"'
+        headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        if if_none_match and (
+            if_none_match.strip() == "*"
+            or headers["ETag"]
+            in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+        ):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(path, method=request.method, headers=headers)
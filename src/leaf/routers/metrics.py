@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from leaf.config.metrics import generate_metrics
+from leaf.responses import SchemaRoute
+
+router = APIRouter(tags=["metrics"], route_class=SchemaRoute)
+
+
+# Sync, so files of other processes are read in the thread pool
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Metrics of all processes in the Prometheus text format"""
+    return Response(generate_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from leaf.auth import get_current_active_user
+from leaf.config.config import Settings, get_settings
+from leaf.config.database import get_async_db
+from leaf.media import get_image_size
+from leaf.repositories.posts import (
+    FeedCursor,
+    decode_feed_cursor,
+    get_feed_async,
+    get_home_feed_async,
+    like_post_async,
+    unlike_post_async,
+)
+from leaf.responses import SchemaRoute
+from leaf.schemas.posts import PostLikeSchema, PostPageSchema
+from leaf.schemas.users import UserSchema
+from leaf.timeline import TimelineStore, get_timeline_store
+
+MAX_PAGE_SIZE = 100
+
+router = APIRouter(prefix="/posts", tags=["posts"], route_class=SchemaRoute)
+
+
+def get_feed_cursor(cursor: str | None = Query(default=None)) -> FeedCursor | None:
+    if cursor is None:
+        return None
+    try:
+        return decode_feed_cursor(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor",
+        )
+
+
+@router.get("", response_model=PostPageSchema)
+async def get_feed(
+    feed_cursor: FeedCursor | None = Depends(get_feed_cursor),
+    limit: int = Query(default=20, ge=1, le=MAX_PAGE_SIZE),
+    current_user: UserSchema = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+    image_size: int = Depends(get_image_size),
+):
+    return await get_feed_async(
+        db,
+        current_user.id,
+        cursor=feed_cursor,
+        limit=limit,
+        image_size=image_size,
+    )
+
+
+@router.get("/home", response_model=PostPageSchema)
+async def get_home_feed(
+    feed_cursor: FeedCursor | None = Depends(get_feed_cursor),
+    limit: int = Query(default=20, ge=1, le=MAX_PAGE_SIZE),
+    current_user: UserSchema = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+    image_size: int = Depends(get_image_size),
+    timeline: TimelineStore | None = Depends(get_timeline_store),
+    settings: Settings = Depends(get_settings),
+):
+    return await get_home_feed_async(
+        db,
+        current_user.id,
+        cursor=feed_cursor,
+        limit=limit,
+        image_size=image_size,
+        timeline=timeline,
+        max_group_size=settings.TIMELINE_FANOUT_MAX_GROUP_SIZE,
+    )
+
+
+# PUT and DELETE, so retried requests don't change the result
+@router.put("/{post_id}/like", response_model=PostLikeSchema)
+async def like_post(
+    post_id: int,
+    current_user: UserSchema = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    like_count = await like_post_async(db, current_user.id, post_id)
+    if like_count is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return PostLikeSchema(post_id=post_id, liked=True, like_count=like_count)
+
+
+@router.delete("/{post_id}/like", response_model=PostLikeSchema)
+async def unlike_post(
+    post_id: int,
+    current_user: UserSchema = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    like_count = await unlike_post_async(db, current_user.id, post_id)
+    if like_count is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return PostLikeSchema(post_id=post_id, liked=False, like_count=like_count)
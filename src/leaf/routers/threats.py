@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from leaf.auth import get_current_active_user
+from leaf.cache import cache_tile_async, get_cached_tile_async
+from leaf.config.config import Settings, get_settings
+from leaf.config.database import get_async_db
+from leaf.repositories.threats import (
+    get_threat_tile_async,
+    get_threats_in_bbox_async,
+    get_threats_in_radius_async,
+)
+from leaf.responses import SchemaRoute
+from leaf.schemas.threats import ThreatPageSchema
+from leaf.tiles import is_valid_tile
+
+# Radius of the largest circle which can be queried, in meters
+MAX_RADIUS = 50_000
+MAX_PAGE_SIZE = 1000
+VECTOR_TILE_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+router = APIRouter(
+    prefix="/threats",
+    tags=["threats"],
+    dependencies=[Depends(get_current_active_user)],
+    route_class=SchemaRoute,
+)
+
+
+@router.get("", response_model=ThreatPageSchema)
+async def get_threats_in_bbox(
+    min_longitude: float = Query(ge=-180, le=180),
+    min_latitude: float = Query(ge=-90, le=90),
+    max_longitude: float = Query(ge=-180, le=180),
+    max_latitude: float = Query(ge=-90, le=90),
+    category_id: List[int] | None = Query(default=None),
+    after: int | None = Query(default=None, ge=0),
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if min_longitude > max_longitude or min_latitude > max_latitude:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid bounding box",
+        )
+    return await get_threats_in_bbox_async(
+        db,
+        min_longitude,
+        min_latitude,
+        max_longitude,
+        max_latitude,
+        category_ids=category_id,
+        after=after,
+        limit=limit,
+    )
+
+
+@router.get("/nearby", response_model=ThreatPageSchema)
+async def get_threats_in_radius(
+    longitude: float = Query(ge=-180, le=180),
+    latitude: float = Query(ge=-90, le=90),
+    radius: float = Query(gt=0, le=MAX_RADIUS),
+    category_id: List[int] | None = Query(default=None),
+    after: int | None = Query(default=None, ge=0),
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await get_threats_in_radius_async(
+        db,
+        longitude,
+        latitude,
+        radius,
+        category_ids=category_id,
+        after=after,
+        limit=limit,
+    )
+
+
+@router.get(
+    "/tiles/{z}/{x}/{y}",
+    response_class=Response,
+    responses={200: {"content": {VECTOR_TILE_MEDIA_TYPE: {}}}},
+)
+async def get_threat_tile(
+    z: int,
+    x: int,
+    y: int,
+    db: AsyncSession = Depends(get_async_db),
+    settings: Settings = Depends(get_settings),
+):
+    if not is_valid_tile(z, x, y):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    tile = await get_cached_tile_async(z, x, y)
+    if tile is None:
+        tile = await get_threat_tile_async(
+            db,
+            z,
+            x,
+            y,
+            cluster_max_zoom=settings.TILE_CLUSTER_MAX_ZOOM,
+        )
+        await cache_tile_async(z, x, y, tile)
+    return Response(tile, media_type=VECTOR_TILE_MEDIA_TYPE)
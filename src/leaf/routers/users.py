@@ -1,72 +1,70 @@
 from __future__ import annotations
 
 from datetime import timedelta
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from pathlib import Path
 
-from fastapi import (
-    APIRouter,
-    Body,
-    Depends,
-    HTTPException,
-    Request,
-    UploadFile,
-    status,
-)
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, status
 from fastapi.responses import JSONResponse
 from itsdangerous import BadSignature, SignatureExpired
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from leaf.auth import (
-    authenticate_user,
+    authenticate_user_async,
     confirm_token,
     create_access_token,
+    create_user_claims,
     generate_confirmation_token,
     get_current_active_user,
-    get_password_hash,
+    get_password_hash_async,
 )
 from leaf.config.config import Settings, get_settings
-from leaf.config.database import get_db
-from leaf.config.jinja_config import env
+from leaf.config.database import get_async_db
 from leaf.config.logger import logger
 from leaf.media import (
     create_media_resource,
-    flush_old_media_resources,
+    get_image_resource_key,
     get_image_size,
     get_media_image_url,
-    get_resource_absolute_path,
+    receive_image_upload,
 )
 from leaf.models.user import User
 from leaf.repositories.users import (
-    create_one,
-    get_active_user_by_email,
-    update_one,
+    create_profile_async,
+    get_active_user_by_email_async,
+    update_one_async,
 )
+from leaf.responses import SchemaRoute
 from leaf.schemas.users import (
     EmailConfirmationSchema,
     GroupProfileSchema,
     LoginSchema,
     PasswordResetSchema,
-    PermissionsSchema,
+    RefreshedTokenSchema,
+    RefreshTokenSchema,
     RequestPasswordResetSchema,
     TokenSchema,
     UserCreateSchema,
     UserSchema,
 )
-from leaf.tasks import resize_image, send_mail
+from leaf.sessions import (
+    end_session,
+    get_session_id,
+    refresh_session,
+    start_session,
+)
+from leaf.storage import StorageBackend, get_storage
+from leaf.tasks import queue_emails, resize_image
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(prefix="/users", tags=["users"], route_class=SchemaRoute)
 
 
 @router.post("/token", response_model=TokenSchema)
 async def login_for_access_token(
     request: Request,
     form_data: LoginSchema,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     settings: Settings = Depends(get_settings),
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         logger.info(
             f"Invalid credentials provided",
@@ -91,11 +89,17 @@ async def login_for_access_token(
             "user": user.email,
         },
     )
+    db_user = await get_active_user_by_email_async(db, email=user.email)
     access_token_expires = timedelta(
         minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES,
     )
+    refresh_token = await start_session(db, user.id, user.token_version)
+    claims = {"sub": user.email}
+    if settings.TOKEN_CLAIMS_ENABLED:
+        claims = create_user_claims(db_user, user.token_version)
+    claims["sid"] = get_session_id(refresh_token)
     access_token = create_access_token(
-        data={"sub": user.email},
+        data=claims,
         secret_key=settings.SECRET_KEY,
         algorithm=settings.ALGORITHM,
         expires_delta=access_token_expires,
@@ -118,19 +122,95 @@ async def login_for_access_token(
             "user": user.email,
         },
     )
-    db_user = get_active_user_by_email(db, email=user.email)
-    return TokenSchema(access_token=access_token, token_type="bearer", user=db_user)
+    return TokenSchema(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=refresh_token,
+        user=db_user,
+    )
+
+
+@router.post("/token/refresh", response_model=RefreshedTokenSchema)
+async def refresh_access_token(
+    request: Request,
+    body: RefreshTokenSchema = Body(...),
+    db: AsyncSession = Depends(get_async_db),
+    settings: Settings = Depends(get_settings),
+):
+    """Issues a new access token without the password
+
+    The refresh token is exchanged for a new one, every refresh token can be
+    used only once.
+    """
+    session = await refresh_session(db, body.refresh_token)
+    if session is None:
+        logger.info(
+            "Invalid refresh token provided",
+            extra={
+                "url": "/token/refresh",
+                "method": "POST",
+                "ip": request.client.host,
+            },
+        )
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    claims = {"sub": session.email}
+    if settings.TOKEN_CLAIMS_ENABLED:
+        db_user = await get_active_user_by_email_async(db, email=session.email)
+        claims = create_user_claims(db_user, session.token_version)
+    claims["sid"] = session.session_id
+    access_token = create_access_token(
+        data=claims,
+        secret_key=settings.SECRET_KEY,
+        algorithm=settings.ALGORITHM,
+        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    logger.debug(
+        "Access token refreshed",
+        extra={
+            "url": "/token/refresh",
+            "method": "POST",
+            "ip": request.client.host,
+            "user": session.email,
+        },
+    )
+    return RefreshedTokenSchema(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=session.refresh_token,
+    )
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    request: Request,
+    body: RefreshTokenSchema = Body(...),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Ends the session of the refresh token together with its access tokens"""
+    await end_session(db, body.refresh_token)
+    logger.info(
+        "User logged out",
+        extra={
+            "url": "/logout",
+            "method": "POST",
+            "ip": request.client.host,
+        },
+    )
 
 
 @router.post("/register", response_model=UserSchema, status_code=201)
 async def register(
     request: Request,
     user: UserCreateSchema = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     settings: Settings = Depends(get_settings),
 ):
-    hashed_password = get_password_hash(user.password)
-    db_user = create_one(
+    hashed_password = await get_password_hash_async(user.password)
+    db_user = await create_profile_async(
         db,
         email=user.email,
         hashed_password=hashed_password,
@@ -161,21 +241,8 @@ async def register(
             "user": user.email,
         },
     )
-    url_template = env.from_string(settings.CONFIRMATION_URL)
-    confirm_url = url_template.render(
-        confirmation_token=confirmation_token,
-    )
-    template = env.get_template("confirmation_email.html")
-    msg_content = template.render(confirm_url=confirm_url)
-    message = MIMEMultipart("alternative")
-    message["Subject"] = "Leaf account - email confirmation"
-    message["From"] = settings.SMTP_CONFIG["EMAIL"]
-    message["To"] = user.email
-    message.attach(MIMEText(msg_content, "html"))
-    send_mail.delay(
-        user.email,
-        message.as_string(),
-        settings.SMTP_CONFIG,
+    queue_emails(
+        [(user.email, "confirmation", {"confirmation_token": confirmation_token})],
     )
     logger.info(
         f"New user registered",
@@ -186,17 +253,14 @@ async def register(
             "user": db_user.email,
         },
     )
-    permissions = db_user.mapped_permissions
-    data = db_user.__dict__
-    del data["permissions"]
-    return UserSchema(**data, permissions=PermissionsSchema(**permissions), groups=[])
+    return db_user
 
 
 @router.post("/confirm", status_code=200)
 async def confirm_user(
     request: Request,
     token: EmailConfirmationSchema = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     settings: Settings = Depends(get_settings),
     image_size: int = Depends(get_image_size),
 ) -> UserSchema:
@@ -219,8 +283,8 @@ async def confirm_user(
                 "user": email,
             },
         )
-        update_one(db, user_email=email, disabled=False)
-        return get_active_user_by_email(db, email, image_size)
+        await update_one_async(db, user_email=email, disabled=False)
+        return await get_active_user_by_email_async(db, email, image_size)
     except BadSignature:
         logger.debug(
             "Invalid token provided",
@@ -248,10 +312,10 @@ async def confirm_user(
 async def password_reset(
     request: Request,
     user: RequestPasswordResetSchema = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     settings: Settings = Depends(get_settings),
 ):
-    db_user = get_active_user_by_email(db, user.email)
+    db_user = await get_active_user_by_email_async(db, user.email)
     if db_user:
         confirmation_token = generate_confirmation_token(
             user.email,
@@ -267,20 +331,16 @@ async def password_reset(
                 "user": user.email,
             },
         )
-        url_template = env.from_string(settings.PASSWORD_RESET_URL)
-        reset_url = url_template.render(
-            confirmation_token=confirmation_token,
+        queue_emails(
+            [
+                (
+                    user.email,
+                    "password_reset",
+                    {"confirmation_token": confirmation_token},
+                ),
+            ],
         )
 
-        template = env.get_template("password_reset.html")
-        msg_content = template.render(reset_url=reset_url)
-        message = MIMEMultipart("alternative")
-        message["Subject"] = "Leaf account - password reset"
-        message["From"] = settings.SMTP_CONFIG["EMAIL"]
-        message["To"] = user.email
-        message.attach(MIMEText(msg_content, "html"))
-        send_mail.delay(user.email, message.as_string())
-
         logger.info(
             "User started password reset process",
             extra={
@@ -312,7 +372,7 @@ async def password_reset(
 async def password_reset_confirm(
     request: Request,
     body: PasswordResetSchema = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     image_size: int = Depends(get_image_size),
     settings: Settings = Depends(get_settings),
 ) -> UserSchema:
@@ -334,8 +394,8 @@ async def password_reset_confirm(
                 "ip": request.client.host,
             },
         )
-        new_password_hash = get_password_hash(body.new_password)
-        update_one(
+        new_password_hash = await get_password_hash_async(body.new_password)
+        await update_one_async(
             db,
             user_email=email,
             hashed_password=new_password_hash,
@@ -357,7 +417,7 @@ async def password_reset_confirm(
                 "ip": request.client.host,
             },
         )
-        return get_active_user_by_email(db, email, image_size)
+        return await get_active_user_by_email_async(db, email, image_size)
     except BadSignature:
         logger.info(
             "User provided invalid token",
@@ -380,56 +440,65 @@ async def password_reset_confirm(
         raise token_exception
 
 
-@router.put("/user-image")
+@router.put(
+    "/user-image",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["image"],
+                        "properties": {
+                            "image": {"type": "string", "format": "binary"},
+                        },
+                    },
+                },
+            },
+        },
+    },
+)
 async def update_user_image(
     request: Request,
-    image: UploadFile,
     current_user: User = Depends(get_current_active_user),
     image_size: str = Depends(get_image_size),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     settings: Settings = Depends(get_settings),
+    storage: StorageBackend = Depends(get_storage),
 ):
-    image_format = image.filename.split(".")[-1]
-    relative_image_path = Path(
-        f"{current_user.id}/user_image.{image_format}",
-    )
-    absolute_image_path = get_resource_absolute_path(
-        relative_image_path,
-        media_folder=settings.MEDIA_FOLDER,
+    upload_key, image_format, digest = await receive_image_upload(
+        request,
+        "image",
+        storage,
+        max_size=settings.MAX_UPLOAD_SIZE,
     )
+    image_key = get_image_resource_key(digest, image_format)
 
-    flush_old_media_resources(absolute_image_path)
-    logger.debug(
-        "Old media files removed from the volume",
-        extra={
-            "url": "/user-image",
-            "method": "POST",
-            "ip": request.client.host,
-            "user": current_user.email,
-        },
-    )
-
-    create_media_resource(absolute_image_path, await image.read())
-    logger.dbug(
-        "Base image saved on the volume",
-        extra={
-            "url": "/user-image",
-            "method": "POST",
-            "ip": request.client.host,
-            "user": current_user.email,
-        },
-    )
-    resize_image.delay(
-        str(absolute_image_path),
-        list(settings.IMAGE_SIZES.values()),
-    )
+    if await create_media_resource(storage, image_key, upload_key):
+        logger.debug(
+            "Base image saved on the volume",
+            extra={
+                "url": "/user-image",
+                "method": "POST",
+                "ip": request.client.host,
+                "user": current_user.email,
+            },
+        )
+        resize_image.delay(
+            image_key,
+            list(settings.IMAGE_SIZES.values()),
+            [
+                variant_format
+                for variant_format in settings.IMAGE_VARIANT_FORMATS.split(",")
+                if variant_format
+            ],
+        )
 
-    update_one(
+    await update_one_async(
         db,
         current_user.email,
-        image_size,
-        settings,
-        profile_image=str(relative_image_path.name),
+        profile_image=image_key,
     )
     logger.info(
         "User changed image successful",
@@ -440,7 +509,7 @@ async def update_user_image(
             "user": current_user.email,
         },
     )
-    return get_active_user_by_email(db, current_user.email, image_size)
+    return await get_active_user_by_email_async(db, current_user.email, image_size)
 
 
 @router.get("/me", response_model=UserSchema)
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import List
+
+from pydantic import BaseModel, PositiveInt
+
+from leaf.schemas.threats import ThreatSchema
+
+
+class PostAuthorSchema(BaseModel):
+    id: PositiveInt
+    first_name: str
+    last_name: str
+    profile_image: str | None = None
+
+
+class PostSchema(BaseModel):
+    id: PositiveInt
+    content: str
+    image: str
+    created_at: datetime
+    author: PostAuthorSchema | None = None
+    threat: ThreatSchema
+    like_count: int
+    comment_count: int
+    liked_by_me: bool
+
+
+class PostPageSchema(BaseModel):
+    items: List[PostSchema]
+    # Pass as `cursor` to get the next page, None on the last page
+    next_cursor: str | None = None
+
+
+class PostLikeSchema(BaseModel):
+    post_id: PositiveInt
+    liked: bool
+    like_count: int
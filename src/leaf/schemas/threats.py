@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from typing import List
+
+from pydantic import BaseModel, PositiveInt
+
+
+class ThreatSchema(BaseModel):
+    id: PositiveInt
+    category_id: PositiveInt
+    longitude: float
+    latitude: float
+
+
+class ThreatPageSchema(BaseModel):
+    items: List[ThreatSchema]
+    # Pass as `after` to get the next page, None on the last page
+    next_cursor: int | None = None
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import List
 
-from pydantic import BaseModel, PositiveInt
+from pydantic import BaseModel, PositiveInt, conlist
 
 
 class TokenDataSchema(BaseModel):
@@ -23,6 +23,11 @@ class GroupProfileSchema(BaseModel):
 
 
 class PermissionsSchema(BaseModel):
+    class Config:
+        allow_mutation = False
+
+    # Bits of PermissionsType values, including permissions of the user's groups
+    mask: int
     read_users: bool
     modify_users: bool
     grant_permissions: bool
@@ -45,12 +50,32 @@ class UserSchema(BaseModel):
     groups: List[GroupProfileSchema]
 
 
+class PrincipalSchema(BaseModel):
+    """Authenticated user, as much as authorization needs to know"""
+
+    id: PositiveInt
+    email: str
+    permissions: PermissionsSchema
+    group_ids: List[int]
+
+
 class TokenSchema(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
     user: UserSchema
 
 
+class RefreshTokenSchema(BaseModel):
+    refresh_token: str
+
+
+class RefreshedTokenSchema(BaseModel):
+    access_token: str
+    token_type: str
+    refresh_token: str
+
+
 class UserCreateSchema(BaseModel):
     class Config:
         orm_mode = True
@@ -72,3 +97,28 @@ class RequestPasswordResetSchema(BaseModel):
 class PasswordResetSchema(BaseModel):
     key: str
     new_password: str
+
+
+class UserImportErrorSchema(BaseModel):
+    line: int
+    error: str
+
+
+class UserImportSchema(BaseModel):
+    task_id: str
+    # Celery task state, PROGRESS while batches are imported
+    state: str
+    processed: int = 0
+    created: int = 0
+    skipped: int = 0
+    invalid: int = 0
+    errors: List[UserImportErrorSchema] = []
+
+
+class UserBatchUpdateSchema(BaseModel):
+    emails: conlist(str, min_items=1, max_items=10000)
+    disabled: bool
+
+
+class UserBatchUpdateResultSchema(BaseModel):
+    updated: List[str]
@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import secrets
+from datetime import timedelta
+from time import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+from uuid import uuid4
+
+from redis import RedisError
+from redis.asyncio import Redis
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from leaf.config.config import get_settings
+from leaf.config.database import AsyncSessionLocal
+from leaf.config.logger import logger
+from leaf.repositories.sessions import (
+    create_session_async,
+    get_revoked_session_ids_async,
+    get_session_async,
+    is_session_revoked_async,
+    revoke_session_async,
+    rotate_session_async,
+)
+
+settings = get_settings()
+
+# Failures of the store of revoked sessions, see `RevocationList`
+STORE_ERRORS = (RedisError, SQLAlchemyError, OSError)
+
+
+class BloomFilter:
+    """Set of strings which may report false positives but no false negatives
+
+    Sized for `capacity` items with `error_rate` false positives, adding more
+    items only raises the rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(
+            8,
+            math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2),
+        )
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class RevocationList:
+    """Sessions revoked in the last `ttl` seconds, checked by every request
+
+    Access tokens of a session stay valid until they expire, so a revoked
+    session is kept for the lifetime of an access token. Lookups go to a
+    Bloom filter kept in the process first, only its hits are checked in the
+    exact set, so tokens of live sessions never leave the process.
+
+    With Redis the exact set is a sorted set scored by the time of
+    revocation, without it the `user_sessions` table read through
+    `session_factory`. Only a list without either keeps the set in the
+    process, which other processes never see. The filter is updated with
+    sessions revoked by other processes every `sync_interval` seconds and
+    rebuilt without expired ones every `ttl` seconds. The client is
+    a `redis.asyncio` one, checks run on the event loop.
+
+    When the store fails a sync keeps the last filter and a filter hit which
+    can't be checked counts as revoked, so a failing store never lets
+    a known revoked session in nor fails requests of live sessions.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        capacity: int,
+        error_rate: float,
+        client: Optional[Redis] = None,
+        key: str = "leaf:sessions:revoked",
+        sync_interval: float = 5,
+        clock: Callable[[], float] = time,
+        session_factory: Optional[async_sessionmaker] = None,
+    ):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.client = client
+        self.session_factory = session_factory
+        self.key = key
+        self.sync_interval = sync_interval
+        self.clock = clock
+        self.checks = 0
+        self.filter_hits = 0
+        self.revoked_hits = 0
+        self.errors = 0
+        self._revoked: Dict[str, float] = {}
+        self._filter = BloomFilter(capacity, error_rate)
+        self._synced_at: Optional[float] = None
+        self._rebuilt_at: Optional[float] = None
+
+    async def _revoked_since(self, now: float, seconds: float) -> List[str]:
+        """Sessions revoked in the last `seconds`"""
+        since = now - seconds
+        if self.client is not None:
+            revoked = await self.client.zrangebyscore(self.key, since, "+inf")
+            return [session_id.decode() for session_id in revoked]
+        if self.session_factory is not None:
+            async with self.session_factory() as db:
+                return await get_revoked_session_ids_async(db, seconds)
+        return [
+            session_id
+            for session_id, revoked_at in self._revoked.items()
+            if revoked_at > since
+        ]
+
+    async def _is_stored(self, session_id: str, now: float) -> bool:
+        """Whether the session was revoked in the last `ttl` seconds"""
+        if self.client is not None:
+            revoked_at = await self.client.zscore(self.key, session_id)
+        elif self.session_factory is not None:
+            async with self.session_factory() as db:
+                return await is_session_revoked_async(db, session_id, self.ttl)
+        else:
+            revoked_at = self._revoked.get(session_id)
+        return revoked_at is not None and revoked_at > now - self.ttl
+
+    async def _rebuild(self, now: float) -> None:
+        if self.client is not None:
+            await self.client.zremrangebyscore(self.key, "-inf", now - self.ttl)
+        elif self.session_factory is None:
+            self._revoked = {
+                session_id: revoked_at
+                for session_id, revoked_at in self._revoked.items()
+                if revoked_at > now - self.ttl
+            }
+        session_ids = await self._revoked_since(now, self.ttl)
+        self._filter = BloomFilter(self.capacity, self.error_rate)
+        for session_id in session_ids:
+            self._filter.add(session_id)
+        self._rebuilt_at = now
+
+    async def sync(self) -> None:
+        now = self.clock()
+        try:
+            if self._rebuilt_at is None or now - self._rebuilt_at >= self.ttl:
+                await self._rebuild(now)
+            elif self.client is not None or self.session_factory is not None:
+                # Clocks of processes differ, an overlap of one interval makes
+                # up for it
+                seconds = now - self._synced_at + self.sync_interval
+                for session_id in await self._revoked_since(now, seconds):
+                    self._filter.add(session_id)
+        except STORE_ERRORS as e:
+            self.errors += 1
+            logger.warning(f"Revoked sessions were not synced: {e!r}")
+        # Tried again after the interval, not on every request
+        self._synced_at = now
+
+    async def revoke(self, session_id: str) -> None:
+        """Adds the session, already revoked in `user_sessions`"""
+        now = self.clock()
+        self._filter.add(session_id)
+        if self.client is not None:
+            try:
+                await self.client.zadd(self.key, {session_id: now})
+            except RedisError as e:
+                self.errors += 1
+                logger.error(f"Revocation of session {session_id} not shared: {e!r}")
+        elif self.session_factory is None:
+            self._revoked[session_id] = now
+
+    async def is_revoked(self, session_id: str) -> bool:
+        if (
+            self._synced_at is None
+            or self.clock() - self._synced_at >= self.sync_interval
+        ):
+            await self.sync()
+        self.checks += 1
+        if session_id not in self._filter:
+            return False
+        self.filter_hits += 1
+        try:
+            revoked = await self._is_stored(session_id, self.clock())
+        except STORE_ERRORS as e:
+            self.errors += 1
+            logger.warning(f"Session {session_id} treated as revoked: {e!r}")
+            revoked = True
+        if revoked:
+            self.revoked_hits += 1
+        return revoked
+
+    def stats(self) -> dict:
+        return {
+            "checks": self.checks,
+            "filter_hits": self.filter_hits,
+            "revoked_hits": self.revoked_hits,
+            "false_positives": self.filter_hits - self.revoked_hits,
+            "errors": self.errors,
+        }
+
+
+def create_revocation_list() -> RevocationList:
+    """Revocation list shared by all processes, through Redis or the database"""
+    client = session_factory = None
+    if settings.CACHE_BACKEND == "redis":
+        client = Redis.from_url(settings.CACHE_REDIS_URL)
+    else:
+        session_factory = AsyncSessionLocal
+    return RevocationList(
+        ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        capacity=settings.SESSION_REVOCATION_CAPACITY,
+        error_rate=settings.SESSION_REVOCATION_ERROR_RATE,
+        client=client,
+        sync_interval=settings.SESSION_REVOCATION_SYNC_INTERVAL,
+        session_factory=session_factory,
+    )
+
+
+revocation_list: RevocationList = create_revocation_list()
+
+
+def get_revocation_list() -> RevocationList:
+    return revocation_list
+
+
+def set_revocation_list(revocations: RevocationList) -> None:
+    """Replaces the revocation list, e.g. with fakeredis in tests"""
+    global revocation_list
+    revocation_list = revocations
+
+
+class RefreshedSession(NamedTuple):
+    session_id: str
+    user_id: int
+    email: str
+    token_version: int
+    refresh_token: str
+
+
+def hash_refresh_token(refresh_token: str) -> str:
+    # Tokens are random, a fast hash is enough to not keep them in plain text
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+
+def create_refresh_token(session_id: str) -> str:
+    return f"{session_id}.{secrets.token_urlsafe(32)}"
+
+
+def get_session_id(refresh_token: str) -> str:
+    return refresh_token.partition(".")[0]
+
+
+async def start_session(db: AsyncSession, user_id: int, token_version: int) -> str:
+    """Starts a session after a login
+
+    Returns: the first refresh token of the session, its id is the part
+    before the dot
+    """
+    session_id = uuid4().hex
+    refresh_token = create_refresh_token(session_id)
+    await create_session_async(
+        db,
+        session_id=session_id,
+        user_id=user_id,
+        token_version=token_version,
+        token_hash=hash_refresh_token(refresh_token),
+        expires_in=timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    return refresh_token
+
+
+async def refresh_session(
+    db: AsyncSession,
+    refresh_token: str,
+) -> Optional[RefreshedSession]:
+    """Exchanges the refresh token for a new one
+
+    Every refresh token is used once. A token which was already exchanged
+    was stolen or leaked, so the whole session is revoked together with its
+    access tokens. The session also ends when the user is disabled or their
+    tokens are revoked, e.g. by a password change.
+
+    Returns: None if the token can't be refreshed
+    """
+    session_id = get_session_id(refresh_token)
+    new_refresh_token = create_refresh_token(session_id)
+    user = await rotate_session_async(
+        db,
+        session_id,
+        token_hash=hash_refresh_token(refresh_token),
+        new_token_hash=hash_refresh_token(new_refresh_token),
+    )
+    if user is not None:
+        return RefreshedSession(session_id, *user, new_refresh_token)
+    session = await get_session_async(db, session_id)
+    if session is not None and session.revoked_at is None:
+        if session.token_hash != hash_refresh_token(refresh_token):
+            logger.warning(
+                "Refresh token reused, session revoked",
+                extra={"user": session.user_id},
+            )
+        await revoke_session(db, session_id)
+    return None
+
+
+async def revoke_session(
+    db: AsyncSession,
+    session_id: str,
+    token_hash: Optional[str] = None,
+) -> bool:
+    """Ends the session, its access tokens stop working as well"""
+    revoked = await revoke_session_async(db, session_id, token_hash)
+    if revoked:
+        await revocation_list.revoke(session_id)
+    return revoked
+
+
+async def end_session(db: AsyncSession, refresh_token: str) -> bool:
+    """Ends the session of the latest refresh token, e.g. on logout"""
+    return await revoke_session(
+        db,
+        get_session_id(refresh_token),
+        hash_refresh_token(refresh_token),
+    )
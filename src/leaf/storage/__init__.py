@@ -0,0 +1,8 @@
+from leaf.storage.backends import (
+    LocalStorageBackend,
+    S3StorageBackend,
+    StorageBackend,
+    StorageWriter,
+    StoredObject,
+)
+from leaf.storage.media_storage import get_storage, set_storage_backend
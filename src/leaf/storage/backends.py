@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import abc
+import mimetypes
+from os import makedirs, utime
+from pathlib import Path, PurePosixPath
+from shutil import copyfileobj
+from tempfile import SpooledTemporaryFile
+from typing import IO, Iterable, Iterator, List, NamedTuple, Optional
+from uuid import uuid4
+
+from leaf.config.logger import logger
+
+# Files are copied between storages and sockets in chunks of this size
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class StoredObject(NamedTuple):
+    key: str
+    size: int
+    # Unix timestamp of the last modification
+    modified: float
+
+
+def get_content_type(key: str) -> str:
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+def validate_key(key: str) -> str:
+    """Rejects keys which could point outside of the storage
+
+    Keys are relative POSIX paths, e.g. `images/ab/abcd.jpg`.
+    """
+    path = PurePosixPath(key)
+    if not key or path.is_absolute() or ".." in path.parts:
+        raise ValueError(f"Invalid storage key: {key}")
+    return str(path)
+
+
+class StorageWriter(abc.ABC):
+    """Writes an object to the storage chunk by chunk
+
+    The object becomes visible under its key only after `commit`,
+    `abort` discards everything written so far.
+    """
+
+    @abc.abstractmethod
+    def write(self, data: bytes) -> None:
+        pass
+
+    @abc.abstractmethod
+    def commit(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def abort(self) -> None:
+        pass
+
+
+class StorageBackend(abc.ABC):
+    """Stores media files under string keys, used through `leaf.storage`
+
+    All methods are blocking, async code calls them in a worker thread.
+    """
+
+    @abc.abstractmethod
+    def open_writer(self, key: str) -> StorageWriter:
+        pass
+
+    @abc.abstractmethod
+    def open(self, key: str) -> IO[bytes]:
+        """Opens stored object for reading, raises FileNotFoundError if missing"""
+
+    @abc.abstractmethod
+    def stat(self, key: str) -> Optional[StoredObject]:
+        pass
+
+    @abc.abstractmethod
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        pass
+
+    @abc.abstractmethod
+    def move(self, source_key: str, target_key: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def touch(self, key: str) -> None:
+        """Sets modification time of the object to now"""
+
+    @abc.abstractmethod
+    def delete(self, keys: Iterable[str]) -> None:
+        pass
+
+    def save(self, key: str, file: IO[bytes]) -> None:
+        writer = self.open_writer(key)
+        try:
+            while chunk := file.read(COPY_CHUNK_SIZE):
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit()
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Path of the object on the local filesystem, if it has one"""
+        return None
+
+    def presigned_url(self, key: str, expires_in: int) -> Optional[str]:
+        """Temporary URL under which clients can download the object directly"""
+        return None
+
+
+class LocalStorageWriter(StorageWriter):
+    def __init__(self, path: Path, temporary_path: Path):
+        self.path = path
+        self.temporary_path = temporary_path
+        makedirs(temporary_path.parent, exist_ok=True)
+        self._file = open(temporary_path, "wb")
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+
+    def commit(self) -> None:
+        self._file.close()
+        makedirs(self.path.parent, exist_ok=True)
+        self.temporary_path.replace(self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        self.temporary_path.unlink(missing_ok=True)
+
+
+class LocalStorageBackend(StorageBackend):
+    """Keeps objects as files in the `root` directory
+
+    Objects are written to `root/.tmp` first and renamed into place, so
+    readers never see partially written files.
+    """
+
+    TEMPORARY_DIRECTORY = ".tmp"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / validate_key(key)
+
+    def open_writer(self, key: str) -> LocalStorageWriter:
+        return LocalStorageWriter(
+            self._path(key),
+            self.root / self.TEMPORARY_DIRECTORY / uuid4().hex,
+        )
+
+    def open(self, key: str) -> IO[bytes]:
+        return open(self._path(key), "rb")
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            stat = self._path(key).stat()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return StoredObject(key, stat.st_size, stat.st_mtime)
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        directory = self.root / prefix.rstrip("/")
+        for path in sorted(directory.rglob("*")):
+            if path.is_file():
+                stat = path.stat()
+                yield StoredObject(
+                    path.relative_to(self.root).as_posix(),
+                    stat.st_size,
+                    stat.st_mtime,
+                )
+
+    def move(self, source_key: str, target_key: str) -> None:
+        target = self._path(target_key)
+        makedirs(target.parent, exist_ok=True)
+        self._path(source_key).replace(target)
+
+    def touch(self, key: str) -> None:
+        utime(self._path(key))
+
+    def delete(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self._path(key).unlink(missing_ok=True)
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self._path(key)
+
+
+class S3StorageWriter(StorageWriter):
+    """Uploads an object with S3 multipart upload
+
+    Data is buffered until a part of `part_size` bytes is collected.
+    Objects smaller than one part are uploaded with a single request.
+    """
+
+    def __init__(self, client, bucket: str, key: str, part_size: int):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.upload_id: Optional[str] = None
+        self.parts: List[dict] = []
+        self._buffer = bytearray()
+
+    def _upload_part(self, data: bytes) -> None:
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=get_content_type(self.key),
+            )["UploadId"]
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[: self.part_size])
+            del self._buffer[: self.part_size]
+            self._upload_part(part)
+
+    def commit(self) -> None:
+        if self.upload_id is None:
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                ContentType=get_content_type(self.key),
+            )
+            return
+        if self._buffer:
+            self._upload_part(bytes(self._buffer))
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+    def abort(self) -> None:
+        self._buffer.clear()
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+            )
+
+
+class S3StorageBackend(StorageBackend):
+    """Keeps objects in a bucket of S3 or an S3 compatible service (e.g. MinIO)
+
+    The boto3 client is thread safe and keeps a pool of HTTP connections,
+    so a single client is shared by all threads of the process.
+    """
+
+    # S3 deletes at most this many objects in one request
+    DELETE_BATCH_SIZE = 1000
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        part_size: int = 8 * 1024 * 1024,
+        spool_size: int = 16 * 1024 * 1024,
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.part_size = part_size
+        self.spool_size = spool_size
+
+    def open_writer(self, key: str) -> S3StorageWriter:
+        return S3StorageWriter(
+            self.client,
+            self.bucket,
+            validate_key(key),
+            self.part_size,
+        )
+
+    def open(self, key: str) -> IO[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(key)
+        # Body is a socket stream, spool it so readers can seek
+        file = SpooledTemporaryFile(max_size=self.spool_size)
+        with response["Body"] as body:
+            copyfileobj(body, file, COPY_CHUNK_SIZE)
+        file.seek(0)
+        return file
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except self.client.exceptions.ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        return StoredObject(
+            key,
+            response["ContentLength"],
+            response["LastModified"].timestamp(),
+        )
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                yield StoredObject(
+                    item["Key"],
+                    item["Size"],
+                    item["LastModified"].timestamp(),
+                )
+
+    def _copy(self, source_key: str, target_key: str) -> None:
+        # Copy happens inside of S3, the object isn't downloaded
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket,
+                Key=validate_key(target_key),
+                CopySource={"Bucket": self.bucket, "Key": source_key},
+                ContentType=get_content_type(target_key),
+                MetadataDirective="REPLACE",
+            )
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(source_key)
+
+    def move(self, source_key: str, target_key: str) -> None:
+        self._copy(source_key, target_key)
+        self.client.delete_object(Bucket=self.bucket, Key=source_key)
+
+    def touch(self, key: str) -> None:
+        # S3 objects are immutable, copying an object onto itself
+        # is the only way to update its modification time
+        self._copy(key, key)
+
+    def delete(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        for start in range(0, len(keys), self.DELETE_BATCH_SIZE):
+            batch = keys[start : start + self.DELETE_BATCH_SIZE]
+            response = self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+            for error in response.get("Errors", []):
+                logger.error(f"Object {error['Key']} not deleted: {error['Message']}")
+
+    def presigned_url(self, key: str, expires_in: int) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=expires_in,
+        )
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional
+
+import boto3
+from botocore.config import Config
+
+from leaf.config.config import get_settings
+from leaf.storage.backends import (
+    LocalStorageBackend,
+    S3StorageBackend,
+    StorageBackend,
+)
+
+settings = get_settings()
+
+
+def create_s3_client():
+    return boto3.session.Session().client(
+        "s3",
+        endpoint_url=settings.S3_ENDPOINT_URL or None,
+        region_name=settings.S3_REGION or None,
+        aws_access_key_id=settings.S3_ACCESS_KEY_ID or None,
+        aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY or None,
+        config=Config(
+            max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+            retries={"mode": "standard", "max_attempts": 3},
+            # S3 compatible services usually don't support bucket subdomains
+            s3={"addressing_style": "path" if settings.S3_ENDPOINT_URL else "auto"},
+        ),
+    )
+
+
+def create_storage_backend() -> StorageBackend:
+    if settings.STORAGE_BACKEND == "s3":
+        return S3StorageBackend(
+            create_s3_client(),
+            bucket=settings.S3_BUCKET,
+            part_size=settings.S3_MULTIPART_PART_SIZE,
+        )
+    return LocalStorageBackend(Path("/", settings.MEDIA_FOLDER))
+
+
+# Created on first use, so forked worker processes don't share connections
+storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    global storage
+    if storage is None:
+        storage = create_storage_backend()
+    return storage
+
+
+def set_storage_backend(backend: Optional[StorageBackend]) -> None:
+    """Replaces the media storage, e.g. with a temporary directory in tests"""
+    global storage
+    storage = backend
@@ -1,42 +1,367 @@
 from __future__ import annotations
 
-import smtplib
-from os import remove
-from pathlib import Path
-from typing import Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+from typing import List, Sequence, Tuple
 
 from celery import shared_task
+from kombu.exceptions import OperationalError
 from PIL import Image
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 
-from leaf.config import logger
+from leaf.auth import generate_confirmation_token, get_password_hash
+from leaf.config.config import get_settings
+from leaf.config.database import SessionLocal
+from leaf.config.logger import logger
+from leaf.emails import Email, compose_email
+from leaf.mail import get_mail_dispatcher, get_mail_outbox
+from leaf.media import get_resized_resource_key, remove_unreferenced_media
+from leaf.models import Post
+from leaf.repositories.posts import (
+    get_max_post_id,
+    get_timeline_recipients,
+    repair_post_counts,
+)
+from leaf.repositories.users import get_profile_images
+from leaf.storage import StorageBackend, get_storage
+from leaf.timeline import get_timeline_store, timeline_score
+from leaf.user_import import UserImport, read_user_rows
+
+try:
+    # Registers AVIF encoder and decoder in Pillow
+    import pillow_avif
+except ImportError:  # pragma: no cover
+    pillow_avif = None
 
 Width = str
 Height = str
 Size = Tuple[Width, Height]
 
+# Encoder settings per format, formats which are not listed use Pillow defaults
+IMAGE_SAVE_OPTIONS = {
+    "JPEG": {"quality": 85, "optimize": True, "progressive": True},
+    "PNG": {"optimize": True},
+    "WEBP": {"quality": 80, "method": 4},
+    "AVIF": {"quality": 60, "speed": 6},
+}
+
+
+def save_image(
+    storage: StorageBackend,
+    image: Image.Image,
+    key: str,
+    image_format: str,
+) -> None:
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **IMAGE_SAVE_OPTIONS.get(image_format, {}))
+    buffer.seek(0)
+    storage.save(key, buffer)
+
+
+def convert_for_variants(image: Image.Image) -> Image.Image:
+    """Converts palette, grayscale or CMYK images to RGB(A), the modes which
+    every variant format can encode"""
+    if image.mode in ("RGB", "RGBA"):
+        return image
+    has_alpha = "A" in image.getbands() or "transparency" in image.info
+    return image.convert("RGBA" if has_alpha else "RGB")
+
 
 @shared_task
-def resize_image(file_path: str, image_sizes: Sequence[Size]):
-    path = Path(file_path)
-    for width, height in image_sizes:
-        size = (
-            int(width),
-            int(height),
+def resize_image(
+    resource_key: str,
+    image_sizes: Sequence[Size],
+    variant_formats: Sequence[str] = (),
+):
+    """Resizes uploaded image to all `image_sizes` and removes the upload
+
+    The upload is decoded only once. JPEG files are decoded directly at a
+    reduced scale (`Image.draft`) and every size is derived from the next
+    larger result, so each step resamples as few pixels as possible.
+    Every size is saved in the upload format and additionally in each of
+    `variant_formats` (e.g. WEBP, AVIF) which Pillow can encode.
+    Encoding and upload of the resized images to the media storage
+    run in parallel on up to `IMAGE_RESIZE_WORKERS` threads. Variants which
+    fail are logged and skipped, the upload is kept when an image in the
+    upload format fails.
+    """
+    storage = get_storage()
+    sizes = sorted(
+        {(int(width), int(height)) for width, height in image_sizes},
+        key=lambda size: size[0] * size[1],
+        reverse=True,
+    )
+    if not sizes:
+        logger.warning(f"No image sizes to resize {resource_key} to")
+        return
+    with storage.open(resource_key) as file, Image.open(file) as image:
+        image_format = image.format
+        if image_format == "JPEG":
+            image.draft(image.mode, sizes[0])
+        image.thumbnail(sizes[0], reducing_gap=3.0)
+        # Copy, because closing the file releases the decoded pixels
+        current = image.copy()
+    resized_images = [(current, get_resized_resource_key(resource_key, sizes[0][1]))]
+    for size in sizes[1:]:
+        current = current.copy()
+        current.thumbnail(size, reducing_gap=3.0)
+        resized_images.append(
+            (current, get_resized_resource_key(resource_key, size[1])),
         )
-        image = Image.open(path, mode="r")
-        image.thumbnail(size)
-        image.save(
-            str(path.parent) + "/" + str(height) + "_" + str(path.name),
+    # Loads all Pillow plugins, so Image.SAVE lists every supported encoder
+    Image.init()
+    variant_formats = [
+        variant_format.upper()
+        for variant_format in variant_formats
+        if variant_format.upper() in Image.SAVE
+        and variant_format.upper() != image_format
+    ]
+    jobs = []
+    for resized_image, resized_key in resized_images:
+        jobs.append((storage, resized_image, resized_key, image_format))
+        if variant_formats:
+            variant_image = convert_for_variants(resized_image)
+        for variant_format in variant_formats:
+            variant_key = PurePosixPath(resized_key).with_suffix(
+                f".{variant_format.lower()}",
+            )
+            jobs.append((storage, variant_image, str(variant_key), variant_format))
+    max_workers = min(len(jobs), get_settings().IMAGE_RESIZE_WORKERS)
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        futures = [executor.submit(save_image, *job) for job in jobs]
+    failed = []
+    for (_, _, key, save_format), future in zip(jobs, futures):
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Image {key} not saved as {save_format}: {error!r}")
+            failed.append((save_format, error))
+    for save_format, error in failed:
+        # The upload is needed to create the image again
+        if save_format == image_format:
+            raise error
+    logger.debug(f"Image resized, {len(jobs) - len(failed)} of {len(jobs)} saved")
+    storage.delete([resource_key])
+    logger.debug(f"Base image removed from storage: {resource_key}")
+
+
+@shared_task
+def collect_media_garbage(grace_period: int):
+    """Removes images which are not used as a profile image by any user"""
+    with SessionLocal() as db:
+        referenced = get_profile_images(db)
+    removed = remove_unreferenced_media(get_storage(), referenced, grace_period)
+    logger.info(f"Media garbage collected, {len(removed)} files removed")
+
+
+@shared_task
+def reconcile_post_counts(batch_size: int) -> int:
+    """Repairs like and comment counts of all posts, batch by batch
+
+    Counts are changed incrementally, this fixes the ones which drifted,
+    e.g. after likes were removed with a bulk delete.
+
+    Returns: number of repaired posts
+    """
+    repaired = 0
+    with SessionLocal() as db:
+        max_post_id = get_max_post_id(db)
+        # Short transactions, so likes of other posts are not blocked
+        for first_id in range(1, max_post_id + 1, batch_size):
+            repaired += repair_post_counts(db, first_id, first_id + batch_size - 1)
+    logger.info(f"Post counts reconciled, {repaired} posts repaired")
+    return repaired
+
+
+@shared_task
+def fan_out_post(post_id: int) -> int:
+    """Adds a new post to home timelines of its author and members of
+    the author's groups
+
+    Returns: number of timelines the post was added to
+    """
+    timeline = get_timeline_store()
+    if timeline is None:
+        return 0
+    with SessionLocal() as db:
+        recipients = get_timeline_recipients(
+            db,
+            post_id,
+            get_settings().TIMELINE_FANOUT_MAX_GROUP_SIZE,
         )
-    logger.debug(f"Image resized to all formats")
-    remove(path)
-    logger.debug(f"Base image removed from path: {file_path}")
+    if recipients is None:
+        return 0
+    created_at, user_ids = recipients
+    return timeline.add(post_id, timeline_score(created_at), user_ids)
+
+
+# New posts are fanned out after the commit, so the worker can read them.
+# Commit listeners are added only to sessions which inserted posts.
+@event.listens_for(Post, "after_insert")
+def _collect_new_post(mapper, connection, post: Post):
+    if not get_settings().TIMELINE_FANOUT_ENABLED:
+        return
+    session = object_session(post)
+    if not event.contains(session, "after_commit", _fan_out_new_posts):
+        event.listen(session, "after_commit", _fan_out_new_posts)
+        event.listen(session, "after_rollback", _forget_new_posts)
+    session.info.setdefault("new_post_ids", []).append(post.id)
+
+
+def _fan_out_new_posts(session: Session):
+    for post_id in session.info.pop("new_post_ids", []):
+        try:
+            fan_out_post.delay(post_id)
+        except OperationalError:
+            # The post is committed, a broker outage must not fail the
+            # request, the post is only missing in home timelines
+            logger.exception(f"Fan out of post {post_id} not queued")
+
+
+def _forget_new_posts(session: Session):
+    session.info.pop("new_post_ids", None)
 
 
 @shared_task
-def send_mail(to: str, msg: str, smtp_config: dict):
-    with smtplib.SMTP(smtp_config["HOST"], smtp_config["PORT"]) as server:
-        server.starttls()
-        server.login(smtp_config["USERNAME"], smtp_config["PASSWORD"])
-        server.sendmail(smtp_config["EMAIL"], to, msg)
-    logger.debug("Message sent", extra={"user": to})
+def deliver_mail() -> int:
+    """Renders a batch of emails from the outbox and sends them over
+    the worker's SMTP connection
+
+    Emails which failed with a transient error are put back to the outbox
+    with the number of failed deliveries and sent again by a later run,
+    which is delayed exponentially. They are dropped after
+    `MAIL_MAX_RETRIES` failed deliveries.
+
+    Returns: number of sent emails
+    """
+    settings = get_settings()
+    outbox = get_mail_outbox()
+    entries = outbox.pop(settings.MAIL_BATCH_SIZE)
+    if not entries:
+        return 0
+    rendered = []
+    for entry in entries:
+        # Requeued emails are followed by the number of failed deliveries
+        email, failures = entry[:3], entry[3] if len(entry) > 3 else 0
+        try:
+            rendered.append((email, failures, compose_email(*email)))
+        except Exception:
+            logger.exception(
+                f"Email {email[1]} can't be rendered",
+                extra={"user": email[0]},
+            )
+    postponed = get_mail_dispatcher().send([mail for _, _, mail in rendered])
+    if postponed:
+        # Dispatcher returns the same mail objects which it was given
+        postponed_ids = {id(mail) for mail in postponed}
+        requeued = []
+        for email, failures, mail in rendered:
+            if id(mail) not in postponed_ids:
+                continue
+            if failures >= settings.MAIL_MAX_RETRIES:
+                logger.error(
+                    f"Email {email[1]} dropped after {failures + 1} failed deliveries",
+                    extra={"user": email[0]},
+                )
+                continue
+            requeued.append((*email, failures + 1))
+        if requeued:
+            outbox.push(requeued)
+            # Continues the backoff of the dispatcher which has already
+            # retried every email MAIL_MAX_RETRIES times
+            failures = min(entry[3] for entry in requeued)
+            deliver_mail.apply_async(
+                countdown=settings.MAIL_RETRY_BACKOFF
+                * 2 ** (settings.MAIL_MAX_RETRIES + failures - 1),
+            )
+    logger.debug(f"Mail batch delivered, {len(rendered) - len(postponed)} sent")
+    return len(rendered) - len(postponed)
+
+
+def queue_emails(emails: Sequence[Email]) -> None:
+    """Adds emails to the outbox and schedules their delivery in batches
+
+    Only the template name and parameters are queued, the worker renders
+    the message, so request handlers don't pay for it.
+    """
+    batch_size = get_settings().MAIL_BATCH_SIZE
+    get_mail_outbox().push(emails)
+    for _ in range(0, len(emails), batch_size):
+        deliver_mail.delay()
+
+
+def queue_confirmation_emails(emails: Sequence[str]) -> None:
+    settings = get_settings()
+    queue_emails(
+        [
+            (
+                email,
+                "confirmation",
+                {
+                    "confirmation_token": generate_confirmation_token(
+                        email,
+                        secret_key=settings.SECRET_KEY,
+                        security_password_salt=settings.SECURITY_PASSWORD_SALT,
+                    ),
+                },
+            )
+            for email in emails
+        ],
+    )
+
+
+@shared_task(bind=True)
+def import_users(self, key: str, import_format: str) -> dict:
+    """Creates users from an uploaded CSV or NDJSON file in the storage
+
+    Users are created disabled and their confirmation emails are queued
+    after every batch. Passwords are hashed in a pool of threads, bcrypt
+    releases the GIL, and workers of the prefork pool are daemonic, so they
+    can't start processes of their own. Counters
+    are published as `PROGRESS` state of the task after every batch, the
+    file is removed at the end.
+
+    Returns: numbers of processed, created, skipped and invalid rows and
+    the first errors
+    """
+    settings = get_settings()
+    storage = get_storage()
+    workers = settings.USER_IMPORT_HASH_WORKERS
+    try:
+        with ThreadPoolExecutor(workers) as executor, SessionLocal() as db:
+
+            def hash_passwords(passwords: Sequence[str]) -> List[str]:
+                return list(executor.map(get_password_hash, passwords))
+
+            user_import = UserImport(
+                db,
+                hash_passwords,
+                settings.USER_IMPORT_BATCH_SIZE,
+            )
+            with storage.open(key) as file:
+                for created in user_import.run(read_user_rows(file, import_format)):
+                    queue_confirmation_emails(created)
+                    # Request id is missing when the task is called directly
+                    if self.request.id:
+                        self.update_state(
+                            state="PROGRESS",
+                            meta=user_import.stats(),
+                        )
+    finally:
+        storage.delete([key])
+    stats = user_import.stats()
+    logger.info(
+        f"Users imported, {stats['created']} created, {stats['skipped']} skipped, "
+        f"{stats['invalid']} invalid",
+    )
+    return stats
+
+
+@shared_task
+def send_mail(to: str, msg: str, smtp_config: dict | None = None):
+    """Sends a single mail, kept for messages queued before the outbox
+
+    SMTP credentials are taken from the worker settings.
+    """
+    get_mail_dispatcher().send([(to, msg)])
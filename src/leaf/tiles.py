@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from math import asinh, atan, degrees, pi, radians, sinh, tan
+from typing import Iterator, Tuple
+
+# Web Mercator (EPSG:3857) tiles, the scheme used by OSM and Mapbox
+WEB_MERCATOR_SRID = 3857
+EARTH_RADIUS = 6378137
+# Half of the width of the world in Web Mercator meters
+MERCATOR_ORIGIN = pi * EARTH_RADIUS
+MAX_ZOOM = 22
+# Mercator can't show the poles, the world ends at this latitude
+MAX_LATITUDE = 85.0511287798066
+
+# Min longitude, min latitude, max longitude, max latitude
+Bounds = Tuple[float, float, float, float]
+
+
+def tile_size(z: int) -> float:
+    """Width of a tile at zoom level `z` in Web Mercator meters"""
+    return 2 * MERCATOR_ORIGIN / 2**z
+
+
+def is_valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z
+
+
+def _to_longitude_latitude(mercator_x: float, mercator_y: float) -> Tuple[float, float]:
+    return (
+        degrees(mercator_x / EARTH_RADIUS),
+        degrees(atan(sinh(mercator_y / EARTH_RADIUS))),
+    )
+
+
+def tile_bounds(z: int, x: int, y: int, buffer: float = 0) -> Bounds:
+    """Longitude and latitude bounds of the tile
+
+    Args:
+        buffer (float): Margin added on every side as a fraction of tile width
+    """
+    size = tile_size(z)
+    margin = size * buffer
+    min_x = -MERCATOR_ORIGIN + x * size - margin
+    max_y = MERCATOR_ORIGIN - y * size + margin
+    return (
+        *_to_longitude_latitude(min_x, max_y - size - 2 * margin),
+        *_to_longitude_latitude(min_x + size + 2 * margin, max_y),
+    )
+
+
+def tile_containing(longitude: float, latitude: float, z: int) -> Tuple[int, int]:
+    """X and y of the tile at zoom level `z` which contains the point"""
+    tiles = 2**z
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    x = int((longitude + 180) / 360 * tiles)
+    y = int((1 - asinh(tan(radians(latitude))) / pi) / 2 * tiles)
+    return min(max(x, 0), tiles - 1), min(max(y, 0), tiles - 1)
+
+
+def tiles_containing(
+    longitude: float,
+    latitude: float,
+    max_zoom: int,
+) -> Iterator[Tuple[int, int, int]]:
+    """Tiles of every zoom level up to `max_zoom` which contain the point"""
+    for z in range(max_zoom + 1):
+        yield (z, *tile_containing(longitude, latitude, z))
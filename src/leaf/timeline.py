@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from starlette.concurrency import run_in_threadpool
+
+from leaf.config.config import get_settings
+
+settings = get_settings()
+
+# Post id and its creation time as timeline score
+TimelineEntry = Tuple[int, int]
+# Digits of the largest bigint
+POST_ID_WIDTH = 19
+
+
+def timeline_score(created_at: datetime) -> int:
+    """Creation time in microseconds, exactly representable as a Redis score"""
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return round(created_at.timestamp() * 1_000_000)
+
+
+class TimelineStore:
+    """Home timelines of users, kept in Redis sorted sets
+
+    Every user has a set of ids of posts, scored by their creation time,
+    which is trimmed to the `max_length` newest posts. Reading a page is
+    a single range query of one set. Requests read with `range_async` on
+    `async_client`, without it the blocking read runs in the thread pool.
+    """
+
+    # Recipients added to Redis in one round trip
+    PIPELINE_SIZE = 1000
+
+    def __init__(
+        self,
+        client: Redis,
+        max_length: int,
+        prefix: str = "leaf:timeline",
+        async_client: Optional[AsyncRedis] = None,
+    ):
+        self.client = client
+        self.async_client = async_client
+        self.max_length = max_length
+        self.prefix = prefix
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.prefix}:{user_id}"
+
+    @staticmethod
+    def _member(post_id: int) -> str:
+        # Redis orders members with equal scores as strings, zero padding
+        # makes it the same order as of the ids
+        return f"{post_id:0{POST_ID_WIDTH}d}"
+
+    def add(self, post_id: int, score: int, user_ids: Iterable[int]) -> int:
+        """Adds the post to timelines of the users, returns number of users"""
+        added = 0
+        pipeline = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            key = self._key(user_id)
+            pipeline.zadd(key, {self._member(post_id): score})
+            pipeline.zremrangebyrank(key, 0, -self.max_length - 1)
+            added += 1
+            if added % self.PIPELINE_SIZE == 0:
+                pipeline.execute()
+        pipeline.execute()
+        return added
+
+    def range(
+        self,
+        user_id: int,
+        before: Optional[TimelineEntry],
+        count: int,
+    ) -> List[TimelineEntry]:
+        """Up to `count` newest entries older than `before`
+
+        Entries are ordered like the feed, by score and post id descending.
+        """
+        key = self._key(user_id)
+        if before is None:
+            raw = self.client.zrevrange(key, 0, count - 1, withscores=True)
+            return self._entries(raw)
+        pipeline = self.client.pipeline(transaction=False)
+        self._range_before(pipeline, key, before, count)
+        return self._entries_before(before, count, *pipeline.execute())
+
+    async def range_async(
+        self,
+        user_id: int,
+        before: Optional[TimelineEntry],
+        count: int,
+    ) -> List[TimelineEntry]:
+        """`range` which doesn't block the event loop"""
+        if self.async_client is None:
+            return await run_in_threadpool(self.range, user_id, before, count)
+        key = self._key(user_id)
+        if before is None:
+            raw = await self.async_client.zrevrange(
+                key,
+                0,
+                count - 1,
+                withscores=True,
+            )
+            return self._entries(raw)
+        pipeline = self.async_client.pipeline(transaction=False)
+        self._range_before(pipeline, key, before, count)
+        return self._entries_before(before, count, *await pipeline.execute())
+
+    @staticmethod
+    def _entries(raw: list) -> List[TimelineEntry]:
+        return [(int(member), int(score)) for member, score in raw]
+
+    @staticmethod
+    def _range_before(pipeline, key: str, before: TimelineEntry, count: int):
+        # Entries with the score of `before`, which are filtered by post id,
+        # and up to `count` older ones
+        _, before_score = before
+        pipeline.zrevrangebyscore(
+            key,
+            before_score,
+            before_score,
+            withscores=True,
+        )
+        pipeline.zrevrangebyscore(
+            key,
+            f"({before_score}",
+            "-inf",
+            start=0,
+            num=count,
+            withscores=True,
+        )
+
+    def _entries_before(
+        self,
+        before: TimelineEntry,
+        count: int,
+        same_score: list,
+        older: list,
+    ) -> List[TimelineEntry]:
+        before_id, before_score = before
+        entries = [
+            (post_id, score)
+            for post_id, score in self._entries([*same_score, *older])
+            if score < before_score or post_id < before_id
+        ]
+        return entries[:count]
+
+    def exists(self, user_id: int) -> bool:
+        return bool(self.client.exists(self._key(user_id)))
+
+    def delete(self, user_id: int) -> None:
+        self.client.delete(self._key(user_id))
+
+
+# Created on first use, only when fan out on write is enabled
+timeline_store: Optional[TimelineStore] = None
+
+
+def get_timeline_store() -> Optional[TimelineStore]:
+    """Store of precomputed timelines, None when fan out on write is disabled"""
+    global timeline_store
+    if not settings.TIMELINE_FANOUT_ENABLED:
+        return None
+    if timeline_store is None:
+        timeline_store = TimelineStore(
+            Redis.from_url(settings.TIMELINE_REDIS_URL),
+            max_length=settings.TIMELINE_MAX_LENGTH,
+            async_client=AsyncRedis.from_url(settings.TIMELINE_REDIS_URL),
+        )
+    return timeline_store
+
+
+def set_timeline_store(store: Optional[TimelineStore]) -> None:
+    """Replaces the store, e.g. with fakeredis in tests"""
+    global timeline_store
+    timeline_store = store
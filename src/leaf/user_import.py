@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import csv
+import io
+from itertools import islice
+from typing import IO, Callable, Dict, Iterator, List, Sequence, Tuple
+
+import orjson
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from leaf.repositories.users import create_many, get_existing_emails
+from leaf.schemas.users import UserCreateSchema
+
+# Content types of uploaded files and formats they are parsed as
+USER_IMPORT_FORMATS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+}
+
+# Only the first errors are reported, a broken file would produce one per line
+MAX_REPORTED_ERRORS = 100
+
+# Line number of the row in the file and its fields
+ImportRow = Tuple[int, dict]
+
+
+def read_user_rows(file: IO[bytes], import_format: str) -> Iterator[ImportRow]:
+    """Parses users from a CSV file with a header row or from NDJSON
+
+    The file is read line by line, so it is never held in memory as a whole.
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    if import_format == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    elif import_format == "ndjson":
+        for line_number, line in enumerate(text, start=1):
+            if line.strip():
+                try:
+                    row = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    row = None
+                yield line_number, row
+    else:
+        raise ValueError(f"Unknown import format: {import_format}")
+
+
+def _error_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+class UserImport:
+    """Creates users from rows of an uploaded file in batches
+
+    Every batch is inserted with a single statement and committed, rows with
+    emails which already exist are skipped before their passwords are hashed.
+    `hash_passwords` hashes a whole batch at once, so it can spread the work
+    over a process pool.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        hash_passwords: Callable[[Sequence[str]], List[str]],
+        batch_size: int,
+    ):
+        self.db = db
+        self.hash_passwords = hash_passwords
+        self.batch_size = batch_size
+        self.processed = 0
+        self.created = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.errors: List[dict] = []
+
+    def _add_error(self, line: int, message: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def _validate(self, rows: Sequence[ImportRow]) -> Dict[str, UserCreateSchema]:
+        users = {}
+        for line, row in rows:
+            if not isinstance(row, dict):
+                self._add_error(line, "Invalid row")
+                continue
+            try:
+                user = UserCreateSchema(**row)
+            except ValidationError as error:
+                self._add_error(line, _error_message(error))
+                continue
+            if user.email in users:
+                self.skipped += 1
+            else:
+                users[user.email] = user
+        return users
+
+    def _create(self, rows: Sequence[ImportRow]) -> List[str]:
+        users = self._validate(rows)
+        existing = get_existing_emails(self.db, users)
+        new_users = [user for email, user in users.items() if email not in existing]
+        hashed_passwords = self.hash_passwords([user.password for user in new_users])
+        created = create_many(
+            self.db,
+            [
+                {
+                    "email": user.email,
+                    "hashed_password": hashed_password,
+                    "first_name": user.first_name,
+                    "last_name": user.last_name,
+                    "disabled": True,
+                }
+                for user, hashed_password in zip(new_users, hashed_passwords)
+            ],
+        )
+        self.processed += len(rows)
+        self.created += len(created)
+        # Rows created by someone else between the check and the insert as well
+        self.skipped += len(users) - len(created)
+        return created
+
+    def run(self, rows: Iterator[ImportRow]) -> Iterator[List[str]]:
+        """Imports the rows batch by batch
+
+        Yields: emails of users created by every batch
+        """
+        while batch := list(islice(rows, self.batch_size)):
+            yield self._create(batch)
+
+    def stats(self) -> dict:
+        return {
+            "processed": self.processed,
+            "created": self.created,
+            "skipped": self.skipped,
+            "invalid": self.invalid,
+            "errors": self.errors,
+        }
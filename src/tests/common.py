@@ -1,6 +1,10 @@
 from sqlalchemy.orm import Session
 
-from leaf.auth import get_current_user
+from leaf.auth import (
+    get_current_principal,
+    get_current_user,
+    principal_from_user,
+)
 from leaf.main import app
 from leaf.models import User
 from leaf.repositories.users import get_user_by_email
@@ -11,3 +15,6 @@ def force_authenticate(db: Session, user: User):
         db,
         user.email,
     )
+    app.dependency_overrides[get_current_principal] = lambda: principal_from_user(
+        get_user_by_email(db, user.email),
+    )
@@ -1,14 +1,25 @@
 from __future__ import annotations
 
-from os import environ
-
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
-SQLALCHEMY_TESTING_DATABASE_URL = (
-    f"postgresql://{environ.get('POSTGRES_USER')}:{environ.get('POSTGRES_PASSWORD')}"
-    f"@{environ.get('POSTGRES_HOST')}:{environ.get('POSTGRES_PORT')}/test"
-)
+from leaf.config.database import get_database_url
+
+SQLALCHEMY_TESTING_DATABASE_URL = get_database_url(database="test")
 
 engine = create_engine(SQLALCHEMY_TESTING_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autoflush=False, bind=engine)
+
+# NullPool, because TestClient runs every request in its own event loop
+# and asyncpg connections can't be shared between loops
+async_engine = create_async_engine(
+    get_database_url("postgresql+asyncpg", database="test"),
+    poolclass=NullPool,
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    autoflush=False,
+    expire_on_commit=False,
+    bind=async_engine,
+)
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import factory
+
+from leaf.models import Comment, Like, Post
+from tests.factories.common import FactoriesSession
+from tests.factories.threats import ThreatFactory
+from tests.factories.users import UserFactory
+
+
+class PostFactory(factory.alchemy.SQLAlchemyModelFactory):
+    class Meta:
+        model = Post
+        sqlalchemy_session = FactoriesSession
+        sqlalchemy_session_persistence = "commit"
+
+    user = factory.SubFactory(UserFactory)
+    threat = factory.SubFactory(ThreatFactory)
+    content = factory.Faker("sentence")
+    image = factory.Sequence(lambda n: f"images/post{n}.jpg")
+    is_visible = "true"
+
+
+class LikeFactory(factory.alchemy.SQLAlchemyModelFactory):
+    class Meta:
+        model = Like
+        sqlalchemy_session = FactoriesSession
+        sqlalchemy_session_persistence = "commit"
+
+    user = factory.SubFactory(UserFactory)
+    post = factory.SubFactory(PostFactory)
+
+
+class CommentFactory(factory.alchemy.SQLAlchemyModelFactory):
+    class Meta:
+        model = Comment
+        sqlalchemy_session = FactoriesSession
+        sqlalchemy_session_persistence = "commit"
+
+    user = factory.SubFactory(UserFactory)
+    post = factory.SubFactory(PostFactory)
+    content = factory.Faker("sentence")
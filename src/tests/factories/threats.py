@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import factory
+
+from leaf.models import Threat, ThreatCategory
+from tests.factories.common import FactoriesSession
+
+
+class ThreatCategoryFactory(factory.alchemy.SQLAlchemyModelFactory):
+    class Meta:
+        model = ThreatCategory
+        sqlalchemy_session = FactoriesSession
+        sqlalchemy_session_persistence = "commit"
+
+    name = factory.Sequence(lambda n: f"category{n}")
+
+
+class ThreatFactory(factory.alchemy.SQLAlchemyModelFactory):
+    class Meta:
+        model = Threat
+        sqlalchemy_session = FactoriesSession
+        sqlalchemy_session_persistence = "commit"
+
+    class Params:
+        longitude = 21.0122
+        latitude = 52.2297
+
+    location = factory.LazyAttribute(lambda o: f"POINT({o.longitude} {o.latitude})")
+    category = factory.SubFactory(ThreatCategoryFactory)
@@ -3,7 +3,7 @@ from __future__ import annotations
 import factory
 
 from leaf.auth import get_password_hash
-from leaf.models.user import User
+from leaf.models.user import Group, User
 from tests.factories.common import FactoriesSession
 
 
@@ -20,3 +20,19 @@ class UserFactory(factory.alchemy.SQLAlchemyModelFactory):
     first_name = factory.Faker("first_name")
     last_name = factory.Faker("last_name")
     disabled = False
+
+
+class GroupFactory(factory.alchemy.SQLAlchemyModelFactory):
+    class Meta:
+        model = Group
+        sqlalchemy_session = FactoriesSession
+        sqlalchemy_session_persistence = "commit"
+
+    name = factory.Sequence(lambda n: f"group{n}")
+    permissions = 0
+
+    @factory.post_generation
+    def members(self, create, extracted, **kwargs):
+        if create and extracted:
+            self.users.extend(extracted)
+            FactoriesSession.commit()
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+
+from leaf.auth import (
+    create_access_token,
+    create_user_claims,
+    get_current_principal,
+)
+from leaf.cache import (
+    InMemoryCacheBackend,
+    cache_token_version,
+    get_token_version_cache,
+    set_token_version_cache_backend,
+)
+from leaf.config.config import get_settings
+from leaf.models.user import PermissionsType
+from leaf.permissions import decode_permissions
+from leaf.schemas.users import GroupProfileSchema, UserSchema
+
+settings = get_settings()
+
+USER = UserSchema(
+    id=7,
+    email="user@leaf.com",
+    first_name="Leaf",
+    last_name="User",
+    permissions=decode_permissions(PermissionsType.read_threats.value),
+    groups=[GroupProfileSchema(id=3, name="Volunteers")],
+)
+
+
+@pytest.fixture(autouse=True)
+def token_version_cache():
+    previous_backend = get_token_version_cache()
+    set_token_version_cache_backend(InMemoryCacheBackend(max_size=10, ttl=60))
+    with patch.object(settings, "TOKEN_CLAIMS_ENABLED", True):
+        yield
+    set_token_version_cache_backend(previous_backend)
+
+
+def create_token(claims: dict) -> str:
+    return create_access_token(
+        claims,
+        secret_key=settings.SECRET_KEY,
+        algorithm=settings.ALGORITHM,
+        expires_delta=timedelta(minutes=1),
+    )
+
+
+def test_create_user_claims():
+    assert create_user_claims(USER, 2) == {
+        "sub": "user@leaf.com",
+        "uid": 7,
+        "perm": PermissionsType.read_threats.value,
+        "grp": [3],
+        "ver": 2,
+    }
+
+
+@pytest.mark.anyio
+async def test_principal_from_claims_without_database():
+    cache_token_version(USER.id, 2)
+    token = create_token(create_user_claims(USER, 2))
+
+    # Any database access would fail
+    principal = await get_current_principal(token, None, settings)
+
+    assert (principal.id, principal.email, principal.group_ids) == (
+        7,
+        "user@leaf.com",
+        [3],
+    )
+    assert principal.permissions == USER.permissions
+
+
+@pytest.mark.anyio
+async def test_principal_from_revoked_token():
+    cache_token_version(USER.id, 3)
+    token = create_token(create_user_claims(USER, 2))
+
+    with pytest.raises(HTTPException) as error:
+        await get_current_principal(token, None, settings)
+    assert error.value.status_code == 401
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from uuid import uuid4
+
+import fakeredis
+import pytest
+from fakeredis import aioredis
+from fastapi import HTTPException
+
+from leaf.auth import create_access_token, decode_access_token
+from leaf.config.config import get_settings
+from leaf.sessions import (
+    BloomFilter,
+    RevocationList,
+    create_refresh_token,
+    get_revocation_list,
+    get_session_id,
+    revoke_session,
+    set_revocation_list,
+    start_session,
+)
+from tests.database_test import TestingAsyncSessionLocal
+from tests.factories.users import UserFactory
+
+settings = get_settings()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def revocations(clock):
+    previous = get_revocation_list()
+    revocations = RevocationList(ttl=60, capacity=100, error_rate=0.01, clock=clock)
+    set_revocation_list(revocations)
+    yield revocations
+    set_revocation_list(previous)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    added = [uuid4().hex for _ in range(1000)]
+    for item in added:
+        bloom.add(item)
+
+    assert all(item in bloom for item in added)
+    false_positives = sum(uuid4().hex in bloom for _ in range(10000))
+    assert false_positives < 300
+
+
+def test_refresh_token_contains_session_id():
+    session_id = uuid4().hex
+    refresh_token = create_refresh_token(session_id)
+
+    assert get_session_id(refresh_token) == session_id
+    assert create_refresh_token(session_id) != refresh_token
+
+
+@pytest.mark.anyio
+async def test_revoked_session_expires_with_access_tokens(revocations, clock):
+    await revocations.revoke("revoked")
+
+    assert await revocations.is_revoked("revoked")
+    assert not await revocations.is_revoked("live")
+    clock.now += 61
+    assert not await revocations.is_revoked("revoked")
+    # Expired sessions are dropped when the filter is rebuilt
+    assert "revoked" not in revocations._revoked
+
+
+@pytest.mark.anyio
+async def test_revocations_are_shared_through_redis(clock):
+    client = aioredis.FakeRedis()
+    first, second = (
+        RevocationList(
+            ttl=60,
+            capacity=100,
+            error_rate=0.01,
+            client=client,
+            sync_interval=5,
+            clock=clock,
+        )
+        for _ in range(2)
+    )
+    assert not await second.is_revoked("revoked")
+
+    await first.revoke("revoked")
+
+    assert await first.is_revoked("revoked")
+    # Seen by other processes after the next sync
+    clock.now += 5
+    assert await second.is_revoked("revoked")
+    assert second.stats()["revoked_hits"] == 1
+
+
+@pytest.mark.anyio
+async def test_revocations_when_redis_fails(clock):
+    server = fakeredis.FakeServer()
+    revocations = RevocationList(
+        ttl=60,
+        capacity=100,
+        error_rate=0.01,
+        client=aioredis.FakeRedis(server=server),
+        clock=clock,
+    )
+    await revocations.revoke("revoked")
+    server.connected = False
+    clock.now += 5
+
+    # Live sessions pass, hits which can't be checked count as revoked
+    assert not await revocations.is_revoked("live")
+    assert await revocations.is_revoked("revoked")
+    await revocations.revoke("other")
+    assert await revocations.is_revoked("other")
+    assert revocations.stats()["errors"] == 4
+
+
+@pytest.mark.anyio
+async def test_revocations_are_shared_through_database(async_db, clock):
+    user = UserFactory.create()
+    first, second = (
+        RevocationList(
+            ttl=60,
+            capacity=100,
+            error_rate=0.01,
+            sync_interval=5,
+            clock=clock,
+            session_factory=TestingAsyncSessionLocal,
+        )
+        for _ in range(2)
+    )
+    session_id = get_session_id(await start_session(async_db, user.id, 0))
+    assert not await second.is_revoked(session_id)
+
+    previous = get_revocation_list()
+    set_revocation_list(first)
+    try:
+        assert await revoke_session(async_db, session_id)
+    finally:
+        set_revocation_list(previous)
+
+    assert await first.is_revoked(session_id)
+    clock.now += 5
+    assert await second.is_revoked(session_id)
+
+
+@pytest.mark.anyio
+async def test_access_token_of_revoked_session(revocations):
+    token = create_access_token(
+        {"sub": "user@leaf.com", "sid": "revoked"},
+        secret_key=settings.SECRET_KEY,
+        algorithm=settings.ALGORITHM,
+        expires_delta=timedelta(minutes=1),
+    )
+    assert (await decode_access_token(token, None, settings))["sid"] == "revoked"
+
+    await revocations.revoke("revoked")
+
+    with pytest.raises(HTTPException) as error:
+        await decode_access_token(token, None, settings)
+    assert error.value.status_code == 401
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from time import sleep
+
+import fakeredis
+import pytest
+from fakeredis import aioredis
+
+from leaf.cache import InMemoryCacheBackend, RedisCacheBackend
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def create_redis_backend(
+    server: fakeredis.FakeServer,
+    with_async_client: bool = False,
+    **kwargs,
+):
+    return RedisCacheBackend(
+        fakeredis.FakeRedis(server=server),
+        namespace="test",
+        ttl=60,
+        dumps=str.encode,
+        loads=bytes.decode,
+        async_client=aioredis.FakeRedis(server=server) if with_async_client else None,
+        **kwargs,
+    )
+
+
+def test_in_memory_backend_expires_entries():
+    timer = FakeTimer()
+    cache = InMemoryCacheBackend(max_size=10, ttl=5, timer=timer)
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    timer.now = 5
+    assert cache.get("key") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_in_memory_backend_evicts_least_recently_used():
+    cache = InMemoryCacheBackend(max_size=2, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_redis_backend_is_shared_between_processes():
+    server = fakeredis.FakeServer()
+    first = create_redis_backend(server)
+    second = create_redis_backend(server)
+    first.set("key", "value")
+    assert second.get("key") == "value"
+    second.delete("key")
+    assert first.get("key") is None
+
+
+def test_redis_backend_fans_out_invalidation_to_local_caches():
+    server = fakeredis.FakeServer()
+    first = create_redis_backend(server, local=InMemoryCacheBackend(10, 60))
+    second = create_redis_backend(server, local=InMemoryCacheBackend(10, 60))
+    second.start()
+    try:
+        first.set("key", "value")
+        assert second.get("key") == "value"
+        assert second.local.get("key") == "value"
+        first.delete("key")
+        for _ in range(50):
+            if second.local.get("key") is None:
+                break
+            sleep(0.02)
+        assert second.local.get("key") is None
+    finally:
+        second.stop()
+
+
+def test_redis_backend_treats_errors_as_misses():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    cache = create_redis_backend(server)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+    assert cache.stats()["errors"] == 2
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("with_async_client", [True, False])
+async def test_redis_backend_async(with_async_client):
+    server = fakeredis.FakeServer()
+    cache = create_redis_backend(
+        server,
+        with_async_client,
+        local=InMemoryCacheBackend(10, 60),
+    )
+    other = create_redis_backend(server)
+    await cache.set_async("key", "value")
+    assert other.get("key") == "value"
+    cache.local.clear()
+    assert await cache.get_async("key") == "value"
+    assert cache.local.get("key") == "value"
+    await cache.delete_async("key")
+    assert cache.local.get("key") is None
+    assert other.get("key") is None
+    assert await cache.get_async("key") is None
+
+
+@pytest.mark.anyio
+async def test_redis_backend_async_treats_errors_as_misses():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    cache = create_redis_backend(server, with_async_client=True)
+    await cache.set_async("key", "value")
+    assert await cache.get_async("key") is None
+    assert cache.stats()["errors"] == 2
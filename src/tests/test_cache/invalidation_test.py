@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from leaf.cache import invalidate_on_commit
+
+
+@pytest.fixture
+def session():
+    with Session(create_engine("sqlite://")) as session:
+        yield session
+
+
+def test_invalidated_after_commit(session):
+    invalidated = []
+    session.execute(text("SELECT 1"))
+    invalidate_on_commit(session, invalidated.append, "a")
+    invalidate_on_commit(session, invalidated.append, "b")
+    invalidate_on_commit(session, invalidated.append, "a")
+    assert invalidated == []
+
+    session.commit()
+
+    assert invalidated == ["a", "b"]
+    session.commit()
+    assert invalidated == ["a", "b"]
+
+
+def test_rolled_back_changes_are_not_invalidated(session):
+    invalidated = []
+    session.execute(text("SELECT 1"))
+    invalidate_on_commit(session, invalidated.append, "a")
+    with session.begin_nested() as savepoint:
+        invalidate_on_commit(session, invalidated.append, "b")
+        savepoint.rollback()
+    session.commit()
+    assert invalidated == ["a", "b"]
+
+    session.execute(text("SELECT 1"))
+    invalidate_on_commit(session, invalidated.append, "c")
+    session.rollback()
+    session.commit()
+    assert invalidated == ["a", "b"]
+
+
+def test_invalidated_right_away_without_session():
+    invalidated = []
+    invalidate_on_commit(None, invalidated.append, "a")
+    assert invalidated == ["a"]
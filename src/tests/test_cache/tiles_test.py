@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import struct
+
+import pytest
+from geoalchemy2.elements import WKBElement, WKTElement
+
+from leaf.cache import (
+    InMemoryCacheBackend,
+    cache_tile,
+    get_cached_tile,
+    get_tile_cache,
+    invalidate_threat_tiles,
+    set_tile_cache_backend,
+)
+from leaf.cache.tiles import location_coordinates
+from leaf.config.config import get_settings
+from leaf.tiles import tile_bounds, tile_containing, tiles_containing
+
+settings = get_settings()
+
+# Warsaw
+LONGITUDE, LATITUDE = 21.0122, 52.2297
+
+
+@pytest.fixture
+def tile_cache():
+    previous_backend = get_tile_cache()
+    backend = InMemoryCacheBackend(max_size=100, ttl=60)
+    set_tile_cache_backend(backend)
+    yield backend
+    set_tile_cache_backend(previous_backend)
+
+
+def test_tile_containing():
+    assert tile_containing(LONGITUDE, LATITUDE, 0) == (0, 0)
+    assert tile_containing(LONGITUDE, LATITUDE, 12) == (2287, 1348)
+    # Points beyond the latitude covered by Web Mercator go to edge tiles
+    assert tile_containing(180, -90, 2) == (3, 3)
+
+
+def test_tile_bounds_contain_point():
+    x, y = tile_containing(LONGITUDE, LATITUDE, 15)
+    min_longitude, min_latitude, max_longitude, max_latitude = tile_bounds(15, x, y)
+    assert min_longitude <= LONGITUDE < max_longitude
+    assert min_latitude < LATITUDE <= max_latitude
+
+
+def test_tile_bounds_with_buffer():
+    bounds = tile_bounds(1, 1, 0)
+    buffered_bounds = tile_bounds(1, 1, 0, buffer=0.5)
+    assert bounds == pytest.approx((0, 0, 180, 85.0511287798066))
+    assert buffered_bounds[0] == pytest.approx(-90)
+    assert buffered_bounds[1] < 0
+
+
+@pytest.mark.parametrize(
+    "location",
+    [
+        "POINT(21.0122 52.2297)",
+        "SRID=4326;POINT (21.0122 52.2297)",
+        WKTElement("POINT(21.0122 52.2297)"),
+        WKBElement(struct.pack("<BIdd", 1, 1, LONGITUDE, LATITUDE)),
+        WKBElement(
+            struct.pack(">BIIdd", 0, 0x20000001, 4326, LONGITUDE, LATITUDE),
+            extended=True,
+        ),
+        WKBElement(struct.pack("<BIdd", 1, 1, LONGITUDE, LATITUDE).hex()),
+    ],
+)
+def test_location_coordinates(location):
+    assert location_coordinates(location) == pytest.approx((LONGITUDE, LATITUDE))
+
+
+def test_location_coordinates_of_empty_location():
+    assert location_coordinates(None) is None
+    assert location_coordinates("POINT EMPTY") is None
+
+
+def test_invalidate_threat_tiles(tile_cache):
+    tiles = list(tiles_containing(LONGITUDE, LATITUDE, settings.TILE_CACHE_MAX_ZOOM))
+    for tile in tiles:
+        cache_tile(*tile, b"tile")
+    cache_tile(0, 0, 0, b"world")
+    other_tile = (12, *tile_containing(LONGITUDE + 1, LATITUDE, 12))
+    cache_tile(*other_tile, b"other")
+
+    invalidate_threat_tiles([(LONGITUDE, LATITUDE)])
+
+    for tile in tiles:
+        assert get_cached_tile(*tile) is None
+    assert get_cached_tile(*other_tile) == b"other"
+
+
+def test_tiles_above_max_zoom_not_cached(tile_cache):
+    z = settings.TILE_CACHE_MAX_ZOOM + 1
+    cache_tile(z, 0, 0, b"tile")
+    assert len(tile_cache) == 0
+    cache_tile(z - 1, 0, 0, b"")
+    assert get_cached_tile(z - 1, 0, 0) == b""
@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+from leaf.cache import cache_token_version, get_cached_token_version
+from leaf.models import User
+from tests.factories.users import UserFactory
+
+
+def test_token_version_invalidated_after_commit(db):
+    user = UserFactory.create()
+    cache_token_version(user.id, 0)
+    db.get(User, user.id).token_version += 1
+    db.flush()
+    assert get_cached_token_version(user.id) == 0
+    db.commit()
+    assert get_cached_token_version(user.id) is None
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import fakeredis
+
+from leaf.cache import (
+    InMemoryCacheBackend,
+    RedisCacheBackend,
+    cache_user,
+    get_cached_user,
+    get_user_cache,
+    set_user_cache_backend,
+)
+from leaf.cache.users import dump_user, load_user
+from leaf.models import User
+from leaf.repositories.users import get_user_by_email, update_one
+from tests.factories.users import UserFactory
+
+
+def test_update_one_invalidates_cached_user(db):
+    user = UserFactory.create(first_name="before_update")
+    cache_user(get_user_by_email(db, user.email), None)
+    assert get_cached_user(user.email, None) is not None
+    update_one(db, user.email, first_name="after_update")
+    assert get_cached_user(user.email, None) is None
+
+
+def test_changed_user_is_invalidated_after_commit(db):
+    user = UserFactory.create(first_name="before_update")
+    cache_user(get_user_by_email(db, user.email), None)
+    db.get(User, user.id).first_name = "after_update"
+    db.flush()
+    # Another request could still read the old profile and cache it again
+    assert get_cached_user(user.email, None) is not None
+    db.commit()
+    assert get_cached_user(user.email, None) is None
+
+
+def test_user_cache_with_redis_backend(db):
+    previous_backend = get_user_cache()
+    set_user_cache_backend(
+        RedisCacheBackend(
+            fakeredis.FakeRedis(),
+            namespace="leaf:users",
+            ttl=60,
+            dumps=dump_user,
+            loads=load_user,
+        ),
+    )
+    try:
+        user = UserFactory.create()
+        schema = get_user_by_email(db, user.email)
+        cache_user(schema, None)
+        assert get_cached_user(user.email, None) == schema
+        update_one(db, user.email, first_name="after_update")
+        assert get_cached_user(user.email, None) is None
+    finally:
+        set_user_cache_backend(previous_backend)
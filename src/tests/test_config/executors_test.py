@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import asyncio
+from time import sleep
+
+import pytest
+from prometheus_client import REGISTRY
+
+from leaf.auth import get_password_hash_async, verify_password_async
+from leaf.config.executors import BoundedExecutor, ExecutorSaturated
+from leaf.main import executor_saturated_handler
+
+
+@pytest.mark.anyio
+async def test_bounded_executor_run():
+    executor = BoundedExecutor("test", workers=2)
+    assert await executor.run(sum, [1, 2, 3]) == 6
+    assert executor.stats()["completed"] == 1
+    assert executor.stats()["pending"] == 0
+    executor.shutdown()
+
+
+@pytest.mark.anyio
+async def test_bounded_executor_rejects_when_queue_is_full():
+    executor = BoundedExecutor("test", workers=1, max_queue_depth=1)
+    results = await asyncio.gather(
+        *(executor.run(sleep, 0.1) for _ in range(3)),
+        return_exceptions=True,
+    )
+    rejected = [r for r in results if isinstance(r, ExecutorSaturated)]
+    assert len(rejected) == 1
+    assert rejected[0].name == "test"
+    assert executor.stats()["rejected"] == 1
+    executor.shutdown()
+
+
+@pytest.mark.anyio
+async def test_bounded_executor_metrics():
+    def sample(name: str) -> float:
+        return REGISTRY.get_sample_value(name, {"executor": "metrics"}) or 0
+
+    rejections = sample("leaf_executor_rejections_total")
+    executor = BoundedExecutor("metrics", workers=1, max_queue_depth=1)
+    first = asyncio.ensure_future(executor.run(sleep, 0.1))
+    second = asyncio.ensure_future(executor.run(sleep, 0.1))
+    await asyncio.sleep(0)
+    assert sample("leaf_executor_pending_calls") == 2
+    assert sample("leaf_executor_queue_depth") == 1
+    with pytest.raises(ExecutorSaturated):
+        await executor.run(sleep, 0.1)
+    assert sample("leaf_executor_rejections_total") == rejections + 1
+    await asyncio.gather(first, second)
+    assert sample("leaf_executor_pending_calls") == 0
+    assert sample("leaf_executor_queue_depth") == 0
+    executor.shutdown()
+
+
+@pytest.mark.anyio
+async def test_saturated_executor_answers_service_unavailable():
+    response = await executor_saturated_handler(None, ExecutorSaturated("test", 1))
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+@pytest.mark.anyio
+async def test_password_hashing_in_executor():
+    hashed_password = await get_password_hash_async("Elektryk1@")
+    assert await verify_password_async("Elektryk1@", hashed_password)
+    assert not await verify_password_async("wrong", hashed_password)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+from celery.signals import task_postrun, task_prerun
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from leaf.config.celery import celery, serve_metrics, settings
+from leaf.config.metrics import (
+    UNMATCHED_ROUTE,
+    MetricsMiddleware,
+    generate_metrics,
+    get_registry,
+    instrument_engine,
+)
+from leaf.responses import SchemaRoute
+
+engine = create_engine("sqlite://")
+instrument_engine(engine, "test")
+
+router = APIRouter(route_class=SchemaRoute)
+
+
+@router.get("/items/{item_id}")
+def get_item(item_id: int):
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        connection.execute(text("SELECT 2"))
+    return {"id": item_id}
+
+
+app = FastAPI()
+app.add_middleware(MetricsMiddleware)
+app.include_router(router)
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_requests_are_labeled_by_route():
+    labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    count = sample("leaf_http_request_seconds_count", **labels)
+    with TestClient(app) as client:
+        assert client.get("/items/1").status_code == 200
+        assert client.get("/items/2").status_code == 200
+        assert client.get("/unknown").status_code == 404
+    assert sample("leaf_http_request_seconds_count", **labels) == count + 2
+    assert sample(
+        "leaf_http_request_seconds_count",
+        method="GET",
+        route=UNMATCHED_ROUTE,
+        status="404",
+    )
+    assert sample("leaf_http_requests_in_progress") == 0
+
+
+def test_request_queries_are_counted():
+    labels = {"method": "GET", "route": "/items/{item_id}"}
+    queries = sample("leaf_http_request_db_queries_sum", **labels)
+    with TestClient(app) as client:
+        client.get("/items/1")
+    assert sample("leaf_http_request_db_queries_sum", **labels) == queries + 2
+    assert sample("leaf_http_request_db_seconds_sum", **labels) > 0
+
+
+def test_queries_outside_of_requests_are_timed():
+    count = sample("leaf_db_query_seconds_count", engine="test")
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM missing"))
+    assert sample("leaf_db_query_seconds_count", engine="test") == count + 1
+
+
+def test_task_durations():
+    task = celery.tasks["leaf.tasks.send_mail"]
+    labels = {"task": task.name, "state": "SUCCESS"}
+    count = sample("leaf_celery_task_seconds_count", **labels)
+    task_prerun.send(sender=task, task_id="metrics-test", task=task)
+    task_postrun.send(
+        sender=task,
+        task_id="metrics-test",
+        task=task,
+        state="SUCCESS",
+    )
+    assert sample("leaf_celery_task_seconds_count", **labels) == count + 1
+
+
+def test_worker_metrics_need_multiprocess_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    with patch.object(settings, "CELERY_METRICS_PORT", 9100), patch(
+        "leaf.config.celery.start_http_server",
+    ) as start_http_server:
+        serve_metrics()
+        start_http_server.assert_not_called()
+        monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+        serve_metrics()
+        start_http_server.assert_called_once()
+
+
+def test_metrics_of_processes_are_aggregated(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    observe = (
+        "from leaf.config.metrics import REQUEST_SECONDS, REQUESTS_IN_PROGRESS\n"
+        "REQUEST_SECONDS.labels('GET', '/items/{item_id}', '200').observe(0.01)\n"
+        "REQUESTS_IN_PROGRESS.inc()\n"
+    )
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", observe], check=True)
+    assert get_registry() is not REGISTRY
+    metrics = generate_metrics().decode()
+    assert (
+        'leaf_http_request_seconds_count{method="GET",route="/items/{item_id}",'
+        'status="200"} 2.0' in metrics
+    )
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import NullPool, QueuePool, create_engine, text
+from sqlalchemy.exc import TimeoutError
+
+from leaf.config.database import (
+    create_async_database_engine,
+    engine_options,
+    settings,
+)
+from leaf.config.pool_metrics import metered_pool_class
+
+
+def sample(name: str, profile: str) -> float:
+    return REGISTRY.get_sample_value(name, {"engine": profile}) or 0
+
+
+def test_metered_pool_counts_connections_in_use():
+    engine = create_engine(
+        "sqlite://",
+        poolclass=metered_pool_class(QueuePool, "test-in-use"),
+        pool_size=1,
+        max_overflow=1,
+    )
+    checkouts = sample("leaf_db_pool_checkout_seconds_count", "test-in-use")
+    first = engine.connect()
+    second = engine.connect()
+    assert first.execute(text("SELECT 1")).scalar() == 1
+    assert sample("leaf_db_pool_connections_in_use", "test-in-use") == 2
+    assert sample("leaf_db_pool_overflow_connections", "test-in-use") == 1
+    first.close()
+    second.close()
+    assert sample("leaf_db_pool_connections_in_use", "test-in-use") == 0
+    assert sample("leaf_db_pool_checkout_seconds_count", "test-in-use") == (
+        checkouts + 2
+    )
+    engine.dispose()
+
+
+def test_metered_pool_counts_timeouts():
+    engine = create_engine(
+        "sqlite://",
+        poolclass=metered_pool_class(QueuePool, "test-timeout"),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.01,
+    )
+    connection = engine.connect()
+    with pytest.raises(TimeoutError):
+        engine.connect()
+    assert sample("leaf_db_pool_checkout_timeouts_total", "test-timeout") == 1
+    assert sample("leaf_db_pool_connections_in_use", "test-timeout") == 1
+    connection.close()
+    engine.dispose()
+
+
+def test_metered_pool_class_is_cached_per_profile():
+    assert metered_pool_class(QueuePool, "api") is metered_pool_class(QueuePool, "api")
+    assert metered_pool_class(QueuePool, "api") is not metered_pool_class(
+        QueuePool,
+        "worker",
+    )
+
+
+def test_engine_options_of_profiles():
+    with patch.object(settings, "DB_POOL_SIZE", 7), patch.object(
+        settings,
+        "DB_WORKER_POOL_SIZE",
+        1,
+    ):
+        assert engine_options("api", QueuePool)["pool_size"] == 7
+        assert engine_options("worker", QueuePool)["pool_size"] == 1
+    assert engine_options("migrations", QueuePool) == {"poolclass": NullPool}
+    with pytest.raises(ValueError):
+        engine_options("unknown", QueuePool)
+
+
+def test_engine_options_with_pgbouncer():
+    with patch.object(settings, "DB_PGBOUNCER", True):
+        options = engine_options("api", QueuePool)
+    assert issubclass(options["poolclass"], NullPool)
+    assert "pool_size" not in options
+
+
+def test_max_connections_counted_once_pool_is_used():
+    engine = create_engine(
+        "sqlite://",
+        poolclass=metered_pool_class(QueuePool, "test-max"),
+        pool_size=2,
+        max_overflow=3,
+    )
+    assert sample("leaf_db_pool_max_connections", "test-max") == 0
+    with engine.connect(), engine.connect():
+        assert sample("leaf_db_pool_max_connections", "test-max") == 5
+    engine.dispose()
+    assert sample("leaf_db_pool_max_connections", "test-max") == 0
+    with engine.connect():
+        assert sample("leaf_db_pool_max_connections", "test-max") == 5
+    engine.dispose()
+
+
+def test_unused_engines_are_not_counted():
+    max_connections = sample("leaf_db_pool_max_connections", "replica")
+    engines = [
+        create_async_database_engine("replica", host=f"replica-{i}") for i in range(2)
+    ]
+    assert sample("leaf_db_pool_max_connections", "replica") == max_connections
+    for engine in engines:
+        engine.sync_engine.dispose()
+    assert sample("leaf_db_pool_max_connections", "replica") == max_connections
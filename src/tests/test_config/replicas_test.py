@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import fakeredis
+import pytest
+from fakeredis import aioredis
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from starlette.requests import Request
+
+from leaf.auth import create_access_token
+from leaf.config.config import get_settings
+from leaf.config.database import get_database_url
+from leaf.config.replicas import (
+    RecentWrites,
+    Replica,
+    ReplicaRouter,
+    get_request_user,
+)
+from tests.database_test import async_engine
+
+settings = get_settings()
+
+# Nothing listens on the port, connections are refused right away
+unreachable_engine = create_async_engine(
+    get_database_url("postgresql+asyncpg", host="127.0.0.1", port="1"),
+    poolclass=NullPool,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def create_router(*weights: int, window: float = 5, clock=None) -> ReplicaRouter:
+    recent_writes = RecentWrites(window, clock=clock or FakeClock())
+    return ReplicaRouter(
+        [
+            Replica(f"replica-{i}", async_engine, weight)
+            for i, weight in enumerate(weights)
+        ],
+        recent_writes,
+    )
+
+
+def request_with_token(method: str, token: str | None = None) -> Request:
+    headers = []
+    if token is not None:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return Request({"type": "http", "method": method, "headers": headers})
+
+
+def test_replicas_are_chosen_by_weight():
+    router = create_router(2, 1)
+    chosen = [router.choose().name for _ in range(6)]
+    assert chosen == [
+        "replica-0",
+        "replica-1",
+        "replica-0",
+        "replica-0",
+        "replica-1",
+        "replica-0",
+    ]
+
+
+@pytest.mark.anyio
+async def test_unhealthy_replicas_are_skipped():
+    router = create_router(1, 1)
+    router.replicas[0].healthy = False
+    assert {router.choose().name for _ in range(4)} == {"replica-1"}
+    router.replicas[1].healthy = False
+    assert router.choose() is None
+    assert await router.route("GET", None) is None
+    assert router.stats()["primary_reads"] == 1
+
+
+def test_replica_weight_has_to_be_positive():
+    with pytest.raises(ValueError):
+        Replica("replica", async_engine, 0)
+
+
+@pytest.mark.anyio
+async def test_writes_go_to_primary():
+    router = create_router(1)
+    for method in ("POST", "PUT", "PATCH", "DELETE"):
+        assert await router.route(method, "user@leaf.com") is None
+    assert await router.route("GET", "other@leaf.com") is router.replicas[0]
+
+
+@pytest.mark.anyio
+async def test_reads_after_own_write_go_to_primary():
+    clock = FakeClock()
+    router = create_router(1, window=5, clock=clock)
+    assert await router.route("GET", "user@leaf.com") is router.replicas[0]
+    await router.route("POST", "user@leaf.com")
+    clock.now += 4
+    assert await router.route("GET", "user@leaf.com") is None
+    assert await router.route("GET", "other@leaf.com") is router.replicas[0]
+    assert await router.route("GET", None) is router.replicas[0]
+    clock.now += 2
+    assert await router.route("GET", "user@leaf.com") is router.replicas[0]
+
+
+@pytest.mark.anyio
+async def test_router_without_replicas_uses_primary():
+    router = ReplicaRouter([], RecentWrites(5))
+    assert await router.route("GET", "user@leaf.com") is None
+    router.mark_write("user@leaf.com")
+    await router.mark_write_async("user@leaf.com")
+    assert "user@leaf.com" not in router.recent_writes
+
+
+def test_recent_writes_in_redis():
+    recent_writes = RecentWrites(5, client=fakeredis.FakeRedis())
+    recent_writes.mark("user@leaf.com")
+    assert "user@leaf.com" in recent_writes
+    assert "other@leaf.com" not in recent_writes
+    assert 0 < recent_writes.client.pttl(f"{recent_writes.key}:user@leaf.com") <= 5000
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("with_async_client", [True, False])
+async def test_recent_writes_in_redis_async(with_async_client):
+    server = fakeredis.FakeServer()
+    recent_writes = RecentWrites(
+        5,
+        client=fakeredis.FakeRedis(server=server),
+        async_client=aioredis.FakeRedis(server=server) if with_async_client else None,
+    )
+    await recent_writes.mark_async("user@leaf.com")
+    assert await recent_writes.contains_async("user@leaf.com")
+    assert "user@leaf.com" in recent_writes
+    assert not await recent_writes.contains_async("other@leaf.com")
+
+
+@pytest.mark.anyio
+async def test_recent_writes_treat_redis_errors_as_writes():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    recent_writes = RecentWrites(5, async_client=aioredis.FakeRedis(server=server))
+    await recent_writes.mark_async("user@leaf.com")
+    assert await recent_writes.contains_async("other@leaf.com")
+    assert recent_writes.errors == 2
+
+
+def test_recent_writes_are_bounded():
+    recent_writes = RecentWrites(5, max_size=2, clock=FakeClock())
+    for user in ("a@leaf.com", "b@leaf.com", "c@leaf.com"):
+        recent_writes.mark(user)
+    assert "a@leaf.com" not in recent_writes
+    assert "c@leaf.com" in recent_writes
+
+
+def test_get_request_user():
+    token = create_access_token(
+        {"sub": "user@leaf.com"},
+        settings.SECRET_KEY,
+        settings.ALGORITHM,
+    )
+    assert get_request_user(request_with_token("GET", token)) == "user@leaf.com"
+    assert get_request_user(request_with_token("GET")) is None
+    assert get_request_user(request_with_token("GET", "not-a-token")) is None
+
+
+def test_lost_connection_takes_replica_out():
+    router = create_router(1)
+    router.on_error(router.replicas[0], ValueError())
+    assert router.replicas[0].healthy
+    router.on_error(router.replicas[0], ConnectionRefusedError())
+    assert not router.replicas[0].healthy
+
+
+@pytest.mark.anyio
+async def test_unreachable_replica_fails_check():
+    router = ReplicaRouter([Replica("down", unreachable_engine)], RecentWrites(5))
+    assert not await router.check(router.replicas[0])
+    assert router.replicas[0].lag is None
+    assert router.choose() is None
+
+
+@pytest.mark.anyio
+async def test_replica_check():
+    router = create_router(1)
+    replica = router.replicas[0]
+    replica.healthy = False
+    assert await router.check(replica)
+    assert replica.healthy
+    assert replica.lag == 0
+
+
+@pytest.mark.anyio
+async def test_lagging_replica_fails_check():
+    router = create_router(1)
+    router.max_lag = -1
+    await router.check_all()
+    assert not router.replicas[0].healthy
+    assert router.replicas[0].lag == 0
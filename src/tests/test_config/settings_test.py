@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from dotenv import dotenv_values
+
+from leaf.config.config import Settings
+from leaf.config.replicas import parse_replicas
+
+ENV_EXAMPLES = Path(__file__).parents[3] / "env" / "examples"
+
+
+@pytest.fixture
+def example_env(monkeypatch):
+    if not ENV_EXAMPLES.exists():
+        pytest.skip("Example env files are not next to the sources")
+    for name in ("backend.env.example", "db.env.example"):
+        for key, value in dotenv_values(ENV_EXAMPLES / name).items():
+            monkeypatch.setenv(key, value or "")
+
+
+def test_settings_load_from_example_env(example_env):
+    settings = Settings()
+    assert parse_replicas(settings.DB_REPLICAS) == []
+    assert settings.IMAGE_VARIANT_FORMATS == "webp,avif"
+
+
+def test_settings_load_replicas(example_env, monkeypatch):
+    monkeypatch.setenv("DB_REPLICAS", "replica-1:5432=2,replica-2")
+    assert parse_replicas(Settings().DB_REPLICAS) == [
+        ("replica-1", "5432", 2),
+        ("replica-2", None, 1),
+    ]
+
+
+def test_invalid_replica_weight():
+    with pytest.raises(ValueError):
+        parse_replicas("replica-1:5432=heavy")
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from email import message_from_string
+
+from leaf.config.config import get_settings
+from leaf.emails import compose_email, get_url_template
+
+settings = get_settings()
+
+
+def test_confirmation_email_contains_confirmation_url():
+    to, msg = compose_email(
+        "user@leaf.com",
+        "confirmation",
+        {"confirmation_token": "secret-token"},
+    )
+
+    message = message_from_string(msg)
+    assert to == "user@leaf.com"
+    assert message["To"] == "user@leaf.com"
+    assert message["From"] == settings.SMTP_CONFIG["EMAIL"]
+    assert message["Subject"] == "Leaf account - email confirmation"
+    body = message.get_payload()[0].get_payload(decode=True).decode()
+    confirm_url = settings.CONFIRMATION_URL.replace(
+        "{{ confirmation_token }}",
+        "secret-token",
+    )
+    assert f'href="{confirm_url}"' in body
+
+
+def test_password_reset_email_subject():
+    _, msg = compose_email(
+        "user@leaf.com",
+        "password_reset",
+        {"confirmation_token": "t"},
+    )
+    assert message_from_string(msg)["Subject"] == "Leaf account - password reset"
+
+
+def test_url_templates_are_compiled_once():
+    assert get_url_template(settings.CONFIRMATION_URL) is get_url_template(
+        settings.CONFIRMATION_URL,
+    )
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import socket
+
+import fakeredis
+import pytest
+from aiosmtpd.controller import Controller
+
+from leaf.mail import MailOutbox, SMTPDispatcher, TokenBucket
+
+
+class RecordingHandler:
+    """Accepts mails, can reject recipients with a fixed SMTP reply"""
+
+    def __init__(self):
+        self.sessions = set()
+        self.mails = []
+        self.replies = {}
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if reply := self.replies.get(address):
+            if reply.startswith("4"):
+                # Temporary failure happens only once
+                del self.replies[address]
+            return reply
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        self.mails.append((envelope.rcpt_tos[0], envelope.content))
+        return "250 Message accepted"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    yield controller
+    controller.stop()
+
+
+def create_dispatcher(smtp_server, **kwargs) -> SMTPDispatcher:
+    config = {
+        "EMAIL": "leaf-team@leaf.com",
+        "HOST": smtp_server.hostname,
+        "PORT": smtp_server.port,
+        "SECURITY": "none",
+    }
+    return SMTPDispatcher(config, sleeper=lambda seconds: None, **kwargs)
+
+
+def test_mails_are_sent_over_single_connection(smtp_server):
+    dispatcher = create_dispatcher(smtp_server)
+    mails = [(f"user{i}@leaf.com", f"Subject: {i}\r\n\r\nHello") for i in range(20)]
+
+    assert dispatcher.send(mails[:10]) == []
+    assert dispatcher.send(mails[10:]) == []
+    dispatcher.close()
+
+    assert len(smtp_server.handler.mails) == 20
+    assert len(smtp_server.handler.sessions) == 1
+    assert dispatcher.stats()["connections_opened"] == 1
+    assert dispatcher.stats()["sent"] == 20
+
+
+def test_transient_failure_is_retried(smtp_server):
+    smtp_server.handler.replies["user@leaf.com"] = "451 Try again later"
+    dispatcher = create_dispatcher(smtp_server, retry_backoff=0.5)
+
+    assert dispatcher.send([("user@leaf.com", "Subject: 1\r\n\r\nHello")]) == []
+    dispatcher.close()
+
+    assert [to for to, _ in smtp_server.handler.mails] == ["user@leaf.com"]
+    assert dispatcher.stats()["retried"] == 1
+
+
+def test_permanent_failure_is_not_retried(smtp_server):
+    smtp_server.handler.replies["missing@leaf.com"] = "550 No such user"
+    dispatcher = create_dispatcher(smtp_server)
+
+    postponed = dispatcher.send(
+        [
+            ("missing@leaf.com", "Subject: 1\r\n\r\nHello"),
+            ("user@leaf.com", "Subject: 2\r\n\r\nHello"),
+        ],
+    )
+    dispatcher.close()
+
+    assert postponed == []
+    assert [to for to, _ in smtp_server.handler.mails] == ["user@leaf.com"]
+    assert dispatcher.stats()["failed"] == 1
+    assert dispatcher.stats()["retried"] == 0
+
+
+def test_mails_failing_after_all_retries_are_postponed(smtp_server):
+    dispatcher = create_dispatcher(smtp_server, max_retries=0)
+    smtp_server.handler.replies["user@leaf.com"] = "421 Too many connections"
+
+    postponed = dispatcher.send([("user@leaf.com", "Subject: 1\r\n\r\nHello")])
+
+    assert postponed == [("user@leaf.com", "Subject: 1\r\n\r\nHello")]
+
+
+def test_token_bucket_limits_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, capacity=2, timer=clock, sleeper=clock.sleep)
+
+    waits = [bucket.acquire() for _ in range(4)]
+
+    assert waits[:2] == [0, 0]
+    assert waits[2:] == [pytest.approx(0.1), pytest.approx(0.1)]
+    assert clock.now == pytest.approx(0.2)
+
+
+def test_outbox_pops_mails_in_batches():
+    outbox = MailOutbox(fakeredis.FakeRedis())
+    outbox.push([(f"user{i}@leaf.com", "Hello") for i in range(5)])
+
+    assert outbox.pop(3) == [(f"user{i}@leaf.com", "Hello") for i in range(3)]
+    assert len(outbox) == 2
+    assert len(outbox.pop(3)) == 2
+    assert outbox.pop(3) == []
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from os import utime
+
+import pytest
+
+from leaf.media import (
+    create_media_resource,
+    get_image_resource_key,
+    get_resized_resource_key,
+    remove_unreferenced_media,
+)
+from leaf.storage import LocalStorageBackend
+
+DIGEST = "ab" + "0" * 62
+OTHER_DIGEST = "cd" + "1" * 62
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorageBackend(tmp_path)
+
+
+def store_resized_image(storage, digest: str, mtime: float):
+    image_key = get_image_resource_key(digest, "jpg")
+    keys = [
+        get_resized_resource_key(image_key, 480),
+        get_resized_resource_key(image_key, 720),
+        get_resized_resource_key(image_key, 480).replace(".jpg", ".webp"),
+    ]
+    for key in keys:
+        path = storage.local_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"image")
+        utime(path, (mtime, mtime))
+    return image_key, keys
+
+
+def store_upload(storage, mtime: float | None = None) -> str:
+    path = storage.local_path("uploads/1")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"image")
+    if mtime is not None:
+        utime(path, (mtime, mtime))
+    return "uploads/1"
+
+
+def test_image_resource_key_is_named_by_digest():
+    key = get_image_resource_key(DIGEST, "png")
+    assert key == f"images/ab/{DIGEST}.png"
+    assert get_resized_resource_key(key, 480) == f"images/ab/480_{DIGEST}.png"
+
+
+@pytest.mark.anyio
+async def test_new_image_is_stored(storage):
+    upload_key = store_upload(storage)
+    image_key = get_image_resource_key(DIGEST, "jpg")
+
+    assert await create_media_resource(storage, image_key, upload_key)
+    assert storage.local_path(image_key).read_bytes() == b"image"
+    assert storage.stat(upload_key) is None
+
+
+@pytest.mark.anyio
+async def test_duplicate_image_is_stored_once(storage):
+    image_key, keys = store_resized_image(storage, DIGEST, mtime=0)
+    upload_key = store_upload(storage)
+
+    assert not await create_media_resource(storage, image_key, upload_key)
+    assert storage.stat(upload_key) is None
+    assert storage.stat(image_key) is None
+    # Image is touched, so garbage collection keeps it
+    assert max(storage.stat(key).modified for key in keys) > 0
+
+
+def test_unreferenced_media_is_removed(storage):
+    referenced_key, referenced_keys = store_resized_image(storage, DIGEST, 0)
+    _, unreferenced_keys = store_resized_image(storage, OTHER_DIGEST, 0)
+
+    removed = remove_unreferenced_media(
+        storage,
+        [referenced_key],
+        grace_period=60,
+        now=1000,
+    )
+
+    assert sorted(removed) == sorted(unreferenced_keys)
+    assert all(storage.stat(key) for key in referenced_keys)
+    assert not any(storage.stat(key) for key in unreferenced_keys)
+
+
+def test_recent_media_is_kept(storage):
+    _, keys = store_resized_image(storage, DIGEST, mtime=990)
+    upload_key = store_upload(storage, mtime=0)
+
+    removed = remove_unreferenced_media(storage, [], grace_period=60, now=1000)
+
+    assert removed == [upload_key]
+    assert all(storage.stat(key) for key in keys)
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import hashlib
+import tracemalloc
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from leaf.media import receive_image_upload, sniff_image_format
+from leaf.storage import LocalStorageBackend
+
+BOUNDARY = "leaf-boundary"
+CHUNK_SIZE = 64 * 1024
+JPEG_HEADER = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01"
+
+
+def create_upload_request(file_header: bytes, file_size: int) -> Request:
+    """Builds multipart request which body is generated chunk by chunk"""
+    head = (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="image"; filename="photo.png"\r\n'
+        "Content-Type: image/png\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+
+    def body():
+        yield head + file_header
+        remaining = file_size - len(file_header)
+        while remaining > 0:
+            chunk_size = min(CHUNK_SIZE, remaining)
+            yield b"\0" * chunk_size
+            remaining -= chunk_size
+        yield tail
+
+    chunks = body()
+
+    async def receive():
+        chunk = next(chunks, None)
+        return {
+            "type": "http.request",
+            "body": chunk or b"",
+            "more_body": chunk is not None,
+        }
+
+    scope = {
+        "type": "http",
+        "method": "PUT",
+        "headers": [
+            (
+                b"content-type",
+                f"multipart/form-data; boundary={BOUNDARY}".encode(),
+            ),
+        ],
+    }
+    return Request(scope, receive)
+
+
+def test_sniff_image_format():
+    assert sniff_image_format(JPEG_HEADER) == "jpg"
+    assert sniff_image_format(b"\x89PNG\r\n\x1a\n\0\0\0\0") == "png"
+    assert sniff_image_format(b"RIFF\0\0\0\0WEBPVP8 ") == "webp"
+    assert sniff_image_format(b"\0\0\0\x1cftypavif") == "avif"
+    assert sniff_image_format(b"<?php echo 1;") is None
+
+
+@pytest.mark.anyio
+async def test_large_upload_is_streamed_with_flat_memory(tmp_path):
+    file_size = 64 * 1024 * 1024
+    request = create_upload_request(JPEG_HEADER, file_size)
+
+    tracemalloc.start()
+    upload_key, image_format, digest = await receive_image_upload(
+        request,
+        "image",
+        LocalStorageBackend(tmp_path),
+        max_size=file_size,
+    )
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert image_format == "jpg"
+    assert (tmp_path / upload_key).stat().st_size == file_size
+    expected_digest = hashlib.sha256(JPEG_HEADER)
+    expected_digest.update(b"\0" * (file_size - len(JPEG_HEADER)))
+    assert digest == expected_digest.hexdigest()
+    assert peak < 4 * 1024 * 1024
+
+
+@pytest.mark.anyio
+async def test_too_large_upload_is_aborted(tmp_path):
+    request = create_upload_request(JPEG_HEADER, 2 * 1024 * 1024)
+    with pytest.raises(HTTPException) as error:
+        await receive_image_upload(
+            request,
+            "image",
+            LocalStorageBackend(tmp_path),
+            max_size=1024 * 1024,
+        )
+    assert error.value.status_code == 413
+    assert [file for file in tmp_path.rglob("*") if file.is_file()] == []
+
+
+@pytest.mark.anyio
+async def test_upload_with_unknown_magic_bytes_is_rejected(tmp_path):
+    request = create_upload_request(b"<?php echo 1; ?>", 1024)
+    with pytest.raises(HTTPException) as error:
+        await receive_image_upload(
+            request,
+            "image",
+            LocalStorageBackend(tmp_path),
+            max_size=1024 * 1024,
+        )
+    assert error.value.status_code == 415
+    assert [file for file in tmp_path.rglob("*") if file.is_file()] == []
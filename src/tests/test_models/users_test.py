@@ -1,5 +1,5 @@
 from leaf.models.user import PermissionsType
-from tests.factories.users import UserFactory
+from tests.factories.users import GroupFactory, UserFactory
 
 
 def check_user_permissions_test():
@@ -9,6 +9,19 @@ def check_user_permissions_test():
     assert user.check_permissions(2) is False
 
 
+def test_check_permissions_of_groups():
+    user = UserFactory.create(permissions=PermissionsType.read_users.value)
+    GroupFactory.create(
+        permissions=PermissionsType.read_threats.value,
+        members=[user],
+    )
+    assert user.permission_mask == (
+        PermissionsType.read_users.value | PermissionsType.read_threats.value
+    )
+    assert user.check_permissions(PermissionsType.read_threats.value) is True
+    assert user.check_permissions(PermissionsType.modify_threats.value) is False
+
+
 def user_permissions_property_test():
     user = UserFactory.create(
         permissions=PermissionsType.read_users.value
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import pytest
+from fastapi import HTTPException
+
+from leaf.auth import require
+from leaf.models.user import PermissionsType
+from leaf.permissions import (
+    ALL_PERMISSIONS,
+    decode_permissions,
+    has_permission,
+    permission_mask,
+)
+from leaf.schemas.users import PrincipalSchema
+
+
+def create_principal(mask: int) -> PrincipalSchema:
+    return PrincipalSchema(
+        id=1,
+        email="user@leaf.com",
+        permissions=decode_permissions(mask),
+        group_ids=[],
+    )
+
+
+def test_permission_mask():
+    assert permission_mask() == 0
+    assert (
+        permission_mask(PermissionsType.read_users, PermissionsType.read_threats) == 17
+    )
+    assert ALL_PERMISSIONS == permission_mask(*PermissionsType)
+
+
+def test_has_permission():
+    assert has_permission(17, PermissionsType.read_threats)
+    assert not has_permission(17, PermissionsType.modify_threats)
+
+
+def test_decode_permissions_is_cached():
+    permissions = decode_permissions(5)
+    assert decode_permissions(5) is permissions
+    assert permissions.dict() == {
+        "mask": 5,
+        "read_users": True,
+        "modify_users": False,
+        "grant_permissions": True,
+        "revoke_permissions": False,
+        "read_threats": False,
+        "modify_threats": False,
+    }
+    with pytest.raises(TypeError):
+        permissions.read_users = False
+
+
+@pytest.mark.anyio
+async def test_require_all_permissions():
+    check = require(PermissionsType.read_threats, PermissionsType.modify_threats)
+    principal = create_principal(permission_mask(*PermissionsType))
+    assert await check(principal) is principal
+    with pytest.raises(HTTPException) as error:
+        await check(create_principal(PermissionsType.read_threats.value))
+    assert error.value.status_code == 403
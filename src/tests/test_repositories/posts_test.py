@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+import fakeredis
+import pytest
+from sqlalchemy import event, select, update
+
+from leaf.models import Like, Post
+from leaf.repositories.posts import (
+    decode_feed_cursor,
+    encode_feed_cursor,
+    get_feed_async,
+    get_home_feed_async,
+    get_timeline_recipients,
+    like_post_async,
+    repair_post_counts,
+    unlike_post_async,
+)
+from leaf.timeline import TimelineStore, timeline_score
+from tests.factories.posts import CommentFactory, LikeFactory, PostFactory
+from tests.factories.users import GroupFactory, UserFactory
+
+
+def test_feed_cursor_round_trip():
+    cursor = (datetime(2023, 7, 2, 14, 1, 28, 538715), 42)
+    assert decode_feed_cursor(encode_feed_cursor(cursor)) == cursor
+
+
+# "WzFd" is a valid JSON array with a single item
+@pytest.mark.parametrize("cursor", ["", "abc", "WzFd"])
+def test_decode_invalid_feed_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_feed_cursor(cursor)
+
+
+@pytest.mark.anyio
+async def test_get_feed_async_with_counts(async_db):
+    user = UserFactory.create()
+    post = PostFactory.create()
+    LikeFactory.create(post=post, user=user)
+    LikeFactory.create(post=post)
+    CommentFactory.create_batch(3, post=post)
+    newest_post = PostFactory.create()
+
+    page = await get_feed_async(async_db, user.id, limit=2)
+
+    assert [item.id for item in page.items] == [newest_post.id, post.id]
+    newest, older = page.items
+    assert (newest.like_count, newest.comment_count, newest.liked_by_me) == (
+        0,
+        0,
+        False,
+    )
+    assert (older.like_count, older.comment_count, older.liked_by_me) == (2, 3, True)
+    assert older.author.id == post.user_id
+    assert older.threat.id == post.threat_id
+
+
+@pytest.mark.anyio
+async def test_get_feed_async_paginated_with_cursor(async_db):
+    user = UserFactory.create()
+    first, second, third = PostFactory.create_batch(3)
+
+    page = await get_feed_async(async_db, user.id, limit=2)
+    assert [item.id for item in page.items] == [third.id, second.id]
+
+    next_page = await get_feed_async(
+        async_db,
+        user.id,
+        cursor=decode_feed_cursor(page.next_cursor),
+        limit=2,
+    )
+    assert next_page.items[0].id == first.id
+
+
+@pytest.mark.anyio
+async def test_get_feed_async_runs_single_query(async_db):
+    user = UserFactory.create()
+    for post in PostFactory.create_batch(5):
+        LikeFactory.create_batch(2, post=post)
+        CommentFactory.create(post=post)
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = async_db.bind.sync_engine
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        await get_feed_async(async_db, user.id, limit=5)
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+    assert len(statements) == 1
+
+
+def get_counts(db, post: Post) -> tuple:
+    return db.execute(
+        select(Post.like_count, Post.comment_count).where(Post.id == post.id),
+    ).one()
+
+
+def test_counts_changed_with_likes_and_comments(db):
+    post = PostFactory.create()
+    like, _ = LikeFactory.create_batch(2, post=post)
+    CommentFactory.create(post=post)
+    assert get_counts(db, post) == (2, 1)
+
+    db.delete(db.get(Like, like.id))
+    db.commit()
+    assert get_counts(db, post) == (1, 1)
+
+
+def test_repair_post_counts(db):
+    post, other_post = PostFactory.create_batch(2)
+    LikeFactory.create(post=post)
+    CommentFactory.create_batch(2, post=other_post)
+    db.execute(
+        update(Post)
+        .where(Post.id.in_([post.id, other_post.id]))
+        .values(like_count=10, comment_count=10),
+    )
+    db.commit()
+
+    assert repair_post_counts(db, post.id, other_post.id) == 2
+    assert get_counts(db, post) == (1, 0)
+    assert get_counts(db, other_post) == (0, 2)
+    assert repair_post_counts(db, post.id, other_post.id) == 0
+
+
+@pytest.mark.anyio
+async def test_like_post_async_is_idempotent(db, async_db):
+    user = UserFactory.create()
+    post = PostFactory.create()
+    LikeFactory.create(post=post)
+
+    assert await like_post_async(async_db, user.id, post.id) == 2
+    assert await like_post_async(async_db, user.id, post.id) == 2
+    assert await unlike_post_async(async_db, user.id, post.id) == 1
+    assert await unlike_post_async(async_db, user.id, post.id) == 1
+    assert get_counts(db, post) == (1, 0)
+
+
+@pytest.mark.anyio
+async def test_like_missing_post_async(async_db):
+    user = UserFactory.create()
+    assert await like_post_async(async_db, user.id, 2**31 - 1) is None
+    assert await unlike_post_async(async_db, user.id, 2**31 - 1) is None
+
+
+def create_home_posts() -> tuple:
+    """User, posts in their home feed from the newest and a post outside of it"""
+    user, friend, stranger = UserFactory.create_batch(3)
+    crowd = UserFactory.create_batch(2)
+    GroupFactory.create(members=[user, friend])
+    GroupFactory.create(members=[user, *crowd])
+    posts = [
+        PostFactory.create(user=user),
+        PostFactory.create(user=friend),
+        PostFactory.create(user=stranger),
+        PostFactory.create(user=crowd[0]),
+        PostFactory.create(user=friend),
+    ]
+    home_posts = [posts[4], posts[3], posts[1], posts[0]]
+    return user, home_posts, posts[2]
+
+
+def fan_out(db, timeline: TimelineStore, posts, max_group_size: int) -> None:
+    for post in posts:
+        created_at, user_ids = get_timeline_recipients(db, post.id, max_group_size)
+        timeline.add(post.id, timeline_score(created_at), user_ids)
+
+
+@pytest.mark.anyio
+async def test_get_home_feed_async_fan_out_on_read(async_db):
+    user, home_posts, _ = create_home_posts()
+
+    page = await get_home_feed_async(async_db, user.id, limit=3)
+    assert [item.id for item in page.items] == [post.id for post in home_posts[:3]]
+
+    next_page = await get_home_feed_async(
+        async_db,
+        user.id,
+        cursor=decode_feed_cursor(page.next_cursor),
+        limit=3,
+    )
+    assert [item.id for item in next_page.items] == [home_posts[3].id]
+    assert next_page.next_cursor is None
+
+
+def test_get_timeline_recipients(db):
+    user, home_posts, stranger_post = create_home_posts()
+    friend_post, crowd_post = home_posts[2], home_posts[1]
+
+    assert get_timeline_recipients(db, friend_post.id, 2)[1] == sorted(
+        [user.id, friend_post.user_id],
+    )
+    # Group of the crowd has 3 members, too many to fan out to
+    assert get_timeline_recipients(db, crowd_post.id, 2)[1] == [crowd_post.user_id]
+    assert get_timeline_recipients(db, stranger_post.id, 2)[1] == [
+        stranger_post.user_id,
+    ]
+    assert get_timeline_recipients(db, 2**31 - 1, 2) is None
+
+
+@pytest.mark.anyio
+async def test_get_home_feed_async_from_timeline(db, async_db):
+    user, home_posts, stranger_post = create_home_posts()
+    timeline = TimelineStore(fakeredis.FakeRedis(), max_length=10)
+    fan_out(db, timeline, [*home_posts, stranger_post], max_group_size=2)
+    assert len(timeline.range(user.id, None, 10)) == 3
+
+    items = []
+    cursor = None
+    while True:
+        page = await get_home_feed_async(
+            async_db,
+            user.id,
+            cursor=cursor,
+            limit=2,
+            timeline=timeline,
+            max_group_size=2,
+        )
+        items += page.items
+        if page.next_cursor is None:
+            break
+        cursor = decode_feed_cursor(page.next_cursor)
+
+    # Post of the large group is merged from the database
+    assert [item.id for item in items] == [post.id for post in home_posts]
+
+
+@pytest.mark.anyio
+async def test_get_home_feed_async_older_than_timeline(db, async_db):
+    user, home_posts, _ = create_home_posts()
+    timeline = TimelineStore(fakeredis.FakeRedis(), max_length=10)
+    # Timeline built after the older posts were published
+    fan_out(db, timeline, home_posts[:1], max_group_size=2)
+
+    page = await get_home_feed_async(
+        async_db,
+        user.id,
+        limit=3,
+        timeline=timeline,
+        max_group_size=2,
+    )
+    assert [item.id for item in page.items] == [post.id for post in home_posts[:3]]
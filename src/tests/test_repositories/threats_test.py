@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import pytest
+
+from leaf.repositories.threats import (
+    get_threat_tile_async,
+    get_threats_in_bbox_async,
+    get_threats_in_radius_async,
+)
+from leaf.tiles import tile_containing
+from tests.factories.threats import ThreatCategoryFactory, ThreatFactory
+
+# Warsaw, 0.01 degree of latitude is about 1.1 km
+LONGITUDE, LATITUDE = 21.0122, 52.2297
+
+
+@pytest.mark.anyio
+async def test_get_threats_in_radius_async(async_db):
+    category = ThreatCategoryFactory.create()
+    near = ThreatFactory.create(category=category)
+    far = ThreatFactory.create(category=category, latitude=LATITUDE + 0.01)
+
+    page = await get_threats_in_radius_async(
+        async_db,
+        LONGITUDE,
+        LATITUDE,
+        1000,
+        category_ids=[category.id],
+    )
+    assert [threat.id for threat in page.items] == [near.id]
+    assert page.items[0].longitude == pytest.approx(LONGITUDE)
+    assert page.items[0].latitude == pytest.approx(LATITUDE)
+
+    page = await get_threats_in_radius_async(
+        async_db,
+        LONGITUDE,
+        LATITUDE,
+        2000,
+        category_ids=[category.id],
+    )
+    assert [threat.id for threat in page.items] == [near.id, far.id]
+
+
+@pytest.mark.anyio
+async def test_get_threats_in_bbox_async(async_db):
+    category = ThreatCategoryFactory.create()
+    inside = ThreatFactory.create(category=category)
+    ThreatFactory.create(category=category, longitude=LONGITUDE + 1)
+
+    page = await get_threats_in_bbox_async(
+        async_db,
+        LONGITUDE - 0.5,
+        LATITUDE - 0.5,
+        LONGITUDE + 0.5,
+        LATITUDE + 0.5,
+        category_ids=[category.id],
+    )
+    assert [threat.id for threat in page.items] == [inside.id]
+    assert page.next_cursor is None
+
+
+@pytest.mark.anyio
+async def test_get_threats_filtered_by_category(async_db):
+    category, other_category = ThreatCategoryFactory.create_batch(2)
+    threat = ThreatFactory.create(category=category)
+    ThreatFactory.create(category=other_category)
+
+    page = await get_threats_in_radius_async(
+        async_db,
+        LONGITUDE,
+        LATITUDE,
+        100,
+        category_ids=[category.id],
+    )
+    assert [threat.id for threat in page.items] == [threat.id]
+
+
+@pytest.mark.anyio
+async def test_get_threats_paginated_with_cursor(async_db):
+    category = ThreatCategoryFactory.create()
+    threats = ThreatFactory.create_batch(5, category=category)
+    ids = []
+    after = None
+    while True:
+        page = await get_threats_in_radius_async(
+            async_db,
+            LONGITUDE,
+            LATITUDE,
+            100,
+            category_ids=[category.id],
+            after=after,
+            limit=2,
+        )
+        ids.extend(threat.id for threat in page.items)
+        if page.next_cursor is None:
+            break
+        after = page.next_cursor
+    assert ids == [threat.id for threat in threats]
+
+
+@pytest.mark.anyio
+async def test_get_threat_tile_async_with_clusters(async_db):
+    category, other_category = ThreatCategoryFactory.create_batch(2)
+    ThreatFactory.create_batch(2, category=category, longitude=-60, latitude=-30)
+    ThreatFactory.create(category=other_category, longitude=-60, latitude=-30)
+    x, y = tile_containing(-60, -30, 4)
+
+    tile = await get_threat_tile_async(async_db, 4, x, y, cluster_max_zoom=12)
+    # Layer name and property keys are stored in the tile as plain strings
+    assert b"clusters" in tile
+    assert f"category_{category.id}".encode() in tile
+    assert f"category_{other_category.id}".encode() in tile
+
+
+@pytest.mark.anyio
+async def test_get_threat_tile_async_with_threats(async_db):
+    ThreatFactory.create(longitude=-61, latitude=-31)
+    x, y = tile_containing(-61, -31, 14)
+
+    tile = await get_threat_tile_async(async_db, 14, x, y, cluster_max_zoom=12)
+    assert b"threats" in tile
+    assert b"category_id" in tile
+
+
+@pytest.mark.anyio
+async def test_get_empty_threat_tile_async(async_db):
+    x, y = tile_containing(-150, -60, 14)
+    tile = await get_threat_tile_async(async_db, 14, x, y, cluster_max_zoom=12)
+    assert tile == b""
@@ -1,14 +1,25 @@
 from __future__ import annotations
 
+import pytest
+
 from leaf.models import User
+from leaf.models.user import PermissionsType
 from leaf.repositories.users import (
+    create_many,
     create_one,
+    create_one_async,
+    create_profile_async,
     get_active_user_by_email,
+    get_active_user_by_email_async,
+    get_token_version_async,
     get_user_by_email,
+    get_user_by_email_async,
+    update_many_async,
     update_one,
+    update_one_async,
 )
 from leaf.schemas.users import UserSchema
-from tests.factories.users import UserFactory
+from tests.factories.users import GroupFactory, UserFactory
 
 
 def test_get_user_by_email(db):
@@ -49,3 +60,131 @@ def test_update_one(db):
     update_one(db, user.email, first_name="after_update")
     db_user = get_user_by_email(db, user.email)
     assert db_user.first_name == "after_update"
+
+
+@pytest.mark.anyio
+async def test_get_user_by_email_async(async_db):
+    user = UserFactory.create()
+    db_user = await get_user_by_email_async(async_db, user.email)
+    assert isinstance(db_user, UserSchema)
+    assert db_user.id == user.id
+
+
+@pytest.mark.anyio
+async def test_get_active_user_by_email_async_not_passed_case(async_db):
+    user = UserFactory.create(disabled=True)
+    db_user = await get_active_user_by_email_async(async_db, user.email)
+    assert db_user is None
+
+
+@pytest.mark.anyio
+async def test_create_one_async(db, async_db):
+    await create_one_async(
+        async_db,
+        email="create_one_async_test@test.com",
+        hashed_password="test",
+        first_name="test",
+        last_name="test",
+        disabled=True,
+    )
+    db_user = get_user_by_email(db, email="create_one_async_test@test.com")
+    assert db_user is not None
+
+
+@pytest.mark.anyio
+async def test_update_one_async(db, async_db):
+    user = UserFactory.create(first_name="before_update")
+    await update_one_async(async_db, user.email, first_name="after_update")
+    db_user = get_user_by_email(db, user.email)
+    assert db_user.first_name == "after_update"
+
+
+def test_create_many_skips_existing_emails(db):
+    user = UserFactory.create()
+    users = [
+        {
+            "email": email,
+            "hashed_password": "test",
+            "first_name": "test",
+            "last_name": "test",
+            "disabled": True,
+        }
+        for email in ["create_many_test@test.com", user.email]
+    ]
+    assert create_many(db, users) == ["create_many_test@test.com"]
+    assert create_many(db, []) == []
+    assert get_user_by_email(db, "create_many_test@test.com").disabled is True
+
+
+@pytest.mark.anyio
+async def test_update_many_async(db, async_db):
+    first, second, untouched = UserFactory.create_batch(3)
+    updated = await update_many_async(
+        async_db,
+        [first.email, second.email, "missing@test.com"],
+        disabled=True,
+    )
+    assert sorted(updated) == sorted([first.email, second.email])
+    assert get_user_by_email(db, first.email).disabled is True
+    assert get_user_by_email(db, untouched.email).disabled is False
+
+
+def test_user_permissions_include_group_permissions(db):
+    user = UserFactory.create(permissions=PermissionsType.read_users.value)
+    GroupFactory.create(
+        permissions=PermissionsType.read_threats.value,
+        members=[user],
+    )
+    GroupFactory.create(
+        permissions=PermissionsType.modify_threats.value,
+        members=[user],
+    )
+    permissions = get_user_by_email(db, user.email).permissions
+    assert permissions.mask == 49
+    assert (permissions.read_users, permissions.modify_users) == (True, False)
+    assert (permissions.read_threats, permissions.modify_threats) == (True, True)
+
+
+@pytest.mark.anyio
+async def test_user_permissions_without_groups_async(async_db):
+    user = UserFactory.create(permissions=PermissionsType.read_threats.value)
+    db_user = await get_user_by_email_async(async_db, user.email)
+    assert db_user.permissions.mask == PermissionsType.read_threats.value
+
+
+@pytest.mark.anyio
+async def test_password_change_and_disabling_revoke_tokens(async_db):
+    user = UserFactory.create()
+    assert await get_token_version_async(async_db, user.id) == 0
+    await update_one_async(async_db, user.email, first_name="after_update")
+    assert await get_token_version_async(async_db, user.id) == 0
+    await update_one_async(async_db, user.email, hashed_password="changed")
+    assert await get_token_version_async(async_db, user.id) == 1
+    await update_many_async(async_db, [user.email], disabled=True)
+    assert await get_token_version_async(async_db, user.id) == 2
+
+
+def test_user_profile_groups(db):
+    user = UserFactory.create()
+    first = GroupFactory.create(members=[user])
+    second = GroupFactory.create(members=[user])
+    profile = get_user_by_email(db, user.email)
+    assert [(group.id, group.name) for group in profile.groups] == [
+        (first.id, first.name),
+        (second.id, second.name),
+    ]
+    assert get_user_by_email(db, UserFactory.create().email).groups == []
+
+
+@pytest.mark.anyio
+async def test_create_profile_async(db, async_db):
+    profile = await create_profile_async(
+        async_db,
+        email="create_profile_async_test@test.com",
+        hashed_password="test",
+        first_name="test",
+        last_name="test",
+        disabled=True,
+    )
+    assert profile == get_user_by_email(db, "create_profile_async_test@test.com")
+    assert (profile.groups, profile.permissions.mask) == ([], 0)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+import pytest
+from fastapi import APIRouter, FastAPI, Response
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, Field
+
+from leaf.permissions import decode_permissions
+from leaf.responses import JSONResponse, SchemaRoute, is_plain_schema
+from leaf.schemas.posts import PostPageSchema
+from leaf.schemas.users import GroupProfileSchema, UserSchema
+
+USERS = [
+    UserSchema(
+        id=i,
+        email=f"user{i}@leaf.com",
+        first_name="Leaf",
+        last_name="User",
+        permissions=decode_permissions(i),
+        groups=[GroupProfileSchema(id=1, name="Volunteers")],
+    )
+    for i in range(1, 4)
+]
+
+
+class AliasedSchema(BaseModel):
+    first_name: str = Field(alias="firstName")
+
+
+class UserWithPasswordSchema(UserSchema):
+    hashed_password: str
+
+
+def create_client(router: APIRouter) -> TestClient:
+    app = FastAPI(default_response_class=JSONResponse)
+    app.include_router(router)
+    return TestClient(app)
+
+
+@pytest.fixture
+def router():
+    return APIRouter(route_class=SchemaRoute)
+
+
+def test_is_plain_schema():
+    assert is_plain_schema(UserSchema)
+    assert is_plain_schema(PostPageSchema)
+    assert not is_plain_schema(AliasedSchema)
+
+
+def test_schemas_are_sent_without_validation(router):
+    @router.get("/users", response_model=List[UserSchema])
+    async def get_users():
+        return USERS
+
+    @router.get("/user", response_model=UserSchema, status_code=201)
+    async def get_user():
+        return USERS[0]
+
+    client = create_client(router)
+    for route in client.app.routes:
+        if isinstance(route, SchemaRoute):
+            assert route.dependant.call.__wrapped__ is not None
+
+    r = client.get("/users")
+    assert r.json() == [user.dict() for user in USERS]
+    r = client.get("/user")
+    assert r.status_code == 201
+    assert r.json() == USERS[0].dict()
+
+
+def test_other_content_is_validated(router):
+    @router.get("/user", response_model=UserSchema)
+    async def get_user():
+        return UserWithPasswordSchema(**USERS[0].dict(), hashed_password="secret")
+
+    @router.get("/users", response_model=List[UserSchema])
+    async def get_users():
+        return [user.dict() for user in USERS]
+
+    @router.get("/aliased", response_model=AliasedSchema)
+    async def get_aliased():
+        return AliasedSchema(firstName="Leaf")
+
+    client = create_client(router)
+
+    assert client.get("/user").json() == USERS[0].dict()
+    assert client.get("/users").json() == [user.dict() for user in USERS]
+    assert client.get("/aliased").json() == {"firstName": "Leaf"}
+
+
+def test_response_parameter_is_kept(router):
+    @router.get("/user", response_model=UserSchema)
+    async def get_user(response: Response):
+        response.headers["X-Leaf"] = "1"
+        return USERS[0]
+
+    r = create_client(router).get("/user")
+
+    assert r.headers["X-Leaf"] == "1"
+    assert r.json() == USERS[0].dict()
+
+
+def test_json_response_encodes_like_jsonable_encoder():
+    content = {
+        "created_at": datetime(2023, 5, 1, 12, 30),
+        "duration": timedelta(seconds=90),
+        "price": Decimal("1.5"),
+        1: "non string key",
+    }
+
+    assert JSONResponse(content).body == (
+        b'{"created_at":"2023-05-01T12:30:00","duration":90.0,"price":1.5,'
+        b'"1":"non string key"}'
+    )
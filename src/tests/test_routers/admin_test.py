@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from leaf.auth import get_current_principal
+from leaf.config.config import get_settings
+from leaf.main import app
+from leaf.models.user import PermissionsType
+from leaf.repositories.users import get_user_by_email
+from leaf.storage import LocalStorageBackend, get_storage
+from tests.common import force_authenticate
+from tests.factories.users import UserFactory
+
+settings = get_settings()
+
+CSV = (
+    b"email,password,first_name,last_name\r\n"
+    b"volunteer@leaf.com,Elektryk1@,Leaf,Volunteer\r\n"
+)
+
+
+@pytest.fixture
+def admin(db):
+    admin = UserFactory.create(permissions=PermissionsType.modify_users.value)
+    force_authenticate(db, admin)
+    return admin
+
+
+@pytest.fixture
+def storage(tmp_path):
+    app.dependency_overrides[get_storage] = lambda: LocalStorageBackend(tmp_path)
+    yield tmp_path
+    del app.dependency_overrides[get_storage]
+
+
+def test_admin_endpoints_require_permission(db, client: TestClient):
+    force_authenticate(db, UserFactory.create())
+    r = client.patch("admin/users", json={"emails": ["a@leaf.com"], "disabled": True})
+    assert r.status_code == 403
+
+
+def test_start_user_import(client: TestClient, admin, storage):
+    with patch("leaf.routers.admin.import_users") as import_users:
+        import_users.delay.return_value = MagicMock(id="task-id", state="PENDING")
+        r = client.post(
+            "admin/users/import",
+            content=CSV,
+            headers={"Content-Type": "text/csv; charset=utf-8"},
+        )
+    assert r.status_code == 202
+    assert r.json()["task_id"] == "task-id"
+    key, import_format = import_users.delay.call_args.args
+    assert import_format == "csv"
+    assert (storage / key).read_bytes() == CSV
+
+
+def test_start_user_import_with_unsupported_content_type(
+    client: TestClient,
+    admin,
+    storage,
+):
+    r = client.post(
+        "admin/users/import",
+        content=CSV,
+        headers={"Content-Type": "application/pdf"},
+    )
+    assert r.status_code == 415
+
+
+def test_get_user_import_progress(client: TestClient, admin):
+    result = MagicMock(state="PROGRESS", info={"processed": 1000, "created": 990})
+    with patch("leaf.routers.admin.celery.AsyncResult", return_value=result):
+        r = client.get("admin/users/import/task-id")
+    assert r.status_code == 200
+    assert r.json()["state"] == "PROGRESS"
+    assert (r.json()["processed"], r.json()["created"]) == (1000, 990)
+
+
+def test_disable_users(db, client: TestClient, admin):
+    users = UserFactory.create_batch(2)
+    r = client.patch(
+        "admin/users",
+        json={"emails": [user.email for user in users], "disabled": True},
+    )
+    assert r.status_code == 200
+    assert sorted(r.json()["updated"]) == sorted(user.email for user in users)
+    assert get_user_by_email(db, users[0].email).disabled is True
+
+
+def test_authorize_with_token_claims(db, client: TestClient):
+    admin = UserFactory.create(permissions=PermissionsType.modify_users.value)
+    app.dependency_overrides.pop(get_current_principal, None)
+    with patch.object(settings, "TOKEN_CLAIMS_ENABLED", True):
+        r = client.post(
+            "users/token/",
+            json={"username": admin.email, "password": "Elektryk1@"},
+        )
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        body = {"emails": [admin.email], "disabled": False}
+
+        r = client.patch("admin/users", json=body, headers=headers)
+        assert r.status_code == 200
+
+        # Disabling the user revokes the token
+        body["disabled"] = True
+        assert (
+            client.patch("admin/users", json=body, headers=headers).status_code == 200
+        )
+        r = client.patch("admin/users", json=body, headers=headers)
+        assert r.status_code == 401
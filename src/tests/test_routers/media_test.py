@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from leaf.config.config import get_settings
+from leaf.main import app
+from leaf.media import IMMUTABLE_CACHE_CONTROL, get_image_resource_key
+from leaf.storage import LocalStorageBackend, get_storage
+
+settings = get_settings()
+
+DIGEST = "ab" + "0" * 62
+
+
+@pytest.fixture
+def media_folder(tmp_path):
+    app.dependency_overrides[get_storage] = lambda: LocalStorageBackend(tmp_path)
+    image = Image.effect_noise((854, 480), 40).convert("RGB")
+    (tmp_path / "1").mkdir()
+    image.save(tmp_path / "1" / "480_user_image.jpg", quality=95)
+    image.save(tmp_path / "1" / "480_user_image.webp", quality=50)
+    images = (tmp_path / get_image_resource_key(DIGEST, "jpg")).parent
+    images.mkdir(parents=True)
+    image.save(images / f"480_{DIGEST}.jpg", quality=95)
+    yield tmp_path
+    del app.dependency_overrides[get_storage]
+
+
+def test_media_resource_in_original_format(client: TestClient, media_folder):
+    r = client.get(f"{settings.MEDIA_BASE_URL}/1/480_user_image.jpg")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/jpeg"
+    assert r.headers["vary"] == "Accept"
+
+
+def test_media_resource_negotiates_smaller_format(
+    client: TestClient,
+    media_folder,
+):
+    r = client.get(
+        f"{settings.MEDIA_BASE_URL}/1/480_user_image.jpg",
+        headers={"Accept": "image/avif,image/webp,image/*,*/*;q=0.8"},
+    )
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/webp"
+
+
+def test_media_resource_outside_media_folder(client: TestClient, media_folder):
+    r = client.get(f"{settings.MEDIA_BASE_URL}/1/%2e%2e/%2e%2e/etc/passwd")
+    assert r.status_code == 404
+
+
+def test_content_addressed_media_resource_is_immutable(
+    client: TestClient,
+    media_folder,
+):
+    r = client.get(f"{settings.MEDIA_BASE_URL}/images/ab/480_{DIGEST}.jpg")
+    assert r.status_code == 200
+    assert r.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert r.headers["etag"] == f'"480_{DIGEST}.jpg"'
+
+    r = client.get(
+        f"{settings.MEDIA_BASE_URL}/images/ab/480_{DIGEST}.jpg",
+        headers={"If-None-Match": r.headers["etag"]},
+    )
+    assert r.status_code == 304
+    assert r.content == b""
+
+
+def test_legacy_media_resource_is_not_immutable(client: TestClient, media_folder):
+    r = client.get(f"{settings.MEDIA_BASE_URL}/1/480_user_image.jpg")
+    assert r.status_code == 200
+    assert "immutable" not in r.headers.get("cache-control", "")
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from tests.common import force_authenticate
+from tests.factories.posts import LikeFactory, PostFactory
+from tests.factories.users import GroupFactory, UserFactory
+
+
+def test_get_feed(db, client: TestClient):
+    user = UserFactory.create()
+    force_authenticate(db, user)
+    first, second = PostFactory.create_batch(2)
+    LikeFactory.create(post=first, user=user)
+
+    r = client.get("posts", params={"limit": 1})
+    assert r.status_code == 200
+    assert [post["id"] for post in r.json()["items"]] == [second.id]
+
+    r = client.get("posts", params={"limit": 1, "cursor": r.json()["next_cursor"]})
+    assert r.status_code == 200
+    post = r.json()["items"][0]
+    assert post["id"] == first.id
+    assert post["like_count"] == 1
+    assert post["liked_by_me"] is True
+
+
+def test_get_feed_with_invalid_cursor(db, client: TestClient):
+    force_authenticate(db, UserFactory.create())
+    r = client.get("posts", params={"cursor": "invalid"})
+    assert r.status_code == 422
+    assert r.json() == {"detail": "Invalid cursor"}
+
+
+def test_get_home_feed(db, client: TestClient):
+    user, friend, stranger = UserFactory.create_batch(3)
+    force_authenticate(db, user)
+    GroupFactory.create(members=[user, friend])
+    own_post = PostFactory.create(user=user)
+    friend_post = PostFactory.create(user=friend)
+    PostFactory.create(user=stranger)
+
+    r = client.get("posts/home")
+    assert r.status_code == 200
+    assert [post["id"] for post in r.json()["items"]] == [friend_post.id, own_post.id]
+    assert r.json()["next_cursor"] is None
+
+
+def test_like_post_twice(db, client: TestClient):
+    force_authenticate(db, UserFactory.create())
+    post = PostFactory.create()
+
+    for _ in range(2):
+        r = client.put(f"posts/{post.id}/like")
+        assert r.status_code == 200
+        assert r.json() == {"post_id": post.id, "liked": True, "like_count": 1}
+
+    for _ in range(2):
+        r = client.delete(f"posts/{post.id}/like")
+        assert r.status_code == 200
+        assert r.json() == {"post_id": post.id, "liked": False, "like_count": 0}
+
+
+def test_like_missing_post(db, client: TestClient):
+    force_authenticate(db, UserFactory.create())
+    r = client.put(f"posts/{2**31 - 1}/like")
+    assert r.status_code == 404
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from leaf.cache import get_cached_tile
+from leaf.models import Threat
+from leaf.routers.threats import VECTOR_TILE_MEDIA_TYPE
+from leaf.tiles import tile_containing
+from tests.common import force_authenticate
+from tests.factories.threats import ThreatCategoryFactory, ThreatFactory
+from tests.factories.users import UserFactory
+
+
+def test_get_threats_in_bbox(db, client: TestClient):
+    force_authenticate(db, UserFactory.create())
+    threat = ThreatFactory.create(longitude=10, latitude=20)
+    r = client.get(
+        "threats",
+        params={
+            "min_longitude": 9.9,
+            "min_latitude": 19.9,
+            "max_longitude": 10.1,
+            "max_latitude": 20.1,
+            "category_id": threat.category_id,
+        },
+    )
+    assert r.status_code == 200
+    assert r.json() == {
+        "items": [
+            {
+                "id": threat.id,
+                "category_id": threat.category_id,
+                "longitude": 10,
+                "latitude": 20,
+            },
+        ],
+        "next_cursor": None,
+    }
+
+
+def test_get_threats_in_invalid_bbox(db, client: TestClient):
+    force_authenticate(db, UserFactory.create())
+    r = client.get(
+        "threats",
+        params={
+            "min_longitude": 10,
+            "min_latitude": 20,
+            "max_longitude": 9,
+            "max_latitude": 21,
+        },
+    )
+    assert r.status_code == 422
+
+
+def test_get_threats_nearby_next_page(db, client: TestClient):
+    force_authenticate(db, UserFactory.create())
+    category = ThreatCategoryFactory.create()
+    first, second = ThreatFactory.create_batch(2, category=category)
+    params = {
+        "longitude": 21.0122,
+        "latitude": 52.2297,
+        "radius": 10,
+        "category_id": category.id,
+        "limit": 1,
+    }
+    r = client.get("threats/nearby", params=params)
+    assert r.status_code == 200
+    assert [threat["id"] for threat in r.json()["items"]] == [first.id]
+    assert r.json()["next_cursor"] == first.id
+
+    r = client.get("threats/nearby", params={**params, "after": first.id})
+    assert [threat["id"] for threat in r.json()["items"]] == [second.id]
+    assert r.json()["next_cursor"] is None
+
+
+def test_get_threats_nearby_radius_limit(db, client: TestClient):
+    force_authenticate(db, UserFactory.create())
+    r = client.get(
+        "threats/nearby",
+        params={"longitude": 21, "latitude": 52, "radius": 1_000_000},
+    )
+    assert r.status_code == 422
+
+
+def test_get_threat_tile_invalidated_by_new_threat(db, client: TestClient):
+    force_authenticate(db, UserFactory.create())
+    x, y = tile_containing(10.5, 20.5, 15)
+    r = client.get(f"threats/tiles/15/{x}/{y}")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == VECTOR_TILE_MEDIA_TYPE
+    assert get_cached_tile(15, x, y) == r.content
+
+    ThreatFactory.create(longitude=10.5, latitude=20.5)
+    assert get_cached_tile(15, x, y) is None
+    new_r = client.get(f"threats/tiles/15/{x}/{y}")
+    assert new_r.content != r.content
+
+
+def test_tile_of_moved_threat_invalidated_after_commit(db, client: TestClient):
+    force_authenticate(db, UserFactory.create())
+    threat = ThreatFactory.create(longitude=11.5, latitude=21.5)
+    x, y = tile_containing(11.5, 21.5, 15)
+    r = client.get(f"threats/tiles/15/{x}/{y}")
+    assert get_cached_tile(15, x, y) == r.content
+
+    db.get(Threat, threat.id).location = "POINT(12.5 22.5)"
+    db.flush()
+    # Another request could still read the old tile and cache it again
+    assert get_cached_tile(15, x, y) == r.content
+    db.commit()
+    assert get_cached_tile(15, x, y) is None
+
+
+def test_get_threat_tile_out_of_range(db, client: TestClient):
+    force_authenticate(db, UserFactory.create())
+    r = client.get("threats/tiles/2/4/0")
+    assert r.status_code == 404
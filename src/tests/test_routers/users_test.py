@@ -8,12 +8,14 @@ from sqlalchemy.orm import Session
 from leaf.auth import (
     confirm_token,
     generate_confirmation_token,
+    get_current_user,
     verify_password,
     verify_token,
 )
 from leaf.config.config import get_settings
+from leaf.main import app
 from leaf.models import User
-from leaf.repositories.users import get_user_by_email
+from leaf.repositories.users import get_user_by_email, update_one
 from tests.common import force_authenticate
 from tests.factories.users import UserFactory
 
@@ -168,3 +170,89 @@ def test_fetch_current_user(db, client):
     r = client.get("users/me")
     assert r.status_code == 200
     assert r.json() == schema.dict()
+
+
+def login(client: TestClient, user: User) -> dict:
+    r = client.post(
+        "users/token/",
+        json={"username": user.email, "password": "Elektryk1@"},
+    )
+    assert r.status_code == 200
+    return r.json()
+
+
+def test_refresh_access_token(client: TestClient):
+    user = UserFactory.create()
+    tokens = login(client, user)
+
+    r = client.post(
+        "users/token/refresh",
+        json={"refresh_token": tokens["refresh_token"]},
+    )
+    assert r.status_code == 200
+    assert r.json()["refresh_token"] != tokens["refresh_token"]
+    assert (
+        verify_token(
+            r.json()["access_token"],
+            secret_key=settings.SECRET_KEY,
+            algorithm=settings.ALGORITHM,
+        )
+        == user.email
+    )
+
+
+def test_reused_refresh_token_revokes_session(client: TestClient):
+    app.dependency_overrides.pop(get_current_user, None)
+    user = UserFactory.create()
+    tokens = login(client, user)
+    refreshed = client.post(
+        "users/token/refresh",
+        json={"refresh_token": tokens["refresh_token"]},
+    ).json()
+
+    r = client.post(
+        "users/token/refresh",
+        json={"refresh_token": tokens["refresh_token"]},
+    )
+    assert r.status_code == 401
+    # Tokens of the thief and of the user stop working
+    r = client.post(
+        "users/token/refresh",
+        json={"refresh_token": refreshed["refresh_token"]},
+    )
+    assert r.status_code == 401
+    r = client.get(
+        "users/me",
+        headers={"Authorization": f"Bearer {refreshed['access_token']}"},
+    )
+    assert r.status_code == 401
+
+
+def test_refresh_token_of_disabled_user(db: Session, client: TestClient):
+    user = UserFactory.create()
+    tokens = login(client, user)
+    update_one(db, user.email, disabled=True)
+
+    r = client.post(
+        "users/token/refresh",
+        json={"refresh_token": tokens["refresh_token"]},
+    )
+    assert r.status_code == 401
+
+
+def test_logout(client: TestClient):
+    app.dependency_overrides.pop(get_current_user, None)
+    user = UserFactory.create()
+    tokens = login(client, user)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("users/me", headers=headers).status_code == 200
+
+    r = client.post("users/logout", json={"refresh_token": tokens["refresh_token"]})
+
+    assert r.status_code == 204
+    assert client.get("users/me", headers=headers).status_code == 401
+    r = client.post(
+        "users/token/refresh",
+        json={"refresh_token": tokens["refresh_token"]},
+    )
+    assert r.status_code == 401
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from io import BytesIO
+from urllib.parse import urlparse
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from leaf.storage import LocalStorageBackend, S3StorageBackend, StorageBackend
+
+BUCKET = "leaf-media"
+# S3 requires every part but the last one to have at least 5 MiB
+PART_SIZE = 5 * 1024 * 1024
+
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture(params=["local", "s3"])
+def storage(request, tmp_path) -> StorageBackend:
+    if request.param == "local":
+        return LocalStorageBackend(tmp_path)
+    return S3StorageBackend(
+        request.getfixturevalue("s3_client"),
+        bucket=BUCKET,
+        part_size=PART_SIZE,
+    )
+
+
+def write_chunks(storage: StorageBackend, key: str, chunks: list[bytes]) -> None:
+    writer = storage.open_writer(key)
+    for chunk in chunks:
+        writer.write(chunk)
+    writer.commit()
+
+
+def test_saved_object_can_be_read(storage):
+    storage.save("images/ab/480_ab.jpg", BytesIO(b"image"))
+
+    with storage.open("images/ab/480_ab.jpg") as file:
+        assert file.read() == b"image"
+    stored = storage.stat("images/ab/480_ab.jpg")
+    assert stored.key == "images/ab/480_ab.jpg"
+    assert stored.size == 5
+
+
+def test_missing_object(storage):
+    assert storage.stat("images/missing.jpg") is None
+    with pytest.raises(FileNotFoundError):
+        storage.open("images/missing.jpg")
+    with pytest.raises(FileNotFoundError):
+        storage.touch("images/missing.jpg")
+
+
+def test_object_is_invisible_until_commit(storage):
+    writer = storage.open_writer("uploads/1")
+    writer.write(b"image")
+    assert storage.stat("uploads/1") is None
+    writer.abort()
+    assert storage.stat("uploads/1") is None
+    assert list(storage.list("uploads/")) == []
+
+
+def test_list_move_and_delete(storage):
+    write_chunks(storage, "uploads/1", [b"image"])
+    write_chunks(storage, "images/ab/ab.jpg", [b"image"])
+
+    storage.move("uploads/1", "images/cd/cd.jpg")
+
+    assert [stored.key for stored in storage.list("images/")] == [
+        "images/ab/ab.jpg",
+        "images/cd/cd.jpg",
+    ]
+    assert list(storage.list("uploads/")) == []
+    storage.delete(["images/ab/ab.jpg", "images/cd/cd.jpg"])
+    assert list(storage.list("images/")) == []
+
+
+@pytest.mark.parametrize("key", ["", "/etc/passwd", "images/../../etc/passwd"])
+def test_keys_outside_of_storage_are_rejected(storage, key):
+    with pytest.raises(ValueError):
+        storage.open_writer(key)
+
+
+def test_s3_large_object_is_uploaded_in_parts(s3_client):
+    storage = S3StorageBackend(s3_client, bucket=BUCKET, part_size=PART_SIZE)
+    chunk = b"x" * (1024 * 1024)
+    writer = storage.open_writer("uploads/1")
+    for _ in range(12):
+        writer.write(chunk)
+    writer.commit()
+
+    assert [part["PartNumber"] for part in writer.parts] == [1, 2, 3]
+    assert storage.stat("uploads/1").size == 12 * len(chunk)
+    assert s3_client.list_multipart_uploads(Bucket=BUCKET).get("Uploads") is None
+
+
+def test_s3_aborted_multipart_upload_is_removed(s3_client):
+    storage = S3StorageBackend(s3_client, bucket=BUCKET, part_size=PART_SIZE)
+    writer = storage.open_writer("uploads/1")
+    writer.write(b"x" * PART_SIZE)
+    writer.abort()
+
+    assert storage.stat("uploads/1") is None
+    assert s3_client.list_multipart_uploads(Bucket=BUCKET).get("Uploads") is None
+
+
+def test_s3_presigned_url(s3_client):
+    storage = S3StorageBackend(s3_client, bucket=BUCKET)
+    url = urlparse(storage.presigned_url("images/ab/480_ab.jpg", expires_in=60))
+    assert url.path.endswith("/images/ab/480_ab.jpg")
+    assert "Expires=" in url.query or "X-Amz-Expires=60" in url.query
+
+
+def test_local_backend_has_no_presigned_url(tmp_path):
+    storage = LocalStorageBackend(tmp_path)
+    assert storage.presigned_url("images/ab/480_ab.jpg", expires_in=60) is None
+    assert (
+        storage.local_path("images/ab/480_ab.jpg") == tmp_path / "images/ab/480_ab.jpg"
+    )
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import fakeredis
+import pytest
+
+from leaf import tasks
+from leaf.mail import MailOutbox, set_mail_outbox
+from leaf.tasks import deliver_mail
+
+
+class FakeDispatcher:
+    def __init__(self, postponed_recipients=()):
+        self.batches = []
+        self.postponed_recipients = set(postponed_recipients)
+
+    def send(self, mails):
+        self.batches.append(mails)
+        return [mail for mail in mails if mail[0] in self.postponed_recipients]
+
+
+@pytest.fixture
+def outbox():
+    outbox = MailOutbox(fakeredis.FakeRedis())
+    set_mail_outbox(outbox)
+    yield outbox
+    set_mail_outbox(None)
+
+
+def confirmation_email(to: str) -> tuple:
+    return to, "confirmation", {"confirmation_token": "token"}
+
+
+def test_deliver_mail_renders_and_sends_queued_emails_as_batch(
+    monkeypatch,
+    outbox,
+):
+    dispatcher = FakeDispatcher()
+    monkeypatch.setattr(tasks, "get_mail_dispatcher", lambda: dispatcher)
+    outbox.push([confirmation_email(f"user{i}@leaf.com") for i in range(3)])
+
+    assert deliver_mail() == 3
+    assert len(dispatcher.batches) == 1
+    assert [to for to, _ in dispatcher.batches[0]] == [
+        f"user{i}@leaf.com" for i in range(3)
+    ]
+    assert "Subject: Leaf account - email confirmation" in dispatcher.batches[0][0][1]
+    assert deliver_mail() == 0
+
+
+def test_deliver_mail_requeues_postponed_emails(monkeypatch, outbox):
+    dispatcher = FakeDispatcher(postponed_recipients=["user1@leaf.com"])
+    monkeypatch.setattr(tasks, "get_mail_dispatcher", lambda: dispatcher)
+    scheduled = []
+    monkeypatch.setattr(
+        deliver_mail,
+        "apply_async",
+        lambda **kwargs: scheduled.append(kwargs),
+    )
+    outbox.push(
+        [confirmation_email("user0@leaf.com"), confirmation_email("user1@leaf.com")],
+    )
+
+    assert deliver_mail() == 1
+    assert outbox.pop(10) == [(*confirmation_email("user1@leaf.com"), 1)]
+    assert len(scheduled) == 1
+
+
+def test_deliver_mail_drops_emails_after_max_retries(monkeypatch, outbox):
+    dispatcher = FakeDispatcher(postponed_recipients=["user0@leaf.com"])
+    monkeypatch.setattr(tasks, "get_mail_dispatcher", lambda: dispatcher)
+    monkeypatch.setattr(tasks.get_settings(), "MAIL_MAX_RETRIES", 2)
+    scheduled = []
+    monkeypatch.setattr(
+        deliver_mail,
+        "apply_async",
+        lambda **kwargs: scheduled.append(kwargs["countdown"]),
+    )
+    outbox.push([confirmation_email("user0@leaf.com")])
+
+    for _ in range(3):
+        assert deliver_mail() == 0
+    assert len(dispatcher.batches) == 3
+    assert len(outbox) == 0
+    # Backoff grows with the number of failed deliveries, the last failure
+    # isn't retried
+    assert len(scheduled) == 2
+    assert scheduled[1] == 2 * scheduled[0]
+
+
+def test_deliver_mail_skips_unknown_templates(monkeypatch, outbox):
+    dispatcher = FakeDispatcher()
+    monkeypatch.setattr(tasks, "get_mail_dispatcher", lambda: dispatcher)
+    outbox.push(
+        [("user0@leaf.com", "missing", {}), confirmation_email("user1@leaf.com")],
+    )
+
+    assert deliver_mail() == 1
+    assert [to for to, _ in dispatcher.batches[0]] == ["user1@leaf.com"]
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import fakeredis
+from kombu.exceptions import OperationalError
+from sqlalchemy import event
+
+from leaf import tasks
+from leaf.config.config import get_settings
+from leaf.tasks import fan_out_post
+from leaf.timeline import TimelineStore
+from tests.database_test import TestingSessionLocal
+from tests.factories.common import FactoriesSession
+from tests.factories.posts import PostFactory
+from tests.factories.users import GroupFactory, UserFactory
+
+
+def test_fan_out_post(db):
+    author, member = UserFactory.create_batch(2)
+    GroupFactory.create(members=[author, member])
+    post = PostFactory.create(user=author)
+    timeline = TimelineStore(fakeredis.FakeRedis(), max_length=10)
+
+    with patch("leaf.tasks.SessionLocal", TestingSessionLocal), patch(
+        "leaf.tasks.get_timeline_store",
+        lambda: timeline,
+    ):
+        assert fan_out_post(post.id) == 2
+        assert fan_out_post(2**31 - 1) == 0
+
+    assert [entry[0] for entry in timeline.range(member.id, None, 10)] == [post.id]
+
+
+def test_fan_out_post_disabled(db):
+    post = PostFactory.create()
+    with patch("leaf.tasks.get_timeline_store", lambda: None):
+        assert fan_out_post(post.id) == 0
+
+
+def test_new_posts_are_fanned_out_after_commit(db, monkeypatch):
+    monkeypatch.setattr(get_settings(), "TIMELINE_FANOUT_ENABLED", True)
+    user = UserFactory.create()
+    session = FactoriesSession()
+    # Sessions which don't insert posts get no commit listener
+    assert not event.contains(session, "after_commit", tasks._fan_out_new_posts)
+
+    with patch.object(
+        fan_out_post,
+        "delay",
+        side_effect=OperationalError("broker down"),
+    ) as delay:
+        post = PostFactory.create(user=user)
+
+    # Broker errors don't fail the commit
+    delay.assert_called_once_with(post.id)
+    assert event.contains(session, "after_commit", tasks._fan_out_new_posts)
+    assert "new_post_ids" not in session.info
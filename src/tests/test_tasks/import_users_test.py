@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import billiard
+import orjson
+import pytest
+
+from leaf.auth import verify_password
+from leaf.config.config import get_settings
+from leaf.models import User
+from leaf.repositories.users import get_user_by_email
+from leaf.storage import LocalStorageBackend, set_storage_backend
+from leaf.tasks import import_users
+from tests.database_test import TestingSessionLocal, engine
+from tests.factories.users import UserFactory
+
+settings = get_settings()
+
+
+@pytest.fixture
+def storage(tmp_path):
+    set_storage_backend(LocalStorageBackend(tmp_path))
+    yield tmp_path
+    set_storage_backend(None)
+
+
+def test_import_users(db, storage):
+    existing = UserFactory.create()
+    rows = [
+        {
+            "email": f"volunteer{i}@leaf.com",
+            "password": "Elektryk1@",
+            "first_name": "Leaf",
+            "last_name": "Volunteer",
+        }
+        for i in range(3)
+    ]
+    rows.append({**rows[0], "email": existing.email})
+    rows.append({"email": "incomplete@leaf.com"})
+    (storage / "imports").mkdir()
+    (storage / "imports" / "users").write_bytes(
+        b"\n".join(orjson.dumps(row) for row in rows),
+    )
+
+    with patch("leaf.tasks.SessionLocal", TestingSessionLocal), patch.object(
+        settings,
+        "USER_IMPORT_BATCH_SIZE",
+        2,
+    ), patch("leaf.tasks.queue_emails") as queue_emails:
+        stats = import_users("imports/users", "ndjson")
+
+    assert stats["processed"] == 5
+    assert (stats["created"], stats["skipped"], stats["invalid"]) == (3, 1, 1)
+    assert stats["errors"][0]["line"] == 5
+    # One call per batch with users created by it
+    queued = [email for call in queue_emails.call_args_list for email in call.args[0]]
+    assert sorted(to for to, _, _ in queued) == [row["email"] for row in rows[:3]]
+    user = db.get(User, get_user_by_email(db, rows[0]["email"]).id)
+    assert user.disabled is True
+    assert verify_password("Elektryk1@", user.hashed_password)
+    assert not (storage / "imports" / "users").exists()
+
+
+def reset_engine():
+    # Connections of the test engine belong to the parent process
+    engine.dispose(close=False)
+
+
+def test_import_users_in_prefork_worker(db, storage):
+    """Children of the prefork pool are daemonic, like the ones of billiard"""
+    rows = [
+        {
+            "email": f"prefork{i}@leaf.com",
+            "password": "Elektryk1@",
+            "first_name": "Leaf",
+            "last_name": "Volunteer",
+        }
+        for i in range(3)
+    ]
+    (storage / "imports").mkdir()
+    (storage / "imports" / "users").write_bytes(
+        b"\n".join(orjson.dumps(row) for row in rows),
+    )
+
+    with patch("leaf.tasks.SessionLocal", TestingSessionLocal), patch(
+        "leaf.tasks.queue_emails",
+    ), billiard.Pool(1, initializer=reset_engine) as pool:
+        stats = pool.apply(import_users, ("imports/users", "ndjson"))
+
+    assert stats["created"] == 3
+    assert get_user_by_email(db, rows[0]["email"]) is not None
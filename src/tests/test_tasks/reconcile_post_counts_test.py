@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+
+from sqlalchemy import select, update
+
+from leaf.models import Post
+from leaf.tasks import reconcile_post_counts
+from tests.database_test import TestingSessionLocal
+from tests.factories.posts import LikeFactory, PostFactory
+
+
+def test_reconcile_post_counts(db):
+    posts = PostFactory.create_batch(3)
+    LikeFactory.create_batch(2, post=posts[0])
+    db.execute(
+        update(Post).where(Post.id == posts[0].id).values(like_count=0),
+    )
+    db.commit()
+
+    with patch("leaf.tasks.SessionLocal", TestingSessionLocal):
+        # Small batches, so posts are spread over several of them
+        assert reconcile_post_counts(batch_size=2) >= 1
+
+    assert db.scalar(select(Post.like_count).where(Post.id == posts[0].id)) == 2
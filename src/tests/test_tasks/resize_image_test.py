@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import pytest
+from PIL import Image
+
+from leaf import tasks
+from leaf.storage import LocalStorageBackend, set_storage_backend
+from leaf.tasks import resize_image
+
+IMAGE_SIZES = [["854", "480"], ["1920", "1080"], ["1280", "720"]]
+
+
+@pytest.fixture(autouse=True)
+def storage(tmp_path):
+    set_storage_backend(LocalStorageBackend(tmp_path))
+    yield
+    set_storage_backend(None)
+
+
+@pytest.mark.parametrize("extension", ["jpg", "png"])
+def test_resize_image_creates_all_sizes(tmp_path, extension):
+    path = tmp_path / f"user_image.{extension}"
+    Image.new("RGB", (4000, 3000), color="green").save(path)
+
+    resize_image(path.name, IMAGE_SIZES)
+
+    assert not path.exists()
+    for width, height in IMAGE_SIZES:
+        with Image.open(tmp_path / f"{height}_user_image.{extension}") as image:
+            assert image.height == int(height)
+            assert image.width <= int(width)
+
+
+def test_resize_image_creates_format_variants(tmp_path):
+    path = tmp_path / "user_image.jpg"
+    Image.new("RGB", (4000, 3000), color="green").save(path)
+
+    resize_image(path.name, IMAGE_SIZES, ["webp"])
+
+    for _, height in IMAGE_SIZES:
+        assert (tmp_path / f"{height}_user_image.jpg").exists()
+        with Image.open(tmp_path / f"{height}_user_image.webp") as image:
+            assert image.format == "WEBP"
+
+
+def test_resize_image_converts_palette_images_for_variants(tmp_path):
+    path = tmp_path / "user_image.png"
+    Image.new("P", (4000, 3000)).save(path)
+
+    resize_image(path.name, IMAGE_SIZES, ["webp"])
+
+    for _, height in IMAGE_SIZES:
+        with Image.open(tmp_path / f"{height}_user_image.png") as image:
+            assert image.mode == "P"
+        assert (tmp_path / f"{height}_user_image.webp").exists()
+
+
+def test_resize_image_skips_failed_variants(monkeypatch, tmp_path):
+    path = tmp_path / "user_image.jpg"
+    Image.new("RGB", (4000, 3000), color="green").save(path)
+    save_image = tasks.save_image
+
+    def failing_save_image(storage, image, key, image_format):
+        if image_format == "WEBP":
+            raise OSError("encoder error")
+        save_image(storage, image, key, image_format)
+
+    monkeypatch.setattr(tasks, "save_image", failing_save_image)
+
+    resize_image(path.name, IMAGE_SIZES, ["webp"])
+
+    assert not path.exists()
+    for _, height in IMAGE_SIZES:
+        assert (tmp_path / f"{height}_user_image.jpg").exists()
+        assert not (tmp_path / f"{height}_user_image.webp").exists()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+import fakeredis
+import pytest
+from fakeredis import aioredis
+
+from leaf.timeline import TimelineStore, timeline_score
+
+
+@pytest.fixture
+def store():
+    return TimelineStore(fakeredis.FakeRedis(), max_length=3)
+
+
+def test_timeline_score():
+    created_at = datetime(2023, 7, 2, 14, 1, 28, 538715)
+    assert timeline_score(created_at) == 1688306488538715
+    assert timeline_score(created_at.replace(tzinfo=timezone.utc)) == 1688306488538715
+
+
+def test_add_to_timelines(store):
+    assert store.add(1, 100, [10, 11]) == 2
+    assert store.range(10, None, 10) == [(1, 100)]
+    assert store.range(11, None, 10) == [(1, 100)]
+    assert store.exists(10)
+    assert not store.exists(12)
+
+
+def test_timeline_trimmed_to_newest_posts(store):
+    for post_id in range(1, 6):
+        store.add(post_id, post_id * 100, [10])
+    assert store.range(10, None, 10) == [(5, 500), (4, 400), (3, 300)]
+
+
+def test_timeline_range_before_entry(store):
+    store.max_length = 10
+    store.add(1, 100, [10])
+    # Posts created at the same time are ordered by id
+    store.add(2, 200, [10])
+    store.add(12, 200, [10])
+    store.add(3, 300, [10])
+
+    assert store.range(10, None, 2) == [(3, 300), (12, 200)]
+    assert store.range(10, (12, 200), 2) == [(2, 200), (1, 100)]
+    assert store.range(10, (2, 200), 2) == [(1, 100)]
+    assert store.range(10, (1, 100), 2) == []
+
+
+def test_add_to_many_timelines(store):
+    store.PIPELINE_SIZE = 3
+    assert store.add(1, 100, range(10)) == 10
+    assert all(store.exists(user_id) for user_id in range(10))
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("with_async_client", [True, False])
+async def test_timeline_range_async(with_async_client):
+    server = fakeredis.FakeServer()
+    store = TimelineStore(
+        fakeredis.FakeRedis(server=server),
+        max_length=10,
+        async_client=aioredis.FakeRedis(server=server) if with_async_client else None,
+    )
+    store.add(1, 100, [10])
+    store.add(2, 200, [10])
+    store.add(12, 200, [10])
+
+    assert await store.range_async(10, None, 2) == [(12, 200), (2, 200)]
+    assert await store.range_async(10, (12, 200), 2) == [(2, 200), (1, 100)]
+    assert await store.range_async(11, None, 2) == []
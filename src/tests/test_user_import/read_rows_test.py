@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from io import BytesIO
+
+import pytest
+
+from leaf.user_import import read_user_rows
+
+USER = {
+    "email": "volunteer@leaf.com",
+    "password": "Elektryk1@",
+    "first_name": "Leaf",
+    "last_name": "Volunteer",
+}
+
+
+def test_read_csv_rows():
+    file = BytesIO(
+        "\ufeffemail,password,first_name,last_name\r\n"
+        "volunteer@leaf.com,Elektryk1@,Leaf,Volunteer\r\n"
+        'other@leaf.com,"with,comma",Other,"Multi\nline"\r\n'.encode(),
+    )
+    rows = list(read_user_rows(file, "csv"))
+    assert rows[0] == (2, USER)
+    assert rows[1][1]["password"] == "with,comma"
+    assert rows[1][1]["last_name"] == "Multi\nline"
+
+
+def test_read_ndjson_rows():
+    file = BytesIO(
+        b'{"email": "volunteer@leaf.com", "password": "Elektryk1@", '
+        b'"first_name": "Leaf", "last_name": "Volunteer"}\n'
+        b"\n"
+        b"not json\n",
+    )
+    assert list(read_user_rows(file, "ndjson")) == [(1, USER), (3, None)]
+
+
+def test_read_rows_in_unknown_format():
+    with pytest.raises(ValueError):
+        list(read_user_rows(BytesIO(b""), "xml"))